@@ -2,20 +2,31 @@ import os
 import sys
 import time
 import logging
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-from yt_dlp import YoutubeDL
-from mutagen.mp3 import MP3
-from mutagen.id3 import ID3, TIT2, TPE1, TALB, TCON, TRCK, TDRC, APIC
-import requests
-from urllib.parse import quote
+import logging.handlers
+import atexit
+# spotipy, yt_dlp, mutagen, requests y browser_cookie3 se importan dentro de
+# las funciones que los usan para que el arranque sea rápido
+from urllib.parse import quote, urlparse
 import json
 from datetime import datetime
 import re
 import getpass
-import browser_cookie3
+import shutil
+import argparse
 import tempfile
 import subprocess
+import threading
+import queue
+import sqlite3
+import unicodedata
+import hashlib
+import copy
+import contextlib
+import base64
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+import itertools
+import difflib
 
 # Configuración
 SPOTIFY_CLIENT_ID = 'XXXX'
@@ -25,34 +36,543 @@ SPOTIFY_USERNAME = 'XXX'
 
 # Configuración para cookies de YouTube
 YT_COOKIES_FILE = 'youtube_cookies.txt'
+# Resultado de la última verificación de cookies (evita una petición a YouTube en cada arranque)
+YT_COOKIES_CHECK_FILE = '.youtube_cookies_check.json'
+YT_COOKIES_CHECK_MAX_AGE = 24 * 3600  # Revalidar al menos una vez al día
 
 # Scope necesario para acceder a playlists privadas
 SCOPE = 'playlist-read-private'
 
-# Configurar logging
-def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('spotify_downloader.log'),
-            logging.StreamHandler(sys.stdout)
+# Paginación de playlists en Spotify
+SPOTIFY_PAGE_SIZE = 100        # Máximo permitido por la API
+SPOTIFY_PAGE_WORKERS = 4       # Páginas pedidas en paralelo
+SPOTIFY_MAX_RETRIES = 5        # Reintentos ante HTTP 429 (respetando Retry-After)
+# Solo los campos que usa download_playlist (evita available_markets y demás)
+PLAYLIST_FIELDS = 'id,name,description,snapshot_id,tracks.total'
+PLAYLIST_TRACK_FIELDS = (
+    'items(track(id,name,duration_ms,track_number,external_ids(isrc),'
+    'artists(id,name),album(id,name,release_date,images(url))))'
+)
+SPOTIFY_ALBUMS_BATCH = 20      # IDs por llamada a sp.albums (máximo de la API)
+SPOTIFY_ARTISTS_BATCH = 50     # IDs por llamada a sp.artists (máximo de la API)
+
+# Formato de salida: 'mp3' (se codifica a MP3 una sola vez) u 'original'
+# (se conserva el códec de origen, m4a/opus, copiando el stream sin recodificar)
+OUTPUT_FORMAT = 'mp3'
+
+# Extensión del contenedor para cada códec en modo 'original'
+PASSTHROUGH_EXTENSIONS = {
+    'aac': '.m4a',
+    'alac': '.m4a',
+    'opus': '.opus',
+    'vorbis': '.ogg',
+    'mp3': '.mp3',
+    'flac': '.flac',
+}
+
+# Planificador de conversiones FFmpeg: un proceso por núcleo disponible
+try:
+    TRANSCODE_PROCESSES = len(os.sched_getaffinity(0))
+except AttributeError:
+    TRANSCODE_PROCESSES = os.cpu_count() or 2
+TRANSCODE_QUEUE_SIZE = 32         # Conversiones en espera (bloquea al productor si se llena)
+TRANSCODE_BYTES_PER_SECOND = 16000  # ~128 kbps, para estimar la duración por tamaño
+
+# Descarga en streaming hacia FFmpeg (sin archivo intermedio en disco; tras una
+# interrupción no se retoma: el formato se vuelve a pedir completo)
+STREAM_TRANSCODE = True
+STREAM_CHUNK_SIZE = 10 * 1024 * 1024  # Bytes por petición con Range (YouTube limita las peticiones sin rango)
+STREAM_READ_SIZE = 64 * 1024          # Bytes leídos por cada escritura al stdin de FFmpeg
+STREAM_PROTOCOLS = ('http', 'https')  # Formatos que se pueden leer como un único archivo
+
+# Tags escritos por FFmpeg al codificar (clave de FFmpeg, campo de TrackRecord.tag_fields())
+FFMPEG_TAG_FIELDS = (
+    ('title', 'title'),
+    ('artist', 'artist'),
+    ('album', 'album'),
+    ('genre', 'genre'),
+    ('track', 'track_number'),
+    ('date', 'release_date'),
+)
+# Espacio libre reservado en la cabecera de tags: re-etiquetar reescribe solo la cabecera
+TAG_PADDING = 64 * 1024
+
+# Configuración del modo concurrente (pipeline por etapas)
+# Hilos para búsqueda/descarga/tags (I/O). 'transcode' es el número de procesos
+# FFmpeg del planificador; la etapa usa el doble de hilos (solo esperan
+# conversiones) para que el planificador pueda priorizar
+PIPELINE_WORKERS = {
+    'search': 2,
+    'download': 3,
+    'transcode': TRANSCODE_PROCESSES,
+    'tag': 2,
+}
+PIPELINE_QUEUE_SIZE = 16  # Tamaño máximo de cada cola entre etapas
+
+# Descargas simultáneas ajustadas según el throughput medido (AIMD): se suma
+# una cada intervalo mientras el throughput total crece, se deshace la última
+# si no aporta y se reduce a la mitad ante limitación de YouTube o caída del
+# throughput. PIPELINE_WORKERS['download']
+# es el valor inicial; con workers={'download': n} el número queda fijo
+DOWNLOAD_AUTOTUNE = True
+DOWNLOAD_CONCURRENCY_MIN = 1
+DOWNLOAD_CONCURRENCY_MAX = 8
+DOWNLOAD_TUNE_INTERVAL = 15          # Segundos de medición entre ajustes
+DOWNLOAD_TUNE_MIN_GAIN = 0.10        # Mejora mínima del throughput total para seguir subiendo
+DOWNLOAD_TUNE_DROP = 0.25            # Caída del throughput (total o por descarga) que cuenta como congestión
+DOWNLOAD_TUNE_HOLD = 4               # Ventanas sin subir tras una reducción
+
+# Límite global de ancho de banda de las descargas (bytes/s, None = sin límite)
+BANDWIDTH_LIMIT = None
+BANDWIDTH_LIMIT_HOURS = None         # (inicio, fin) en horas locales, p.ej. (9, 18); None = siempre
+
+# Selección de candidatos en la búsqueda de YouTube
+SEARCH_CANDIDATES = 5          # Resultados evaluados por búsqueda (una sola petición)
+SEARCH_MIN_SCORE = 0.45        # Puntuación mínima (0-1) para aceptar un candidato
+SEARCH_DURATION_TOLERANCE = 30  # Segundos de diferencia con Spotify para puntuación 0
+# Peso de cada criterio en la puntuación final
+SEARCH_SCORE_WEIGHTS = {
+    'duration': 0.5,
+    'channel': 0.2,
+    'title': 0.3,
+}
+# Versiones que no queremos salvo que el título en Spotify las mencione
+SEARCH_UNWANTED_TERMS = ('live', 'en vivo', 'cover', 'karaoke', 'remix', 'sped up', 'slowed', 'instrumental')
+
+# Caché persistente de búsquedas en YouTube
+SEARCH_CACHE_FILE = 'search_cache.db'
+SEARCH_CACHE_TTL = 30 * 24 * 3600          # Resultados positivos: 30 días
+SEARCH_CACHE_NEGATIVE_TTL = 24 * 3600      # "No se encontró video": 1 día
+SEARCH_CACHE_MAX_ENTRIES = 50000           # Límite de entradas (se desalojan por LRU)
+
+# Caché persistente de metadata de álbumes y artistas de Spotify (géneros, lanzamiento)
+METADATA_CACHE_FILE = 'metadata_cache.db'
+METADATA_CACHE_TTL = 30 * 24 * 3600
+METADATA_MAX_GENRES = 3                    # Géneros escritos en el tag (separados por '; ')
+
+# Limitador de peticiones adaptativo: (peticiones por segundo, ráfaga máxima)
+RATE_LIMITS = {
+    'search': (1.0, 2),   # Búsquedas ytsearch
+    'media': (0.5, 2),    # Extracción y descarga de audio
+}
+RATE_LIMIT_MIN_FACTOR = 0.05    # Velocidad mínima tras varios bloqueos (5% de la base)
+RATE_LIMIT_RECOVERY = 0.05      # Recuperación por cada petición exitosa
+RATE_LIMIT_MIN_BACKOFF = 5      # Primera pausa (s) tras detección de bot / HTTP 429
+RATE_LIMIT_MAX_BACKOFF = 300    # Pausa máxima (s); se duplica en cada bloqueo consecutivo
+
+# Mensajes de YouTube que indican que nos están limitando
+THROTTLE_MARKERS = (
+    "not a bot",              # "Sign in to confirm you’re not a bot" (yt-dlp usa apóstrofo tipográfico)
+    "HTTP Error 429",
+    "Too Many Requests",
+    "try again later",        # "Video unavailable. This content isn’t available, try again later"
+    "rate-limited",
+    "rate limited",
+)
+
+# Clases de error de yt-dlp (se comprueban en este orden; sin coincidencia: 'transient')
+ERROR_CLASS_MARKERS = (
+    ('throttled', THROTTLE_MARKERS),
+    ('auth', (
+        "Sign in to confirm your age",
+        "age-restricted",
+        "inappropriate for some users",
+        "only available to registered users",
+        "members-only",
+        "Join this channel",
+        "login required",
+    )),
+    ('permanent', (
+        "Private video",
+        "Video unavailable",
+        "This video is unavailable",
+        "This video is not available",
+        "has been removed",
+        "available in your country",
+        "blocked it in your country",
+        "copyright",
+        "account associated with this video has been terminated",
+        "Unsupported URL",
+        "HTTP Error 404",
+    )),
+)
+# Clases que detienen la cadena de estrategias: ninguna otra va a funcionar
+FATAL_ERROR_CLASSES = ('permanent', 'auth')
+
+# Circuit breaker de la etapa de descarga ante picos de detección de bot
+CIRCUIT_BREAKER_THRESHOLD = 3        # Errores de bot/429 dentro de la ventana para abrir el circuito
+CIRCUIT_BREAKER_WINDOW = 120         # Segundos
+CIRCUIT_BREAKER_COOLDOWN = 300       # Pausa inicial (s); se duplica si la descarga de prueba vuelve a fallar
+CIRCUIT_BREAKER_MAX_COOLDOWN = 1800
+
+# Identidades de YouTube entre las que se reparten búsquedas y descargas:
+# [{'name': 'a', 'cookies_file': 'a.txt', 'proxy': 'socks5://127.0.0.1:1080'}, ...]
+# Vacío = una sola identidad con la autenticación de YouTubeAuthenticator
+YT_IDENTITIES = []
+IDENTITY_HEALTH_URL = 'https://www.youtube.com/watch?v=jNQXAC9IVRw'  # Se pide con las cookies y el proxy de cada identidad
+IDENTITY_HEALTH_TIMEOUT = 20
+IDENTITY_HEALTH_MAX_BYTES = 2 * 1024 * 1024
+IDENTITY_HEALTH_INTERVAL = 600       # Una identidad que falló la comprobación se reintenta tras 10 min
+# Estado de reproducción del video de prueba (LOGIN_REQUIRED = verificación de bot)
+IDENTITY_PLAYABILITY_RE = re.compile(
+    r'"playabilityStatus"\s*:\s*\{\s*"status"\s*:\s*"(?P<status>[A-Z_]+)"'
+    r'(?:\s*,\s*"reason"\s*:\s*"(?P<reason>(?:[^"\\]|\\.)*)")?'
+)
+IDENTITY_COOLDOWN = 120              # Enfriamiento inicial (s) tras una detección de bot; se duplica si se repite
+IDENTITY_MAX_COOLDOWN = 3600
+
+# Estadísticas adaptativas de las estrategias de descarga
+STRATEGY_STATS_FILE = 'strategy_stats.json'
+STRATEGY_STATS_HALF_LIFE = 7 * 24 * 3600   # Los resultados pierden la mitad de peso cada 7 días
+STRATEGY_PRIOR_LATENCY = 30.0              # Latencia supuesta (s) para estrategias sin historial
+
+# Caché de carátulas (disco + memoria)
+COVER_CACHE_DIR = 'cover_cache'
+COVER_CACHE_MAX_BYTES = 200 * 1024 * 1024  # Límite en disco (se desalojan las menos usadas)
+COVER_CACHE_MEMORY_ITEMS = 64              # Carátulas recientes en memoria
+
+# Biblioteca compartida entre playlists (None = desactivada). Cada canción se
+# descarga una vez y se enlaza (hardlink/symlink) en cada playlist
+LIBRARY_DIR = None
+LIBRARY_DB_FILE = 'library.db'
+
+# Manifiesto de sincronización incremental (uno por playlist dentro de output_dir)
+SYNC_MANIFEST_FILE = '.sync_manifest_{playlist_id}.json'
+
+# Journal de avance por canción (permite retomar una ejecución interrumpida)
+JOURNAL_FILE = '.journal_{playlist_id}.jsonl'
+JOURNAL_STAGES = ('searched', 'downloaded', 'converted', 'tagged')
+
+# Métricas de ejecución (reporte JSON y, opcionalmente, archivo de texto de Prometheus)
+METRICS_PREFIX = 'spotify_dl'
+METRICS_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)  # Segundos
+METRICS_BUCKETS = {
+    'strategies_per_track': (1, 2, 3, 4, 5),
+    'stream_bytes_per_second': (64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024),
+}
+RUN_REPORT_FILE = 'run_report_{playlist_id}.json'
+METRICS_PROMETHEUS_FILE = None  # p.ej. '/var/lib/node_exporter/textfile/spotify_dl.prom'
+
+# Logging
+LOG_FILE = 'spotify_downloader.log'
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_ASYNC = True                   # Un hilo aparte escribe los logs: los workers nunca esperan al disco
+LOG_JSON = True                    # Archivo de log en JSON Lines (con track_id y etapa)
+LOG_MAX_BYTES = 10 * 1024 * 1024   # Rotación del archivo de log por tamaño
+LOG_BACKUP_COUNT = 5
+LOG_REPEAT_WINDOW = 60             # Ventana (s) para limitar warnings/errores repetidos
+LOG_REPEAT_LIMIT = 5               # Warnings/errores permitidos por llamada de log y ventana
+LOG_STDERR_TAIL = 1000             # Caracteres finales de stderr de FFmpeg que se registran
+
+# Contexto de log del hilo actual (track y etapa en proceso)
+LOG_CONTEXT = threading.local()
+
+def set_log_context(track_id=None, stage=None):
+    """Asocia los logs siguientes de este hilo a un track y una etapa"""
+    LOG_CONTEXT.track_id = track_id
+    LOG_CONTEXT.stage = stage
+
+def tail_text(text, limit=LOG_STDERR_TAIL):
+    """Últimos caracteres de un texto largo (p.ej. stderr de FFmpeg) para el log"""
+    text = (text or '').strip()
+    return text if len(text) <= limit else '…' + text[-limit:]
+
+class LogContextFilter(logging.Filter):
+    """Añade track_id y stage del hilo que emite el log (antes de pasar a la cola)"""
+    
+    def filter(self, record):
+        record.track_id = getattr(LOG_CONTEXT, 'track_id', None)
+        record.stage = getattr(LOG_CONTEXT, 'stage', None)
+        return True
+
+class RepeatFilter(logging.Filter):
+    """
+    Limita los warnings/errores de una misma llamada de log (archivo y línea)
+    a LOG_REPEAT_LIMIT por ventana: el mismo fallo en canciones distintas
+    cuenta como repetición. El primero que pasa tras la ventana indica
+    cuántos se omitieron
+    """
+    
+    def __init__(self, window=LOG_REPEAT_WINDOW, limit=LOG_REPEAT_LIMIT):
+        super().__init__()
+        self.window = window
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.seen = {}  # (nivel, archivo, línea) -> [inicio de ventana, emitidos, omitidos]
+    
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.levelno, record.pathname, record.lineno)
+        now = time.time()
+        with self.lock:
+            entry = self.seen.get(key)
+            if entry is None or now - entry[0] > self.window:
+                suppressed = entry[2] if entry else 0
+                self.seen[key] = [now, 1, 0]
+                if len(self.seen) > 10000:
+                    self.seen = {k: v for k, v in self.seen.items() if now - v[0] <= self.window}
+                if suppressed:
+                    record.msg = f"{record.getMessage()} ({suppressed} mensajes similares omitidos)"
+                    record.args = None
+                return True
+            if entry[1] < self.limit:
+                entry[1] += 1
+                return True
+            entry[2] += 1
+            return False
+
+class JsonLogFormatter(logging.Formatter):
+    """Un objeto JSON por línea con el contexto del track"""
+    
+    def format(self, record):
+        data = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'thread': record.threadName,
+            'track_id': getattr(record, 'track_id', None),
+            'stage': getattr(record, 'stage', None),
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data['exception'] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+class TracebackQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que conserva la traza de las excepciones. prepare() borra
+    exc_info y exc_text antes de encolar: la traza se formatea aquí, en el
+    hilo que emite, y viaja en exc_text (campo 'exception' del JSON)
+    """
+    
+    def prepare(self, record):
+        exc_text = record.exc_text
+        if record.exc_info:
+            exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.exc_info = None
+        record.exc_text = None
+        record = super().prepare(record)
+        record.exc_text = exc_text
+        return record
+
+# Handlers finales (los usa el QueueListener en modo asíncrono)
+log_handlers = []
+log_listener = None
+
+def setup_logging(log_file=LOG_FILE, async_mode=LOG_ASYNC, json_file=LOG_JSON):
+    """
+    Configura el logging: archivo rotado por tamaño (JSON Lines con json_file)
+    y consola. Con async_mode los hilos solo encolan el registro y un
+    QueueListener escribe en segundo plano
+    """
+    global log_listener
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+    file_handler.setFormatter(JsonLogFormatter() if json_file else logging.Formatter(LOG_FORMAT))
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_handlers[:] = [file_handler, console_handler]
+    
+    if async_mode:
+        # Cola sin límite: emitir un log nunca bloquea al worker
+        log_queue = queue.Queue(-1)
+        queue_handler = TracebackQueueHandler(log_queue)
+        # Solo el mensaje: el formato final lo aplica cada handler del listener
+        queue_handler.setFormatter(logging.Formatter('%(message)s'))
+        root_handlers = [queue_handler]
+        log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+        log_listener.start()
+        atexit.register(log_listener.stop)  # Vacía la cola al salir
+    else:
+        root_handlers = log_handlers
+    
+    # Los filtros corren en el hilo que emite: ahí está el contexto del track
+    for handler in root_handlers:
+        handler.addFilter(LogContextFilter())
+        handler.addFilter(RepeatFilter())
+    
+    logging.basicConfig(level=logging.INFO, handlers=root_handlers)
+    return logger
+
+def redirect_console_logging(stream):
+    """Envía a stream los logs de consola (el modo batch reserva stdout para el estado)"""
+    for handler in log_handlers:
+        if not isinstance(handler, logging.FileHandler) and getattr(handler, 'stream', None) is sys.stdout:
+            handler.setStream(stream)
+
+# La configuración se hace al ejecutar el script: los procesos del
+# TranscodeScheduler (spawn/forkserver) reimportan este módulo y no deben
+# abrir el archivo de log ni arrancar su propio QueueListener
+logger = logging.getLogger(__name__)
+
+def temp_output_path(output_path):
+    """Ruta temporal junto al destino; conserva la extensión para que FFmpeg elija el contenedor"""
+    root, extension = os.path.splitext(output_path)
+    return f"{root}.tmp{extension}"
+
+def run_ffmpeg_atomic(cmd, output_path, timeout):
+    """
+    Ejecuta FFmpeg escribiendo en un archivo temporal (último argumento de cmd)
+    y lo renombra al destino solo si terminó bien: nunca queda un archivo
+    final a medio escribir. Retorna (returncode, stderr)
+    """
+    tmp_path = temp_output_path(output_path)
+    try:
+        result = subprocess.run(cmd + [tmp_path], capture_output=True, text=True, timeout=timeout)
+        if result.returncode == 0:
+            os.replace(tmp_path, output_path)
+        return result.returncode, result.stderr
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def ffmpeg_tag_args(tags=None, cover_path=None):
+    """
+    Argumentos de FFmpeg para escribir los tags ID3 (y la carátula como APIC)
+    en la misma pasada de codificación, con TAG_PADDING bytes libres en la
+    cabecera. Retorna (entradas adicionales, opciones de salida)
+    """
+    if not tags:
+        return [], ['-vn']
+    
+    inputs = []
+    options = ['-map', '0:a:0', '-map_metadata', '-1']
+    if cover_path:
+        inputs = ['-i', cover_path]
+        options += [
+            '-map', '1:v:0', '-codec:v', 'copy',
+            '-metadata:s:v', 'title=Cover',
+            '-metadata:s:v', 'comment=Cover (front)',
         ]
-    )
-    return logging.getLogger(__name__)
+    for key, field in FFMPEG_TAG_FIELDS:
+        value = tags.get(field)
+        if value:
+            options += ['-metadata', f"{key}={value}"]
+    options += ['-id3v2_version', '4', '-metadata_header_padding', str(TAG_PADDING)]
+    return inputs, options
+
+def run_ffmpeg_mp3(input_path, output_path, tags=None, cover_path=None, timeout=300):
+    """
+    Convierte un archivo a MP3 con FFmpeg y retorna (returncode, stderr).
+    Con tags (ver TrackRecord.tag_fields()) el MP3 sale ya etiquetado.
+    Es una función de módulo para poder ejecutarse en un ProcessPoolExecutor
+    """
+    inputs, options = ffmpeg_tag_args(tags, cover_path)
+    cmd = [
+        'ffmpeg', '-i', input_path, *inputs,
+        *options,
+        '-codec:a', 'libmp3lame',
+        '-qscale:a', '2',
+        '-y',  # Sobrescribir si existe
+    ]
+    return run_ffmpeg_atomic(cmd, output_path, timeout)
+
+def stream_ffmpeg_mp3(chunks, output_path, tags=None, cover_path=None, timeout=300):
+    """
+    Codifica a MP3 los bytes de chunks (iterable) escribiéndolos en el stdin
+    de FFmpeg mientras llegan. El MP3 se escribe en un temporal y se renombra
+    al terminar bien. Retorna (returncode, stderr)
+    """
+    tmp_path = temp_output_path(output_path)
+    inputs, options = ffmpeg_tag_args(tags, cover_path)
+    cmd = [
+        'ffmpeg', '-i', 'pipe:0', *inputs,
+        *options,
+        '-codec:a', 'libmp3lame',
+        '-qscale:a', '2',
+        '-y',  # Sobrescribir si existe
+        tmp_path
+    ]
+    # stderr a un archivo temporal: con un pipe FFmpeg podría bloquearse
+    # mientras nosotros seguimos escribiendo en su stdin
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=errors)
+        try:
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)
+            except BrokenPipeError:
+                pass  # FFmpeg terminó antes de tiempo; el returncode indica el error
+            finally:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+            returncode = process.wait(timeout=timeout)
+        except BaseException:
+            process.kill()
+            process.wait()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        errors.seek(0)
+        stderr = errors.read().decode('utf-8', errors='replace')
+    
+    if returncode == 0:
+        os.replace(tmp_path, output_path)
+    elif os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    return returncode, stderr
 
-logger = setup_logging()
+def timed_call(func, *args):
+    """Ejecuta func(*args) y retorna (segundos, resultado). Se ejecuta en el proceso hijo"""
+    started = time.time()
+    result = func(*args)
+    return time.time() - started, result
+
+def probe_audio_codec(path, timeout=60):
+    """Retorna el códec del primer stream de audio (p.ej. 'aac', 'opus') usando ffprobe"""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name',
+        '-of', 'csv=p=0',
+        path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+    if result.returncode != 0:
+        return None
+    return result.stdout.strip() or None
+
+def run_ffmpeg_passthrough(input_path, output_base, timeout=300):
+    """
+    Copia el stream de audio sin recodificar al contenedor de su códec.
+    Retorna (returncode, stderr, output_path). Apta para ProcessPoolExecutor
+    """
+    codec = probe_audio_codec(input_path)
+    extension = PASSTHROUGH_EXTENSIONS.get(codec)
+    if not extension:
+        return 1, f"Códec no soportado en modo original: {codec}", None
+    
+    output_path = output_base + extension
+    if os.path.abspath(input_path) == os.path.abspath(output_path):
+        return 0, '', output_path
+    
+    cmd = [
+        'ffmpeg', '-i', input_path,
+        '-vn', '-map', '0:a:0',
+        '-codec:a', 'copy',
+        '-y',  # Sobrescribir si existe
+    ]
+    returncode, stderr = run_ffmpeg_atomic(cmd, output_path, timeout)
+    return returncode, stderr, output_path
 
 class YouTubeAuthenticator:
     """Maneja la autenticación con YouTube de forma más robusta"""
     
-    def __init__(self):
-        self.cookies_file = YT_COOKIES_FILE
+    def __init__(self, interactive=True, cookies_file=YT_COOKIES_FILE):
+        self.cookies_file = cookies_file
+        self.interactive = interactive
         self.authenticated = False
         self.auth_method = None
         
     def extract_cookies_from_browser(self):
         """Extrae cookies directamente del navegador (método más confiable)"""
+        import browser_cookie3
+        
         print("\nExtrayendo cookies del navegador...")
         browsers = [
             ('Chrome', browser_cookie3.chrome),
@@ -81,12 +601,13 @@ class YouTubeAuthenticator:
                                 f.write(f"{cookie.domain}\t{'TRUE' if cookie.domain.startswith('.') else 'FALSE'}\t{cookie.path}\t{'TRUE' if cookie.secure else 'FALSE'}\t{cookie.expires or '0'}\t{cookie.name}\t{cookie.value}\n")
                             temp_cookie_file = f.name
                         
-                        # Verificar si las cookies funcionan
-                        if self.verify_cookies(temp_cookie_file):
+                        # Verificar si las cookies funcionan (la verificación se
+                        # cachea para el archivo permanente, no para el temporal)
+                        if self.verify_cookies(temp_cookie_file, use_cache=False):
                             # Copiar al archivo permanente
-                            import shutil
                             shutil.copy2(temp_cookie_file, self.cookies_file)
                             os.unlink(temp_cookie_file)
+                            self.store_cookie_check(self.cookies_file)
                             logger.info(f"Cookies extraídas exitosamente de {browser_name}")
                             return True
                         else:
@@ -98,8 +619,76 @@ class YouTubeAuthenticator:
                 
         return False
 
-    def verify_cookies(self, cookie_file):
-        """Verifica si las cookies son válidas"""
+    @staticmethod
+    def cookie_fingerprint(cookie_file):
+        """Hash del contenido + mtime del archivo de cookies"""
+        with open(cookie_file, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        return digest, os.path.getmtime(cookie_file)
+
+    @staticmethod
+    def earliest_cookie_expiry(cookie_file):
+        """Menor fecha de expiración (epoch) de las cookies de YouTube; None si no hay"""
+        expiries = []
+        with open(cookie_file, 'r', encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) < 7 or (line.startswith('#') and not line.startswith('#HttpOnly_')):
+                    continue
+                if 'youtube.com' not in fields[0]:
+                    continue
+                try:
+                    expires = int(float(fields[4]))
+                except ValueError:
+                    continue
+                if expires > 0:  # 0 = cookie de sesión
+                    expiries.append(expires)
+        return min(expiries) if expiries else None
+
+    def load_cookie_checks(self):
+        """Verificaciones de cookies cacheadas por ruta de archivo"""
+        try:
+            with open(YT_COOKIES_CHECK_FILE, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def cached_cookie_check(self, cookie_file):
+        """True si hay una verificación válida para este contenido de cookies"""
+        entry = self.load_cookie_checks().get(os.path.abspath(cookie_file))
+        if not entry:
+            return False
+        try:
+            digest, mtime = self.cookie_fingerprint(cookie_file)
+        except OSError:
+            return False
+        return entry['sha256'] == digest and entry['mtime'] == mtime and time.time() < entry['valid_until']
+
+    def store_cookie_check(self, cookie_file):
+        """Guarda una verificación positiva hasta la expiración de la primera cookie"""
+        try:
+            digest, mtime = self.cookie_fingerprint(cookie_file)
+            valid_until = time.time() + YT_COOKIES_CHECK_MAX_AGE
+            earliest = self.earliest_cookie_expiry(cookie_file)
+            if earliest is not None:
+                valid_until = min(valid_until, earliest)
+            if valid_until <= time.time():
+                return
+            
+            checks = self.load_cookie_checks()
+            checks[os.path.abspath(cookie_file)] = {'sha256': digest, 'mtime': mtime, 'valid_until': valid_until}
+            with open(YT_COOKIES_CHECK_FILE, 'w', encoding='utf-8') as f:
+                json.dump(checks, f, indent=2)
+        except OSError as e:
+            logger.warning(f"No se pudo guardar la verificación de cookies: {str(e)}")
+
+    def verify_cookies(self, cookie_file, use_cache=True):
+        """Verifica si las cookies son válidas (usa la verificación cacheada si existe)"""
+        if use_cache and self.cached_cookie_check(cookie_file):
+            logger.info("Cookies verificadas (caché)")
+            return True
+        
+        from yt_dlp import YoutubeDL
         try:
             ydl_opts = {
                 'cookiefile': cookie_file,
@@ -110,6 +699,8 @@ class YouTubeAuthenticator:
             with YoutubeDL(ydl_opts) as ydl:
                 info = ydl.extract_info('https://www.youtube.com/watch?v=jNQXAC9IVRw', download=False)
                 if info:
+                    if use_cache:
+                        self.store_cookie_check(cookie_file)
                     return True
         except Exception as e:
             logger.warning(f"Cookies no válidas: {str(e)}")
@@ -148,9 +739,9 @@ class YouTubeAuthenticator:
                         continue
                 
                 # Verificar si las cookies funcionan
-                if self.verify_cookies(file_path):
-                    import shutil
+                if self.verify_cookies(file_path, use_cache=False):
                     shutil.copy2(file_path, self.cookies_file)
+                    self.store_cookie_check(self.cookies_file)
                     print("✅ Cookies válidas guardadas correctamente")
                     return True
                 else:
@@ -199,6 +790,7 @@ class YouTubeAuthenticator:
             }
             
             print("\n🔐 Iniciando sesión en YouTube...")
+            from yt_dlp import YoutubeDL
             try:
                 with YoutubeDL(ydl_opts) as ydl:
                     # Intentar acceder a contenido que requiere login
@@ -227,6 +819,9 @@ class YouTubeAuthenticator:
 
     def setup_authentication(self):
         """Configura la autenticación con múltiples opciones robustas"""
+        if not self.interactive:
+            return self.setup_authentication_headless()
+        
         print("\n" + "="*60)
         print("CONFIGURACIÓN DE AUTENTICACIÓN YOUTUBE")
         print("="*60)
@@ -291,6 +886,18 @@ class YouTubeAuthenticator:
                 print(f"❌ Error: {str(e)}")
                 continue
 
+    def setup_authentication_headless(self):
+        """Autenticación sin preguntas: usa las cookies existentes si son válidas"""
+        if os.path.exists(self.cookies_file) and self.verify_cookies(self.cookies_file):
+            logger.info("Cookies de YouTube válidas")
+            self.authenticated = True
+            self.auth_method = "existing_cookies"
+        else:
+            logger.warning(f"Sin cookies válidas en {self.cookies_file}: se continúa sin autenticación")
+            self.authenticated = False
+            self.auth_method = "none"
+        return True
+
     def get_auth_options(self):
         """Retorna las opciones de autenticación para yt-dlp"""
         if self.authenticated and os.path.exists(self.cookies_file):
@@ -302,129 +909,2236 @@ class YouTubeAuthenticator:
         else:
             return {}
 
-class SpotifyDownloader:
-    def __init__(self):
-        try:
-            self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
-                client_id=SPOTIFY_CLIENT_ID,
-                client_secret=SPOTIFY_CLIENT_SECRET,
-                redirect_uri=SPOTIFY_REDIRECT_URI,
-                scope=SCOPE,
-                username=SPOTIFY_USERNAME
-            ))
-            logger.info("Autenticación con Spotify exitosa")
+class TranscodeScheduler:
+    """
+    Planificador de conversiones FFmpeg: pool de procesos del tamaño de los
+    núcleos disponibles, cola de entrada acotada y prioridad por duración
+    (las canciones cortas no esperan detrás de mezclas largas).
+    slots es el presupuesto de FFmpeg simultáneos: lo comparten las
+    conversiones del pool y las codificaciones en streaming
+    """
+    
+    def __init__(self, processes=TRANSCODE_PROCESSES, queue_size=TRANSCODE_QUEUE_SIZE):
+        self.processes = processes
+        self.slots = threading.BoundedSemaphore(processes)
+        self.queue = queue.PriorityQueue(maxsize=queue_size)
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.pool = None
+        self.dispatchers = []
+        self.timings = []  # (label, segundos en cola, segundos de codificación)
+    
+    def start(self):
+        """Crea el pool y los hilos despachadores si no existen"""
+        with self.lock:
+            if self.pool is not None:
+                return
+            self.pool = ProcessPoolExecutor(max_workers=self.processes)
+            self.dispatchers = [
+                threading.Thread(target=self.dispatch, args=(self.pool,),
+                                 name=f"transcode-dispatch-{n}", daemon=True)
+                for n in range(self.processes)
+            ]
+            for thread in self.dispatchers:
+                thread.start()
+    
+    def resize(self, processes):
+        """Cambia el número de procesos FFmpeg; el pool se recrea en el siguiente submit"""
+        if processes == self.processes:
+            return
+        self.close()
+        with self.lock:
+            self.processes = processes
+            self.slots = threading.BoundedSemaphore(processes)
+    
+    def submit(self, func, *args, priority=0, label=''):
+        """
+        Encola una conversión y retorna un Future con el resultado de func.
+        Menor prioridad = se ejecuta antes
+        """
+        self.start()
+        future = Future()
+        self.queue.put((priority, next(self.sequence), func, args, label, time.time(), future))
+        return future
+    
+    def dispatch(self, pool):
+        """Toma la conversión más prioritaria y la ejecuta en el pool"""
+        while True:
+            _, _, func, args, label, queued_at, future = self.queue.get()
+            if func is None:
+                break
+            if not future.set_running_or_notify_cancel():
+                continue
             
-            # Inicializar autenticador de YouTube
-            self.yt_auth = YouTubeAuthenticator()
+            with self.slots:
+                started = time.time()
+                try:
+                    elapsed, result = pool.submit(timed_call, func, *args).result()
+                except Exception as e:
+                    future.set_exception(e)
+                    continue
             
-        except Exception as e:
-            logger.error(f"Error en autenticación: {str(e)}")
-            raise
+            waited = started - queued_at
+            with self.lock:
+                self.timings.append((label, waited, elapsed))
+            logger.info(f"⏱️ Codificación {label}: {elapsed:.1f}s (en cola {waited:.1f}s)")
+            future.set_result(result)
+    
+    def close(self):
+        """Espera las conversiones pendientes y cierra el pool"""
+        with self.lock:
+            pool, dispatchers = self.pool, self.dispatchers
+            self.pool, self.dispatchers = None, []
+        if pool is None:
+            return
+        
+        for _ in dispatchers:
+            self.queue.put((float('inf'), next(self.sequence), None, (), '', 0, None))
+        for thread in dispatchers:
+            thread.join()
+        pool.shutdown()
+    
+    def stats(self):
+        """Resumen de tiempos de codificación"""
+        with self.lock:
+            timings = list(self.timings)
+        total = sum(elapsed for _, _, elapsed in timings)
+        return {
+            'jobs': len(timings),
+            'encode_seconds': total,
+            'mean_encode_seconds': total / len(timings) if timings else 0.0,
+            'mean_wait_seconds': sum(w for _, w, _ in timings) / len(timings) if timings else 0.0,
+        }
 
-    def setup_youtube_auth(self):
-        """Configura la autenticación de YouTube"""
-        return self.yt_auth.setup_authentication()
+class AdaptiveRateLimiter:
+    """
+    Token buckets compartidos por todos los workers (uno por tipo de petición).
+    Ante detección de bot o HTTP 429 reduce la velocidad y pausa el bucket con
+    backoff exponencial; cada éxito la recupera gradualmente
+    """
+    
+    def __init__(self, limits=RATE_LIMITS, min_factor=RATE_LIMIT_MIN_FACTOR,
+                 recovery=RATE_LIMIT_RECOVERY, min_backoff=RATE_LIMIT_MIN_BACKOFF,
+                 max_backoff=RATE_LIMIT_MAX_BACKOFF):
+        self.min_factor = min_factor
+        self.recovery = recovery
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.lock = threading.Lock()
+        now = time.time()
+        self.buckets = {
+            name: {
+                'rate': rate,
+                'capacity': capacity,
+                'tokens': float(capacity),
+                'factor': 1.0,
+                'backoff': 0.0,
+                'blocked_until': 0.0,
+                'updated': now,
+                'throttled': 0,
+            }
+            for name, (rate, capacity) in limits.items()
+        }
+    
+    @staticmethod
+    def is_throttle_error(error_msg):
+        """True si el error indica detección de bot o límite de peticiones"""
+        return classify_error(error_msg) == 'throttled'
+    
+    def acquire(self, name):
+        """Bloquea hasta que haya un token disponible en el bucket"""
+        while True:
+            with self.lock:
+                bucket = self.buckets[name]
+                now = time.time()
+                rate = bucket['rate'] * bucket['factor']
+                bucket['tokens'] = min(bucket['capacity'], bucket['tokens'] + (now - bucket['updated']) * rate)
+                bucket['updated'] = now
+                
+                if now < bucket['blocked_until']:
+                    wait = bucket['blocked_until'] - now
+                elif bucket['tokens'] >= 1:
+                    bucket['tokens'] -= 1
+                    return
+                else:
+                    wait = (1 - bucket['tokens']) / rate
+            time.sleep(wait)
+    
+    def available(self, name):
+        """Tokens disponibles ahora en el bucket (0 si está en pausa)"""
+        with self.lock:
+            bucket = self.buckets[name]
+            now = time.time()
+            if now < bucket['blocked_until']:
+                return 0.0
+            rate = bucket['rate'] * bucket['factor']
+            return min(bucket['capacity'], bucket['tokens'] + (now - bucket['updated']) * rate)
+    
+    def success(self, name):
+        """Recupera gradualmente la velocidad tras una petición exitosa"""
+        with self.lock:
+            bucket = self.buckets[name]
+            bucket['factor'] = min(1.0, bucket['factor'] + self.recovery)
+            bucket['backoff'] = bucket['backoff'] / 2 if bucket['backoff'] > 1 else 0.0
+    
+    def throttled(self, name):
+        """Reduce la velocidad y pausa el bucket con backoff exponencial"""
+        with self.lock:
+            bucket = self.buckets[name]
+            bucket['factor'] = max(self.min_factor, bucket['factor'] / 2)
+            bucket['backoff'] = min(self.max_backoff, max(bucket['backoff'] * 2, self.min_backoff))
+            bucket['blocked_until'] = time.time() + bucket['backoff']
+            bucket['tokens'] = 0.0
+            bucket['throttled'] += 1
+            backoff = bucket['backoff']
+        logger.warning("🐢 Limitación detectada (%s): pausa de %.0fs y velocidad reducida", name, backoff)
+    
+    def report(self, name, error_msg=None):
+        """Registra el resultado de una petición: éxito o error (limitación o no)"""
+        if error_msg is None:
+            self.success(name)
+        elif self.is_throttle_error(error_msg):
+            self.throttled(name)
 
-    def clean_filename(self, filename):
-        """
-        Limpia el nombre de archivo removiendo caracteres no válidos
-        y reemplazando espacios con guiones bajos
-        """
-        # Caracteres no permitidos en nombres de archivo
-        invalid_chars = '<>:"/\\|?*\'"'
-        
-        # Remover caracteres inválidos
-        for char in invalid_chars:
-            filename = filename.replace(char, '')
+def classify_error(error_msg):
+    """Clase de un error de yt-dlp: 'permanent', 'auth', 'throttled' o 'transient'"""
+    text = (error_msg or '').casefold()
+    for error_class, markers in ERROR_CLASS_MARKERS:
+        if any(marker.casefold() in text for marker in markers):
+            return error_class
+    return 'transient'
+
+class CircuitBreaker:
+    """
+    Pausa las búsquedas y la etapa de descarga cuando se acumulan errores de
+    detección de bot. Estados: 'closed' (normal), 'open' (las descargas esperan hasta el
+    fin del cool-down) y 'half_open' (una sola descarga de prueba decide si se
+    cierra o se vuelve a abrir con el doble de pausa)
+    """
+    
+    def __init__(self, threshold=CIRCUIT_BREAKER_THRESHOLD, window=CIRCUIT_BREAKER_WINDOW,
+                 cooldown=CIRCUIT_BREAKER_COOLDOWN, max_cooldown=CIRCUIT_BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.window = window
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.condition = threading.Condition()
+        self.state = 'closed'
+        self.failures = []
+        self.open_until = 0.0
+        self.probe_thread = None
+        self.trips = 0
+    
+    def wait(self):
+        """Bloquea mientras el circuito está abierto; en half_open deja pasar una sola prueba"""
+        with self.condition:
+            while True:
+                if self.state == 'closed':
+                    return
+                now = time.time()
+                if self.state == 'open':
+                    if now < self.open_until:
+                        self.condition.wait(self.open_until - now)
+                        continue
+                    self.state = 'half_open'
+                    logger.info("🔌 Circuito de descargas semiabierto: se prueba una descarga")
+                if self.probe_thread is None:
+                    self.probe_thread = threading.get_ident()
+                    return
+                self.condition.wait()
+    
+    def trip(self, now):
+        """Abre el circuito (se llama con el lock tomado)"""
+        self.state = 'open'
+        self.open_until = now + self.cooldown
+        self.probe_thread = None
+        self.failures = []
+        self.trips += 1
+        logger.warning(f"🔌 Demasiadas detecciones de bot: descargas en pausa durante {self.cooldown:.0f}s")
+    
+    def record(self, error_class):
+        """Registra el resultado de una búsqueda o descarga (error_class None = éxito)"""
+        with self.condition:
+            now = time.time()
+            is_probe = self.state == 'half_open' and self.probe_thread == threading.get_ident()
+            if error_class == 'throttled':
+                if is_probe:
+                    self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                    self.trip(now)
+                elif self.state == 'closed':
+                    self.failures = [t for t in self.failures if now - t <= self.window] + [now]
+                    if len(self.failures) >= self.threshold:
+                        self.trip(now)
+            elif is_probe:
+                self.state = 'closed'
+                self.cooldown = self.base_cooldown
+                self.probe_thread = None
+                logger.info("🔌 Circuito de descargas cerrado: se reanudan las descargas")
+            self.condition.notify_all()
+
+class DownloadController:
+    """
+    Controla las descargas simultáneas a partir del throughput medido en los
+    progress_hooks de yt-dlp (y en el streaming hacia FFmpeg). Política AIMD:
+    cada intervalo se permite una descarga más mientras todas las plazas estén
+    ocupadas y el throughput total siga creciendo (la que no aporta se deshace
+    y se espera unas ventanas antes de volver a probar); ante limitación de YouTube
+    o caída del throughput (total o por descarga) el límite se reduce a la mitad.
+    Aplica además el límite global de ancho de banda (token bucket de bytes)
+    """
+    
+    def __init__(self, initial=PIPELINE_WORKERS['download'], minimum=DOWNLOAD_CONCURRENCY_MIN,
+                 maximum=DOWNLOAD_CONCURRENCY_MAX, interval=DOWNLOAD_TUNE_INTERVAL,
+                 min_gain=DOWNLOAD_TUNE_MIN_GAIN, drop=DOWNLOAD_TUNE_DROP, hold_windows=DOWNLOAD_TUNE_HOLD,
+                 autotune=DOWNLOAD_AUTOTUNE,
+                 bandwidth_limit=BANDWIDTH_LIMIT, limit_hours=BANDWIDTH_LIMIT_HOURS):
+        self.minimum = minimum
+        self.maximum = max(maximum, initial)
+        self.interval = interval
+        self.min_gain = min_gain
+        self.drop = drop
+        self.hold_windows = hold_windows
+        self.autotune = autotune
+        self.bandwidth_limit = bandwidth_limit
+        self.limit_hours = limit_hours
+        self.condition = threading.Condition()
+        self.limit = max(minimum, initial)
+        self.active = 0
+        self.streams = {}
+        # Ventana de medición actual y resultado de la anterior
+        now = time.time()
+        self.window_started = now
+        self.accounted = now
+        self.window_bytes = 0
+        self.window_stream_seconds = 0.0
+        self.congested = False
+        self.throughput = 0.0
+        self.stream_throughput = 0.0
+        self.last_change = None
+        self.hold = 0
+        # Token bucket del límite de ancho de banda (ráfaga de 1 segundo)
+        self.allowance = 0.0
+        self.allowance_updated = now
+        self.counts = {'increases': 0, 'decreases': 0, 'bandwidth_waits': 0}
+    
+    def acquire(self):
+        """Bloquea hasta que haya una plaza de descarga libre"""
+        with self.condition:
+            while self.active >= self.limit:
+                self.condition.wait()
+            self.account_time(time.time())
+            self.active += 1
+    
+    def release(self):
+        """Libera la plaza de una descarga terminada"""
+        with self.condition:
+            self.account_time(time.time())
+            self.active -= 1
+            self.maybe_tune(time.time())
+            self.condition.notify_all()
+    
+    # Como un semáforo: "with controller:" ocupa una plaza durante la transferencia
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
+    
+    def account_time(self, now):
+        """Acumula los segundos-descarga de la ventana (con el lock tomado)"""
+        self.window_stream_seconds += self.active * (now - self.accounted)
+        self.accounted = now
+    
+    def congestion(self):
+        """Señal de congestión (detección de bot, HTTP 429): se aplica al cerrar la ventana"""
+        with self.condition:
+            self.congested = True
+    
+    def on_progress(self, progress):
+        """Datos de un progress_hook de yt-dlp: bytes nuevos de cada descarga en curso"""
+        key = progress.get('tmpfilename') or progress.get('filename')
+        downloaded = progress.get('downloaded_bytes') or 0
+        with self.condition:
+            previous = self.streams.pop(key, 0)
+            if progress.get('status') == 'downloading':
+                self.streams[key] = downloaded
+        if downloaded > previous:
+            self.add_bytes(downloaded - previous)
+    
+    def current_bandwidth_limit(self, now):
+        """Límite de ancho de banda vigente (solo dentro de BANDWIDTH_LIMIT_HOURS, si se indicó)"""
+        if not self.bandwidth_limit:
+            return None
+        if self.limit_hours:
+            start, end = self.limit_hours
+            hour = datetime.fromtimestamp(now).hour
+            inside = start <= hour < end if start <= end else (hour >= start or hour < end)
+            if not inside:
+                return None
+        return self.bandwidth_limit
+    
+    def add_bytes(self, size):
+        """Registra bytes descargados y espera lo necesario para respetar el límite de ancho de banda"""
+        wait = 0.0
+        with self.condition:
+            now = time.time()
+            self.window_bytes += size
+            cap = self.current_bandwidth_limit(now)
+            if cap:
+                self.allowance = min(cap, self.allowance + (now - self.allowance_updated) * cap) - size
+                self.allowance_updated = now
+                if self.allowance < 0:
+                    wait = -self.allowance / cap
+                    self.counts['bandwidth_waits'] += 1
+            self.maybe_tune(now)
+        if wait:
+            time.sleep(wait)
+    
+    def maybe_tune(self, now):
+        """Ajusta el límite de descargas al cerrar cada ventana de medición (con el lock tomado)"""
+        elapsed = now - self.window_started
+        if elapsed < self.interval:
+            return
+        self.account_time(now)
+        throughput = self.window_bytes / elapsed
+        stream_throughput = self.window_bytes / self.window_stream_seconds if self.window_stream_seconds else 0.0
+        # Solo las ventanas con todas las plazas ocupadas miden la capacidad real
+        saturated = self.window_bytes and self.window_stream_seconds / elapsed >= self.limit - 0.5
+        cap = self.current_bandwidth_limit(now)
         
-        # Reemplazar múltiples espacios con un solo guión bajo
-        filename = re.sub(r'\s+', '_', filename)
+        previous_limit = self.limit
+        change = None
+        if not self.autotune:
+            pass
+        elif self.congested:
+            change = 'decrease'
+        elif saturated and self.throughput and self.last_change != 'decrease':
+            if throughput < self.throughput * (1 - self.drop):
+                # Caída del throughput total
+                change = 'decrease'
+            elif self.last_change is None and stream_throughput < self.stream_throughput * (1 - self.drop):
+                # Cada descarga va más lenta con las mismas plazas: YouTube está limitando
+                change = 'decrease'
+            elif self.last_change == 'increase' and throughput < self.throughput * (1 + self.min_gain):
+                # La última plaza solo reparte el mismo ancho de banda: se deshace y se espera
+                change = 'step_back'
+        if change is None and self.autotune and saturated and not self.hold and not (cap and throughput >= cap * 0.9):
+            change = 'increase'
         
-        # Remover guiones bajos al inicio y final
-        filename = filename.strip('_')
+        if change == 'decrease':
+            self.limit = max(self.minimum, self.limit // 2)
+            self.hold = self.hold_windows
+        elif change == 'step_back':
+            self.limit = max(self.minimum, self.limit - 1)
+            self.hold = self.hold_windows
+        elif change == 'increase':
+            self.limit = min(self.maximum, self.limit + 1)
+        else:
+            self.hold = max(0, self.hold - 1)
         
-        # Limitar longitud del nombre (máximo 100 caracteres)
-        if len(filename) > 100:
-            filename = filename[:100]
+        if self.limit > previous_limit:
+            self.last_change = 'increase'
+            self.counts['increases'] += 1
+        elif self.limit < previous_limit:
+            self.last_change = 'decrease'
+            self.counts['decreases'] += 1
+            logger.info(f"📉 Descargas simultáneas: {previous_limit} -> {self.limit}")
+        else:
+            self.last_change = None
         
-        return filename
+        if self.window_bytes:
+            self.throughput = throughput
+            self.stream_throughput = stream_throughput
+        self.window_started = now
+        self.window_bytes = 0
+        self.window_stream_seconds = 0.0
+        self.congested = False
+        self.condition.notify_all()
+    
+    def stats(self):
+        """Estado del controlador para las métricas"""
+        with self.condition:
+            return dict(self.counts, limit=self.limit, active=self.active,
+                        throughput_bytes_per_second=round(self.throughput),
+                        stream_bytes_per_second=round(self.stream_throughput),
+                        bandwidth_limit=self.current_bandwidth_limit(time.time()))
 
-    def get_playlist_tracks(self, playlist_id):
-        """Obtiene todas las canciones de una playlist"""
-        try:
-            results = self.sp.playlist_tracks(playlist_id)
-            tracks = results['items']
-            
-            while results['next']:
-                results = self.sp.next(results)
-                tracks.extend(results['items'])
-            
-            logger.info(f"Se encontraron {len(tracks)} canciones en la playlist")
-            return tracks
-        except Exception as e:
-            logger.error(f"Error al obtener tracks: {str(e)}")
-            raise
+class YouTubeIdentity:
+    """
+    Identidad de YouTube: archivo de cookies y proxy opcional, con su propio
+    presupuesto de peticiones (AdaptiveRateLimiter) y su estado de salud.
+    Con auth, las cookies las gestiona YouTubeAuthenticator
+    """
+    
+    def __init__(self, name, cookies_file=None, proxy=None, auth=None):
+        self.name = name
+        self.cookies_file = cookies_file
+        self.proxy = proxy
+        self.auth = auth
+        self.rate_limiter = AdaptiveRateLimiter()
+        self.healthy = None          # None = sin comprobar
+        self.checked_at = 0.0
+        self.checking = False
+        self.cooldown = 0.0
+        self.cooling_until = 0.0
+        self.in_flight = 0
+        self.counts = {'requests': 0, 'errors': 0, 'throttled': 0, 'cooldowns': 0, 'health_failures': 0}
+    
+    def ydl_options(self):
+        """Opciones de yt-dlp de esta identidad (cookies y proxy)"""
+        options = self.auth.get_auth_options() if self.auth else {}
+        if self.cookies_file:
+            options['cookiefile'] = self.cookies_file
+        if self.proxy:
+            options['proxy'] = self.proxy
+        return options
+    
+    def state(self, now=None):
+        """'unchecked', 'unhealthy', 'cooling' u 'ok'"""
+        if self.healthy is None:
+            return 'unchecked'
+        if not self.healthy:
+            return 'unhealthy'
+        if (now or time.time()) < self.cooling_until:
+            return 'cooling'
+        return 'ok'
 
-    def search_youtube(self, track_name, artist_name):
-        """Busca el video en YouTube con autenticación si está disponible"""
-        search_query = f"{track_name} {artist_name} official audio"
-        
-        # Configuración base para yt-dlp
-        ydl_opts = {
-            'quiet': True,
-            'extract_flat': True,
-            'force_json': True,
-            'no_warnings': True,
-        }
-        
-        # Añadir opciones de autenticación si están disponibles
-        auth_options = self.yt_auth.get_auth_options()
-        ydl_opts.update(auth_options)
+class IdentityPool:
+    """
+    Reparte búsquedas y descargas entre varias identidades de YouTube.
+    Se elige la identidad sana con más presupuesto libre; tras una detección
+    de bot la identidad se enfría (backoff exponencial) y el tráfico pasa a
+    las demás. Cada identidad se comprueba antes de su primer uso, al terminar
+    el enfriamiento y, si falló, cada IDENTITY_HEALTH_INTERVAL
+    """
+    
+    def __init__(self, identities, ydl_pool, health_url=IDENTITY_HEALTH_URL,
+                 health_interval=IDENTITY_HEALTH_INTERVAL, cooldown=IDENTITY_COOLDOWN,
+                 max_cooldown=IDENTITY_MAX_COOLDOWN):
+        if not identities:
+            raise ValueError("El pool necesita al menos una identidad")
+        self.identities = list(identities)
+        self.ydl_pool = ydl_pool
+        self.health_url = health_url
+        self.health_interval = health_interval
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.lock = threading.Lock()
+        self.degraded = False
+    
+    @classmethod
+    def from_config(cls, entries, yt_auth, ydl_pool, **kwargs):
+        """
+        Crea el pool desde YT_IDENTITIES (lista de dicts name/cookies_file/proxy).
+        Sin entradas se usa una sola identidad con la autenticación de yt_auth
+        """
+        identities = [
+            YouTubeIdentity(entry.get('name') or f"identity{index}",
+                            cookies_file=entry.get('cookies_file'), proxy=entry.get('proxy'))
+            for index, entry in enumerate(entries or [], 1)
+        ]
+        if not identities:
+            identities = [YouTubeIdentity('default', auth=yt_auth)]
+        return cls(identities, ydl_pool, **kwargs)
+    
+    def needs_check(self, identity, now):
+        """True si hay que comprobar la identidad antes de usarla"""
+        if identity.healthy is None:
+            return True
+        if identity.healthy is False:
+            return now - identity.checked_at >= self.health_interval
+        return 0 < identity.cooling_until <= now
+    
+    def choose(self, kind):
+        """
+        Elige una identidad (con el lock). Retorna (identidad, comprobar) o
+        (None, False) si todas están en comprobación por otros hilos
+        """
+        with self.lock:
+            now = time.time()
+            candidates = [identity for identity in self.identities if not identity.checking]
+            for identity in candidates:
+                if self.needs_check(identity, now):
+                    identity.checking = True
+                    return identity, True
+            
+            ready = [identity for identity in candidates if identity.state(now) == 'ok']
+            if ready:
+                self.degraded = False
+                identity = max(ready, key=lambda i: (i.rate_limiter.available(kind), -i.in_flight))
+            elif candidates:
+                # Ninguna disponible: la que antes termine su enfriamiento (su
+                # limitador ya espera lo suyo) o, si ninguna está sana, cualquiera
+                if not self.degraded:
+                    self.degraded = True
+                    logger.warning("⚠️ Ninguna identidad de YouTube disponible: se usa la que se recupera antes")
+                identity = min(candidates, key=lambda i: (not i.healthy, i.cooling_until, i.in_flight))
+            else:
+                return None, False
+            identity.in_flight += 1
+            identity.counts['requests'] += 1
+            return identity, False
+    
+    def acquire(self, kind):
+        """Reserva una identidad para una petición de tipo kind (hay que llamar a release)"""
+        while True:
+            identity, check = self.choose(kind)
+            if identity is None:
+                time.sleep(0.5)
+            elif check:
+                self.health_check(identity)
+            else:
+                return identity
+    
+    def release(self, identity):
+        """Libera la identidad reservada con acquire"""
+        with self.lock:
+            identity.in_flight -= 1
+    
+    def probe(self, identity):
+        """
+        Petición de salud con las cookies y el proxy de la identidad (red de yt-dlp).
+        También la identidad por defecto: sus cookies pueden ser válidas y estar
+        bloqueadas. En su primera comprobación se reutiliza la verificación de
+        cookies cacheada por YouTubeAuthenticator (sin petición extra al arrancar).
+        Retorna None si está sana o el mensaje de error
+        """
+        if identity.cookies_file and not os.path.exists(identity.cookies_file):
+            return f"No existe el archivo de cookies: {identity.cookies_file}"
+        auth = identity.auth
+        if (identity.healthy is None and auth is not None and not identity.proxy
+                and auth.get_auth_options() and auth.cached_cookie_check(auth.cookies_file)):
+            return None
+        from yt_dlp.networking import Request
         
+        opts = dict(identity.ydl_options(), quiet=True, no_warnings=True)
+        ydl = self.ydl_pool.get('probe', opts)
+        # Un estado HTTP de error (429, 403...) llega como excepción a health_check
+        response = ydl.urlopen(Request(self.health_url))
         try:
-            with YoutubeDL(ydl_opts) as ydl:
-                result = ydl.extract_info(
-                    f"ytsearch1:{search_query}",
-                    download=False
-                )
-                if result['entries']:
-                    video_url = result['entries'][0]['url']
-                    logger.info(f"Video encontrado: {video_url}")
-                    return video_url
-                else:
-                    logger.warning(f"No se encontraron videos para: {search_query}")
-                    return None
+            body = response.read(IDENTITY_HEALTH_MAX_BYTES).decode('utf-8', 'replace')
+        finally:
+            response.close()
+        return self.blocked_reason(response.url, body)
+    
+    @staticmethod
+    def blocked_reason(url, body):
+        """
+        Señal concreta de bloqueo en la respuesta del probe: redirección a /sorry
+        o a la página de consentimiento, o un playabilityStatus distinto de OK.
+        El resto del texto de la página no cuenta (títulos y descripciones pueden
+        contener cualquier cosa). Retorna el mensaje o None
+        """
+        parsed = urlparse(url or '')
+        if parsed.path.startswith('/sorry'):
+            return "YouTube pide verificación de bot (/sorry)"
+        if (parsed.hostname or '').startswith('consent.'):
+            return "YouTube redirige a la página de consentimiento: las cookies no tienen sesión"
+        match = IDENTITY_PLAYABILITY_RE.search(body)
+        if match and match.group('status') != 'OK':
+            reason = match.group('reason') or 'sin motivo'
+            return f"El video de prueba no se puede reproducir ({match.group('status')}: {reason})"
+        return None
+    
+    def health_check(self, identity):
+        """Comprueba una identidad marcada como 'checking' y actualiza su estado"""
+        try:
+            error_msg = self.probe(identity)
         except Exception as e:
             error_msg = str(e)
-            if "Sign in to confirm you're not a bot" in error_msg or "age-restricted" in error_msg:
-                logger.warning(f"Video restringido que requiere autenticación: {track_name}")
-            elif "Private video" in error_msg:
-                logger.warning(f"Video privado: {track_name}")
+        
+        with self.lock:
+            identity.checking = False
+            identity.checked_at = time.time()
+            identity.healthy = error_msg is None
+            if error_msg is None:
+                identity.cooling_until = 0.0
             else:
-                logger.error(f"Error en búsqueda YouTube: {search_query} - {error_msg}")
-            return None
+                identity.counts['health_failures'] += 1
+        if error_msg is None:
+            logger.info(f"🪪 Identidad {identity.name}: disponible")
+        else:
+            logger.warning("🪪 Identidad %s: no disponible (%s)", identity.name, error_msg)
+    
+    def report(self, identity, kind, error_msg=None):
+        """Registra el resultado de una petición; una detección de bot enfría la identidad"""
+        identity.rate_limiter.report(kind, error_msg)
+        if error_msg is None:
+            with self.lock:
+                identity.cooldown = 0.0
+            return
+        
+        with self.lock:
+            identity.counts['errors'] += 1
+            if classify_error(error_msg) != 'throttled':
+                return
+            identity.counts['throttled'] += 1
+            now = time.time()
+            if now < identity.cooling_until:
+                # Peticiones que ya estaban en curso: el enfriamiento no se alarga
+                return
+            identity.counts['cooldowns'] += 1
+            identity.cooldown = min(self.max_cooldown, max(identity.cooldown * 2, self.base_cooldown))
+            identity.cooling_until = now + identity.cooldown
+            cooldown = identity.cooldown
+        logger.warning("🪪 Identidad %s: detección de bot, en enfriamiento %.0fs", identity.name, cooldown)
+    
+    def any_ready(self):
+        """True si alguna identidad está disponible ahora mismo"""
+        with self.lock:
+            now = time.time()
+            return any(identity.state(now) == 'ok' for identity in self.identities)
+    
+    def stats(self):
+        """Estado y contadores por identidad"""
+        with self.lock:
+            now = time.time()
+            return {
+                identity.name: dict(
+                    identity.counts,
+                    state=identity.state(now),
+                    in_flight=identity.in_flight,
+                    cooling_seconds=round(max(0.0, identity.cooling_until - now), 1),
+                    rate_factor={name: round(bucket['factor'], 3)
+                                 for name, bucket in identity.rate_limiter.buckets.items()},
+                )
+                for identity in self.identities
+            }
 
-    def download_audio_advanced(self, url, output_path, metadata):
-        """Descarga audio usando estrategias avanzadas para evitar el problema SABR"""
+class YoutubeDLPool:
+    """
+    Pool de instancias YoutubeDL de larga duración: una por hilo y perfil
+    de opciones, para no reinicializar extractores, cookies y HTTP por track
+    """
+    
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.instances = []
+        self.created = 0
+        self.reused = 0
+    
+    @staticmethod
+    def profile_key(profile, opts):
+        """Clave del perfil: nombre + opciones serializadas"""
+        return profile, json.dumps(opts, sort_keys=True, default=str)
+    
+    def get(self, profile, opts, outtmpl=None, format_spec=None):
+        """
+        Retorna la instancia del hilo actual para el perfil dado.
+        outtmpl y format_spec se asignan en cada llamada porque cambian por
+        track: como opciones crearían una instancia por formato
+        """
+        instances = getattr(self.local, 'instances', None)
+        if instances is None:
+            instances = self.local.instances = {}
         
-        # Estrategia 1: Usar yt-dlp con configuración específica para SABR
-        ydl_opts_sabr = {
-            'format': 'bestaudio/best',
-            'outtmpl': output_path,
-            'quiet': False,
-            'no_warnings': False,
-            'ignoreerrors': False,
-            'retries': 10,
-            'fragment_retries': 10,
-            'skip_unavailable_fragments': True,
-            'extractaudio': True,
+        key = self.profile_key(profile, opts)
+        ydl = instances.get(key)
+        if ydl is None:
+            from yt_dlp import YoutubeDL
+            ydl = YoutubeDL(dict(opts))
+            instances[key] = ydl
+            with self.lock:
+                self.instances.append(ydl)
+                self.created += 1
+        else:
+            with self.lock:
+                self.reused += 1
+        
+        if outtmpl is not None:
+            ydl.params['outtmpl'] = {'default': outtmpl}
+        if format_spec is not None:
+            # YoutubeDL compila el selector de formato al crearse: se recompila aquí
+            ydl.params['format'] = format_spec
+            ydl.format_selector = ydl.build_format_selector(format_spec)
+        return ydl
+    
+    def release_thread(self):
+        """Cierra las instancias del hilo actual (p.ej. al terminar un worker)"""
+        instances = getattr(self.local, 'instances', None)
+        if not instances:
+            return
+        self.local.instances = {}
+        with self.lock:
+            self.instances = [ydl for ydl in self.instances if ydl not in instances.values()]
+        for ydl in instances.values():
+            try:
+                ydl.__exit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Error al cerrar instancia YoutubeDL: {str(e)}")
+
+    def close(self):
+        """Cierra todas las instancias (guarda cookies y cierra conexiones)"""
+        with self.lock:
+            instances, self.instances = self.instances, []
+        for ydl in instances:
+            try:
+                ydl.__exit__(None, None, None)
+            except Exception as e:
+                logger.warning(f"Error al cerrar instancia YoutubeDL: {str(e)}")
+        self.local = threading.local()
+
+class TrackRecord:
+    """
+    Registro compacto de un track de Spotify con solo los datos que usan la
+    búsqueda, la descarga y los tags (se crea durante la paginación)
+    """
+    
+    __slots__ = ('track_id', 'title', 'artists', 'album', 'track_number',
+                 'release_date', 'duration_ms', 'isrc', 'cover_url', 'genre',
+                 'artist_ids', 'album_id')
+    
+    def __init__(self, track_id, title, artists, album, track_number=1, release_date='',
+                 duration_ms=None, isrc=None, cover_url=None, genre='', artist_ids=(), album_id=None):
+        self.track_id = track_id
+        self.title = title
+        self.artists = tuple(artists)
+        self.album = album
+        self.track_number = track_number
+        self.release_date = release_date
+        self.duration_ms = duration_ms
+        self.isrc = isrc
+        self.cover_url = cover_url
+        self.genre = genre
+        self.artist_ids = tuple(artist_ids)
+        self.album_id = album_id
+    
+    @classmethod
+    def from_spotify(cls, track):
+        """Crea el registro a partir de un objeto track de la API de Spotify"""
+        album = track.get('album') or {}
+        images = album.get('images') or []
+        return cls(
+            track_id=track.get('id'),
+            title=track['name'],
+            artists=[artist['name'] for artist in track.get('artists') or []],
+            artist_ids=[artist['id'] for artist in track.get('artists') or [] if artist.get('id')],
+            album=album.get('name', ''),
+            album_id=album.get('id'),
+            track_number=track.get('track_number', 1),
+            release_date=album.get('release_date', ''),
+            duration_ms=track.get('duration_ms'),
+            isrc=(track.get('external_ids') or {}).get('isrc'),
+            cover_url=images[0]['url'] if images else None,
+        )
+    
+    @property
+    def artist(self):
+        """Artista principal (el que se usa en búsqueda y tags)"""
+        return self.artists[0] if self.artists else ''
+    
+    @property
+    def label(self):
+        return f"{self.title} - {self.artist}"
+    
+    def tag_fields(self):
+        """Valores que se escriben como tags"""
+        return {
+            'title': self.title,
+            'artist': self.artist,
+            'album': self.album,
+            'genre': self.genre,
+            'track_number': self.track_number,
+            'release_date': self.release_date,
+            'cover_url': self.cover_url,
+        }
+
+class SearchCache:
+    """
+    Caché SQLite de resultados de búsqueda en YouTube.
+    Clave principal: ID de Spotify; alternativa: título + artista normalizados
+    """
+    
+    def __init__(self, db_path=SEARCH_CACHE_FILE, ttl=SEARCH_CACHE_TTL,
+                 negative_ttl=SEARCH_CACHE_NEGATIVE_TTL, max_entries=SEARCH_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                video_url TEXT,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL,
+                duration REAL
+            )
+        """)
+        # Bases creadas antes de guardar la duración del video
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(search_cache)")]
+        if 'duration' not in columns:
+            self.conn.execute("ALTER TABLE search_cache ADD COLUMN duration REAL")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_search_last_used ON search_cache(last_used)")
+        self.conn.commit()
+    
+    @staticmethod
+    def normalize(text):
+        """
+        Normaliza texto: minúsculas, sin acentos latinos ni signos de puntuación.
+        Letras y dígitos de cualquier escritura se conservan (群青, Кино, 방탄)
+        """
+        kept = []
+        latin_base = False
+        for c in unicodedata.normalize('NFKD', (text or '').casefold()):
+            if unicodedata.combining(c):
+                # Solo los acentos latinos: el dakuten japonés o la breve de й distinguen letras
+                if latin_base:
+                    continue
+            else:
+                latin_base = 'LATIN' in unicodedata.name(c, '')
+            kept.append(c)
+        text = unicodedata.normalize('NFC', ''.join(kept))
+        return re.sub(r'[\W_]+', ' ', text).strip()
+    
+    def keys_for(self, track_id, track_name, artist_name):
+        """Claves de búsqueda en orden de preferencia (sin título normalizado no hay clave alternativa)"""
+        keys = []
+        if track_id:
+            keys.append(f"id:{track_id}")
+        title = self.normalize(track_name)
+        if title:
+            keys.append(f"q:{title}|{self.normalize(artist_name)}")
+        return keys
+    
+    def get(self, track_id, track_name, artist_name, duration_ms=None):
+        """
+        Retorna (encontrado, video_url). video_url es None en un resultado
+        negativo cacheado ("no se encontró video"). Un acierto por título +
+        artista solo vale si la duración del video coincide con duration_ms
+        """
+        now = time.time()
+        with self.lock:
+            for key in self.keys_for(track_id, track_name, artist_name):
+                row = self.conn.execute(
+                    "SELECT video_url, created, duration FROM search_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if not row:
+                    continue
+                
+                video_url, created, duration = row
+                ttl = self.ttl if video_url else self.negative_ttl
+                if now - created > ttl:
+                    self.conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                    self.conn.commit()
+                    continue
+                if (video_url and key.startswith('q:')
+                        and not self.duration_matches(duration, duration_ms)):
+                    continue
+                
+                self.conn.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (now, key))
+                self.conn.commit()
+                if video_url:
+                    self.hits += 1
+                else:
+                    self.negative_hits += 1
+                return True, video_url
+            
+            self.misses += 1
+            return False, None
+    
+    @staticmethod
+    def duration_matches(duration, duration_ms):
+        """True si la duración del video (s) coincide con la del track (ms); sin ambas no se da por buena"""
+        if not duration or not duration_ms:
+            return False
+        return abs(duration - duration_ms / 1000) <= SEARCH_DURATION_TOLERANCE
+    
+    def put(self, track_id, track_name, artist_name, video_url, duration=None):
+        """Guarda un resultado (video_url=None para un resultado negativo; duration del video en segundos)"""
+        now = time.time()
+        with self.lock:
+            for key in self.keys_for(track_id, track_name, artist_name):
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO search_cache (key, video_url, created, last_used, duration) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, video_url, now, now, duration)
+                )
+            self.evict()
+            self.conn.commit()
+    
+    def evict(self):
+        """Desaloja las entradas menos usadas recientemente si se supera el límite"""
+        count = self.conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self.conn.execute(
+                "DELETE FROM search_cache WHERE key IN "
+                "(SELECT key FROM search_cache ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+            )
+    
+    def stats(self):
+        """Contadores de uso de la caché"""
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.negative_hits) / lookups if lookups else 0.0,
+        }
+
+class MetadataCache:
+    """
+    Caché SQLite de metadata de Spotify por ID ('album' o 'artist'), con TTL.
+    Guarda solo los campos usados en los tags (géneros y datos de lanzamiento)
+    """
+    
+    def __init__(self, db_path=METADATA_CACHE_FILE, ttl=METADATA_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS spotify_metadata (
+                kind TEXT NOT NULL,
+                id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                created REAL NOT NULL,
+                PRIMARY KEY (kind, id)
+            )
+        """)
+        self.conn.commit()
+    
+    def get_many(self, kind, ids):
+        """Retorna {id: datos} de los IDs cacheados y vigentes"""
+        found = {}
+        now = time.time()
+        with self.lock:
+            for item_id in ids:
+                row = self.conn.execute(
+                    "SELECT data, created FROM spotify_metadata WHERE kind = ? AND id = ?", (kind, item_id)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    found[item_id] = json.loads(row[0])
+            self.hits += len(found)
+            self.misses += len(ids) - len(found)
+        return found
+    
+    def put_many(self, kind, items):
+        """Guarda {id: datos}"""
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO spotify_metadata (kind, id, data, created) VALUES (?, ?, ?, ?)",
+                [(kind, item_id, json.dumps(data, ensure_ascii=False), now) for item_id, data in items.items()]
+            )
+            self.conn.commit()
+
+class StrategyStats:
+    """
+    Estadísticas persistentes de éxito y latencia por estrategia de descarga
+    (formato, cliente del reproductor o fallback), con decaimiento exponencial.
+    Ordena las estrategias por éxito esperado por segundo
+    """
+    
+    def __init__(self, path=STRATEGY_STATS_FILE, half_life=STRATEGY_STATS_HALF_LIFE,
+                 prior_latency=STRATEGY_PRIOR_LATENCY):
+        self.path = path
+        self.half_life = half_life
+        self.prior_latency = prior_latency
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.load()
+    
+    def load(self):
+        """Carga las estadísticas guardadas"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.stats = json.load(f)
+        except Exception as e:
+            logger.warning(f"Estadísticas de estrategias inválidas, se ignoran: {str(e)}")
+    
+    def save(self):
+        """Guarda las estadísticas de forma atómica"""
+        with self.lock:
+            data = json.dumps(self.stats, indent=2)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+    
+    def entry(self, key, now):
+        """Entrada de una estrategia con el decaimiento aplicado hasta ahora"""
+        entry = self.stats.setdefault(key, {'success': 0.0, 'failure': 0.0, 'time': 0.0, 'updated': now})
+        factor = 0.5 ** (max(0.0, now - entry['updated']) / self.half_life)
+        for field in ('success', 'failure', 'time'):
+            entry[field] *= factor
+        entry['updated'] = now
+        return entry
+    
+    def record(self, key, success, elapsed):
+        """Registra el resultado de un intento"""
+        with self.lock:
+            entry = self.entry(key, time.time())
+            entry['success' if success else 'failure'] += 1
+            entry['time'] += elapsed
+    
+    def score(self, key):
+        """Éxito esperado por segundo (con prior de Laplace para estrategias nuevas)"""
+        with self.lock:
+            entry = self.entry(key, time.time())
+            attempts = entry['success'] + entry['failure']
+            probability = (entry['success'] + 1) / (attempts + 2)
+            latency = (entry['time'] + self.prior_latency) / (attempts + 1)
+        return probability / latency
+    
+    def order(self, keys):
+        """Ordena las estrategias; ante empate se conserva el orden original"""
+        scores = {key: self.score(key) for key in keys}
+        return sorted(keys, key=lambda key: -scores[key])
+
+class CoverCache:
+    """
+    Caché de carátulas direccionada por hash de la URL: LRU en memoria delante
+    de un directorio en disco con límite de tamaño. Las descargas usan una
+    sesión HTTP compartida con keep-alive
+    """
+    
+    def __init__(self, cache_dir=COVER_CACHE_DIR, max_bytes=COVER_CACHE_MAX_BYTES,
+                 memory_items=COVER_CACHE_MEMORY_ITEMS):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.url_locks = {}
+        self.hits = 0
+        self.misses = 0
+        import requests
+        self.session = requests.Session()
+        os.makedirs(cache_dir, exist_ok=True)
+    
+    def path_for(self, url):
+        """Ruta en disco de la carátula de una URL"""
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode('utf-8')).hexdigest() + '.jpg')
+    
+    def get(self, url):
+        """Retorna los bytes de la carátula, descargándola solo si no está cacheada"""
+        with self.lock:
+            if url in self.memory:
+                self.memory.move_to_end(url)
+                self.hits += 1
+                return self.memory[url]
+            # Un lock por URL para que cada carátula se descargue una sola vez
+            url_lock = self.url_locks.setdefault(url, threading.Lock())
+        
+        with url_lock:
+            with self.lock:
+                if url in self.memory:
+                    self.hits += 1
+                    return self.memory[url]
+            
+            path = self.path_for(url)
+            data = None
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)  # Marca de uso para el desalojo LRU
+                with self.lock:
+                    self.hits += 1
+            else:
+                response = self.session.get(url, timeout=10)
+                if response.status_code != 200:
+                    return None
+                data = response.content
+                tmp_path = path + '.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+                with self.lock:
+                    self.misses += 1
+                self.evict()
+            
+            with self.lock:
+                self.memory[url] = data
+                self.memory.move_to_end(url)
+                while len(self.memory) > self.memory_items:
+                    self.memory.popitem(last=False)
+                self.url_locks.pop(url, None)
+            return data
+    
+    def get_path(self, url):
+        """Ruta en disco de la carátula (para pasársela a FFmpeg), o None"""
+        data = self.get(url)
+        if not data:
+            return None
+        path = self.path_for(url)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            # Desalojada del disco pero aún en memoria
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return path
+    
+    def evict(self):
+        """Desaloja del disco las carátulas menos usadas si se supera el límite"""
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+class SyncManifest:
+    """
+    Manifiesto de sincronización de una playlist: snapshot_id de Spotify y,
+    por cada track ID, el archivo generado, la URL de YouTube y el hash de tags
+    """
+    
+    def __init__(self, output_dir, playlist_id):
+        self.path = os.path.join(output_dir, SYNC_MANIFEST_FILE.format(playlist_id=playlist_id))
+        self.playlist_id = playlist_id
+        self.snapshot_id = None
+        self.tracks = {}
+        self.load()
+    
+    def load(self):
+        """Carga el manifiesto si existe"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.snapshot_id = data.get('snapshot_id')
+            self.tracks = data.get('tracks', {})
+        except Exception as e:
+            logger.warning(f"Manifiesto inválido, se ignora: {str(e)}")
+    
+    def save(self):
+        """Guarda el manifiesto de forma atómica"""
+        data = {
+            'playlist_id': self.playlist_id,
+            'snapshot_id': self.snapshot_id,
+            'updated': datetime.now().isoformat(),
+            'tracks': self.tracks,
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+    
+    @staticmethod
+    def tag_hash(track):
+        """Hash estable de los valores usados para los tags"""
+        payload = json.dumps(track.tag_fields(), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+    
+    def is_unchanged(self, snapshot_id):
+        """True si la playlist no cambió y todos sus archivos siguen en disco"""
+        if not snapshot_id or self.snapshot_id != snapshot_id:
+            return False
+        return all(os.path.exists(entry['file']) for entry in self.tracks.values())
+    
+    def get(self, track_id):
+        """Entrada del manifiesto si el archivo sigue existiendo"""
+        entry = self.tracks.get(track_id)
+        if entry and os.path.exists(entry['file']):
+            return entry
+        return None
+    
+    def record(self, track, file_path, youtube_url):
+        """Registra un track descargado"""
+        self.tracks[track.track_id] = {
+            'file': file_path,
+            'youtube_url': youtube_url,
+            'tag_hash': self.tag_hash(track),
+        }
+    
+    def removed_tracks(self, current_ids):
+        """Track IDs del manifiesto que ya no están en la playlist"""
+        return [track_id for track_id in self.tracks if track_id not in current_ids]
+    
+    def prune(self, track_ids):
+        """Elimina del disco y del manifiesto los tracks indicados"""
+        for track_id in track_ids:
+            entry = self.tracks.pop(track_id, None)
+            if entry and os.path.exists(entry['file']):
+                os.remove(entry['file'])
+                logger.info(f"🗑️ Eliminado (ya no está en la playlist): {entry['file']}")
+
+class DownloadJournal:
+    """
+    Journal de avance de una playlist (JSON Lines, solo se añaden líneas).
+    Cada etapa completada de una canción (searched, downloaded, converted,
+    tagged) se escribe y sincroniza a disco antes de seguir, así que tras una
+    caída el siguiente run retoma cada canción desde su última etapa
+    """
+    
+    def __init__(self, output_dir, playlist_id):
+        self.path = os.path.join(output_dir, JOURNAL_FILE.format(playlist_id=playlist_id))
+        self.lock = threading.Lock()
+        self.entries = {}
+        # Si el journal existe, el run anterior no terminó
+        self.interrupted = os.path.exists(self.path)
+        self.load()
+        self.compact()
+        self.file = open(self.path, 'a', encoding='utf-8')
+    
+    def load(self):
+        """Carga la última etapa registrada de cada canción"""
+        if not self.interrupted:
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Última línea truncada por la caída
+                    continue
+                self.entries[entry['key']] = entry
+    
+    def compact(self):
+        """Reescribe el journal con una sola línea por canción (de forma atómica)"""
+        if not self.entries:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+    
+    @staticmethod
+    def key_for(job):
+        """Clave de la canción en el journal"""
+        return job['track'].track_id or job['clean_filename']
+    
+    def get(self, job):
+        """Última entrada registrada para el trabajo, o None"""
+        return self.entries.get(self.key_for(job))
+    
+    def record(self, job, stage):
+        """Registra que el trabajo completó una etapa"""
+        entry = {
+            'key': self.key_for(job),
+            'stage': stage,
+            'youtube_url': job['youtube_url'],
+            'file': job['file_path'],
+            'time': time.time(),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self.lock:
+            self.entries[entry['key']] = entry
+            if self.file:
+                self.file.write(line)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+    
+    def close(self, completed=False):
+        """Cierra el journal; si la playlist terminó sin fallos ya no hace falta"""
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+            if completed and os.path.exists(self.path):
+                os.remove(self.path)
+
+class TrackLibrary:
+    """
+    Almacén de audio direccionado por ID de Spotify. Las playlists reciben
+    enlaces al archivo y un contador de referencias permite borrar los
+    archivos que ya no usa ninguna playlist
+    """
+    
+    def __init__(self, library_dir):
+        self.library_dir = library_dir
+        os.makedirs(library_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(library_dir, LIBRARY_DB_FILE), check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS library_files (key TEXT PRIMARY KEY, file TEXT NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS library_refs (path TEXT PRIMARY KEY, key TEXT NOT NULL)")
+        self.conn.commit()
+    
+    @staticmethod
+    def key_for(track):
+        """
+        Clave del track: su ID de Spotify. No se usa el ISRC: la misma grabación
+        en un recopilatorio o una edición deluxe lleva otros tags (álbum, número,
+        carátula) y el enlace compartiría el archivo etiquetado del primero
+        """
+        if track.track_id:
+            return f"spotify-{track.track_id}"
+        return None
+    
+    def lookup(self, key):
+        """Ruta del archivo almacenado para la clave, si existe"""
+        with self.lock:
+            row = self.conn.execute("SELECT file FROM library_files WHERE key = ?", (key,)).fetchone()
+        if row and os.path.exists(row[0]):
+            return row[0]
+        return None
+    
+    def link(self, key, stored_path, output_base):
+        """Enlaza el archivo almacenado en la playlist y registra la referencia"""
+        target = output_base + os.path.splitext(stored_path)[1]
+        if os.path.lexists(target):
+            os.remove(target)
+        try:
+            os.link(stored_path, target)
+        except OSError:
+            try:
+                os.symlink(os.path.abspath(stored_path), target)
+            except OSError:
+                shutil.copy2(stored_path, target)
+        
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO library_refs (path, key) VALUES (?, ?)",
+                              (os.path.abspath(target), key))
+            self.conn.commit()
+        return target
+    
+    def store(self, key, file_path, output_base):
+        """
+        Mueve un archivo recién descargado al almacén y lo enlaza en su lugar.
+        Si otro worker ya almacenó la misma clave se reutiliza ese archivo
+        """
+        extension = os.path.splitext(file_path)[1]
+        stored_path = os.path.join(self.library_dir, key[-2:], key + extension)
+        with self.lock:
+            existing = self.conn.execute("SELECT file FROM library_files WHERE key = ?", (key,)).fetchone()
+            if existing and os.path.exists(existing[0]):
+                stored_path = existing[0]
+                os.remove(file_path)
+            else:
+                os.makedirs(os.path.dirname(stored_path), exist_ok=True)
+                os.replace(file_path, stored_path)
+                self.conn.execute("INSERT OR REPLACE INTO library_files (key, file) VALUES (?, ?)",
+                                  (key, stored_path))
+                self.conn.commit()
+        return self.link(key, stored_path, output_base)
+    
+    def collect_garbage(self):
+        """Elimina referencias a enlaces borrados y los archivos sin referencias"""
+        with self.lock:
+            refs = self.conn.execute("SELECT path FROM library_refs").fetchall()
+            stale = [(path,) for (path,) in refs if not os.path.lexists(path)]
+            self.conn.executemany("DELETE FROM library_refs WHERE path = ?", stale)
+            
+            orphans = self.conn.execute(
+                "SELECT key, file FROM library_files WHERE key NOT IN (SELECT key FROM library_refs)"
+            ).fetchall()
+            for key, file_path in orphans:
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                self.conn.execute("DELETE FROM library_files WHERE key = ?", (key,))
+            self.conn.commit()
+        
+        if orphans:
+            logger.info(f"🗑️ Biblioteca: {len(orphans)} archivos sin referencias eliminados")
+        return len(orphans)
+
+class RunMetrics:
+    """
+    Métricas de una ejecución: histogramas (latencia por etapa, estrategia,
+    FFmpeg, carátulas), contadores (bytes, intentos, cachés) y gauges
+    (utilización de workers). Se exportan como reporte JSON y como archivo
+    de texto de Prometheus (para el textfile collector de node_exporter)
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+    
+    @staticmethod
+    def key(name, labels):
+        """Clave interna: nombre + labels ordenados"""
+        return name, tuple(sorted(labels.items()))
+    
+    def observe(self, name, value, **labels):
+        """Añade una observación al histograma indicado"""
+        buckets = METRICS_BUCKETS.get(name, METRICS_LATENCY_BUCKETS)
+        with self.lock:
+            histogram = self.histograms.setdefault(self.key(name, labels), {
+                'buckets': [0] * len(buckets), 'count': 0, 'sum': 0.0, 'max': 0.0,
+            })
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['count'] += 1
+            histogram['sum'] += value
+            histogram['max'] = max(histogram['max'], value)
+    
+    def increment(self, name, value=1, **labels):
+        """Suma value al contador indicado"""
+        key = self.key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+    
+    def set_gauge(self, name, value, **labels):
+        """Fija el valor de un gauge"""
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+    
+    @staticmethod
+    def label_text(labels, quoted=False):
+        """Labels como texto: stage=search (JSON) o stage="search" (Prometheus)"""
+        if quoted:
+            escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            return ','.join(f'{k}="{escape(v)}"' for k, v in labels)
+        return ','.join(f"{k}={v}" for k, v in labels)
+    
+    def report(self, **info):
+        """Reporte de la ejecución como diccionario serializable en JSON"""
+        report = dict(info, started=datetime.fromtimestamp(self.started).isoformat(),
+                      elapsed_seconds=round(time.time() - self.started, 3),
+                      histograms={}, counters={}, gauges={})
+        with self.lock:
+            for (name, labels), h in sorted(self.histograms.items()):
+                buckets = METRICS_BUCKETS.get(name, METRICS_LATENCY_BUCKETS)
+                report['histograms'].setdefault(name, {})[self.label_text(labels)] = {
+                    'count': h['count'],
+                    'sum': round(h['sum'], 3),
+                    'mean': round(h['sum'] / h['count'], 3) if h['count'] else 0.0,
+                    'max': round(h['max'], 3),
+                    'buckets': {str(bound): n for bound, n in zip(buckets, h['buckets'])},
+                }
+            for kind in ('counters', 'gauges'):
+                for (name, labels), value in sorted(getattr(self, kind).items()):
+                    report[kind].setdefault(name, {})[self.label_text(labels)] = value
+        return report
+    
+    def prometheus_series(self, **extra):
+        """
+        Series de Prometheus agrupadas por métrica: {métrica: (tipo, [líneas])}.
+        extra se añade a los labels de todas las series (p.ej. playlist)
+        """
+        extra_labels = tuple(sorted(extra.items()))
+        families = {}
+        with self.lock:
+            for (name, labels), h in sorted(self.histograms.items()):
+                metric = f"{METRICS_PREFIX}_{name}"
+                buckets = METRICS_BUCKETS.get(name, METRICS_LATENCY_BUCKETS)
+                lines = families.setdefault(metric, ('histogram', []))[1]
+                base = self.label_text(extra_labels + labels, quoted=True)
+                prefix = base + ',' if base else ''
+                for bound, n in zip(buckets, h['buckets']):
+                    lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {n}')
+                lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {h["count"]}')
+                braces = f"{{{base}}}" if base else ''
+                lines.append(f"{metric}_sum{braces} {h['sum']}")
+                lines.append(f"{metric}_count{braces} {h['count']}")
+            
+            for kind, suffix, values in (('counter', '_total', self.counters), ('gauge', '', self.gauges)):
+                for (name, labels), value in sorted(values.items()):
+                    metric = f"{METRICS_PREFIX}_{name}{suffix}"
+                    lines = families.setdefault(metric, (kind, []))[1]
+                    base = self.label_text(extra_labels + labels, quoted=True)
+                    lines.append(f"{metric}{{{base}}} {value}" if base else f"{metric} {value}")
+        return families
+    
+    @staticmethod
+    def prometheus_text(runs):
+        """
+        Métricas de varias ejecuciones [(labels, RunMetrics)] en formato de
+        exposición de texto de Prometheus: un solo bloque TYPE por métrica
+        """
+        families = {}
+        for labels, metrics in runs:
+            for metric, (kind, lines) in metrics.prometheus_series(**labels).items():
+                families.setdefault(metric, (kind, []))[1].extend(lines)
+        text = []
+        for metric, (kind, lines) in sorted(families.items()):
+            text.append(f"# TYPE {metric} {kind}")
+            text.extend(lines)
+        return '\n'.join(text) + '\n'
+    
+    def write_report(self, path, **info):
+        """Guarda el reporte JSON de forma atómica"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(**info), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+    
+    @classmethod
+    def write_prometheus(cls, path, runs):
+        """Guarda las métricas para Prometheus de forma atómica (el collector nunca lee un archivo a medias)"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(cls.prometheus_text(runs))
+        os.replace(tmp_path, path)
+
+class PlaylistPipeline:
+    """
+    Pipeline concurrente por etapas: búsqueda -> descarga -> FFmpeg -> metadata.
+    Las etapas se comunican con colas acotadas; la conversión corre en el
+    TranscodeScheduler del downloader (procesos)
+    """
+    
+    STAGES = ('search', 'download', 'transcode', 'tag')
+    
+    def __init__(self, downloader, workers=None, queue_size=PIPELINE_QUEUE_SIZE):
+        self.downloader = downloader
+        self.workers = dict(PIPELINE_WORKERS)
+        if workers:
+            self.workers.update(workers)
+        # Con el ajuste automático hay un hilo por cada plaza posible y el
+        # controlador decide cuántas descargas corren a la vez
+        self.controller = downloader.download_controller
+        self.autotune = self.controller.autotune and 'download' not in (workers or {})
+        if self.autotune:
+            self.workers['download'] = self.controller.maximum
+        # 'transcode' fija los procesos FFmpeg; la etapa tiene el doble de hilos
+        downloader.transcoder.resize(self.workers['transcode'])
+        self.workers['transcode'] = 2 * self.workers['transcode']
+        self.queue_size = queue_size
+        self.lock = threading.Lock()
+        self.downloaded_count = 0
+        self.failed = []
+        self.busy = {stage: 0.0 for stage in self.STAGES}
+    
+    def run(self, jobs):
+        """Ejecuta el pipeline y retorna (downloaded_count, failed_tracks)"""
+        queues = {stage: queue.Queue(maxsize=self.queue_size) for stage in self.STAGES}
+        handlers = {
+            'search': self.search_stage,
+            'download': self.download_stage,
+            'transcode': self.transcode_stage,
+            'tag': self.tag_stage,
+        }
+        
+        started = time.time()
+        threads = []
+        for pos, stage in enumerate(self.STAGES):
+            if pos + 1 < len(self.STAGES):
+                next_queue = queues[self.STAGES[pos + 1]]
+                next_workers = self.workers[self.STAGES[pos + 1]]
+            else:
+                next_queue, next_workers = None, 0
+            remaining = [self.workers[stage]]
+            for n in range(self.workers[stage]):
+                thread = threading.Thread(
+                    target=self.worker,
+                    args=(stage, handlers[stage], queues[stage], next_queue, next_workers, remaining),
+                    name=f"{stage}-{n}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+        
+        try:
+            for job in jobs:
+                queues['search'].put(job)
+        finally:
+            # También si la paginación falla: los workers terminan lo encolado
+            for _ in range(self.workers['search']):
+                queues['search'].put(None)
+            for thread in threads:
+                thread.join()
+        
+        # Utilización: fracción del tiempo que los workers de cada etapa estuvieron ocupados
+        elapsed = max(time.time() - started, 1e-6)
+        metrics = self.downloader.metrics
+        for stage in self.STAGES:
+            metrics.set_gauge('pipeline_workers', self.workers[stage], stage=stage)
+            metrics.set_gauge('worker_utilisation', round(self.busy[stage] / (self.workers[stage] * elapsed), 4),
+                              stage=stage)
+        
+        # Mantener el orden de la playlist en el reporte de fallos
+        failed_tracks = [entry for _, entry in sorted(self.failed, key=lambda item: item[0])]
+        return self.downloaded_count, failed_tracks
+    
+    def worker(self, stage, handler, in_queue, out_queue, out_workers, remaining):
+        """Consume trabajos de una etapa y los pasa a la siguiente"""
+        while True:
+            job = in_queue.get()
+            if job is None:
+                break
+            
+            set_log_context(job['track'].track_id, stage)
+            started = time.time()
+            try:
+                ok = handler(job)
+            except Exception as e:
+                logger.error("❌ Error en %s (%s): %s", threading.current_thread().name, job['label'], e)
+                ok = False
+            elapsed = time.time() - started
+            self.downloader.metrics.observe('stage_seconds', elapsed, stage=stage)
+            with self.lock:
+                self.busy[stage] += elapsed
+            
+            if not ok:
+                with self.lock:
+                    self.failed.append((job['index'], self.downloader.failure_entry(job)))
+            elif out_queue is not None and not job['done']:
+                out_queue.put(job)
+            else:
+                # Final del pipeline (o ya resuelto desde la biblioteca)
+                job['done'] = True
+                with self.lock:
+                    self.downloaded_count += 1
+                logger.info(f"✅ Descargado: {os.path.basename(job['file_path'])}")
+            set_log_context()
+        
+        # Las instancias YoutubeDL de este hilo no se vuelven a usar
+        self.downloader.ydl_pool.release_thread()
+        
+        # El último worker de la etapa avisa a todos los de la siguiente
+        with self.lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last and out_queue is not None:
+            for _ in range(out_workers):
+                out_queue.put(None)
+    
+    def search_stage(self, job):
+        """Etapa 1: busca el video en YouTube"""
+        logger.info(f"Procesando [{job['index']+1}/{job['total']}]: {job['label']}")
+        if job['done']:
+            logger.info(f"⏩ Completado en una ejecución anterior: {job['label']}")
+            return True
+        if self.downloader.link_from_library(job):
+            return True
+        if job['youtube_url']:
+            # Retomado desde el journal: la búsqueda ya se hizo
+            return True
+        job['youtube_url'] = self.downloader.search_youtube(job['track'], job)
+        if not job['youtube_url']:
+            logger.warning("No se encontró video para: %s [%s]", job['label'], job['error_class'])
+            return False
+        self.downloader.mark_stage(job, 'searched')
+        return True
+    
+    def download_stage(self, job):
+        """Etapa 2: descarga el audio sin convertir"""
+        if job['stage'] in ('downloaded', 'converted'):
+            return True
+        # Con el ajuste automático solo la transferencia ocupa plaza del
+        # controlador (no las esperas del circuito, la identidad o el limitador)
+        job['file_path'] = self.downloader.fetch_audio(job['youtube_url'], job['output_path'],
+                                                       transcode=False, track=job['track'], job=job,
+                                                       controlled=self.autotune)
+        
+        if not job['file_path']:
+            logger.error("❌ Todas las estrategias fallaron para: %s", job['track'].title)
+            return False
+        self.downloader.mark_stage(job, 'downloaded')
+        return True
+    
+    def transcode_stage(self, job):
+        """Etapa 3: convierte al formato de salida en el planificador de FFmpeg"""
+        if job['stage'] == 'converted':
+            return True
+        input_path = job['file_path']
+        if self.downloader.output_format == 'original':
+            # Copia del stream al contenedor de su códec (sin recodificar)
+            returncode, stderr, final_path = self.downloader.run_transcode(
+                run_ffmpeg_passthrough, input_path, job['output_path'], duration_ms=job['track'].duration_ms)
+        else:
+            if input_path.endswith('.mp3'):
+                self.downloader.mark_stage(job, 'converted')
+                return True
+            final_path = job['output_path'] + '.mp3'
+            # Los tags y la carátula se escriben en la misma pasada
+            tags, cover_path = self.downloader.encode_tags(job['track'])
+            returncode, stderr = self.downloader.run_transcode(
+                run_ffmpeg_mp3, input_path, final_path, tags, cover_path, duration_ms=job['track'].duration_ms)
+        
+        if returncode != 0:
+            logger.error("❌ Error en conversión FFmpeg: %s", tail_text(stderr))
+            return False
+        
+        if final_path != input_path:
+            logger.info(f"✅ Conversión exitosa: {input_path} -> {final_path}")
+            if os.path.exists(input_path):
+                os.remove(input_path)
+        job['file_path'] = final_path
+        self.downloader.mark_stage(job, 'converted')
+        return True
+    
+    def tag_stage(self, job):
+        """Etapa 4: añade la metadata y guarda el archivo en la biblioteca"""
+        self.downloader.add_metadata(job['file_path'], job['track'])
+        self.downloader.store_in_library(job)
+        self.downloader.mark_stage(job, 'tagged')
+        return True
+
+class SpotifyDownloader:
+    def __init__(self, output_format=OUTPUT_FORMAT, interactive=True, keep_alive=False,
+                 client_id=None, client_secret=None, redirect_uri=None, username=None,
+                 cookies_file=YT_COOKIES_FILE, library_dir=LIBRARY_DIR, stream_transcode=STREAM_TRANSCODE,
+                 metrics_file=METRICS_PROMETHEUS_FILE, identities=YT_IDENTITIES,
+                 identity_health_url=IDENTITY_HEALTH_URL, bandwidth_limit=BANDWIDTH_LIMIT,
+                 bandwidth_limit_hours=BANDWIDTH_LIMIT_HOURS):
+        """
+        interactive=False evita cualquier input() (modo batch).
+        keep_alive=True mantiene pools y autenticación entre playlists;
+        en ese caso hay que llamar a close() al terminar.
+        library_dir activa la biblioteca compartida entre playlists.
+        stream_transcode=True codifica a MP3 mientras se descarga.
+        metrics_file escribe al cerrar las métricas de todas las playlists del run
+        (label playlist) en formato Prometheus.
+        identities reparte el tráfico de YouTube entre varias identidades (ver YT_IDENTITIES).
+        bandwidth_limit limita el ancho de banda total de las descargas (bytes/s),
+        solo entre las horas de bandwidth_limit_hours si se indican
+        """
+        if output_format not in ('mp3', 'original'):
+            raise ValueError(f"Formato de salida no válido: {output_format}")
+        self.output_format = output_format
+        self.interactive = interactive
+        self.keep_alive = keep_alive
+        self.stream_transcode = stream_transcode
+        self.metrics_file = metrics_file
+        self.metrics = RunMetrics()
+        # Métricas de cada playlist del run (playlist_id -> RunMetrics)
+        self.playlist_metrics = {}
+        
+        import spotipy
+        from spotipy.oauth2 import SpotifyOAuth
+        
+        try:
+            self.sp = spotipy.Spotify(auth_manager=SpotifyOAuth(
+                client_id=client_id or SPOTIFY_CLIENT_ID,
+                client_secret=client_secret or SPOTIFY_CLIENT_SECRET,
+                redirect_uri=redirect_uri or SPOTIFY_REDIRECT_URI,
+                scope=SCOPE,
+                username=username or SPOTIFY_USERNAME,
+                open_browser=interactive
+            ))
+            logger.info("Autenticación con Spotify exitosa")
+            
+            # Inicializar autenticador de YouTube
+            self.yt_auth = YouTubeAuthenticator(interactive=interactive, cookies_file=cookies_file)
+            
+            # Caché persistente de búsquedas
+            self.search_cache = SearchCache()
+            
+            # Caché persistente de metadata de álbumes y artistas
+            self.metadata_cache = MetadataCache()
+            
+            # Instancias YoutubeDL reutilizables
+            self.ydl_pool = YoutubeDLPool()
+            
+            # Orden adaptativo de las estrategias de descarga
+            self.strategy_stats = StrategyStats()
+            
+            # Caché de carátulas
+            self.cover_cache = CoverCache()
+            
+            # Planificador de conversiones FFmpeg (también reparte los FFmpeg en streaming)
+            self.transcoder = TranscodeScheduler()
+            
+            # Identidades de YouTube, cada una con su limitador de peticiones
+            self.identities = IdentityPool.from_config(identities, self.yt_auth, self.ydl_pool,
+                                                       health_url=identity_health_url)
+            
+            # Pausa de la etapa de descarga ante picos de detección de bot
+            self.circuit_breaker = CircuitBreaker()
+            
+            # Descargas simultáneas según el throughput y límite de ancho de banda
+            self.download_controller = DownloadController(bandwidth_limit=bandwidth_limit,
+                                                          limit_hours=bandwidth_limit_hours)
+            
+            # Biblioteca compartida entre playlists (opcional)
+            self.library = TrackLibrary(library_dir) if library_dir else None
+            
+        except Exception as e:
+            logger.error(f"Error en autenticación: {str(e)}")
+            raise
+
+    def setup_youtube_auth(self):
+        """Configura la autenticación de YouTube (una sola vez si keep_alive)"""
+        if self.keep_alive and self.yt_auth.auth_method is not None:
+            return True
+        return self.yt_auth.setup_authentication()
+
+    def close(self):
+        """
+        Libera pools compartidos, guarda las estadísticas, limpia la biblioteca
+        y escribe las métricas de Prometheus del run
+        """
+        self.ydl_pool.close()
+        self.transcoder.close()
+        self.strategy_stats.save()
+        if self.library:
+            self.library.collect_garbage()
+        self.write_prometheus()
+
+    def write_prometheus(self):
+        """Escribe en metrics_file las métricas de todas las playlists del run (una vez por run)"""
+        if not self.metrics_file or not self.playlist_metrics:
+            return
+        runs = [({'playlist': playlist_id}, metrics) for playlist_id, metrics in self.playlist_metrics.items()]
+        try:
+            RunMetrics.write_prometheus(self.metrics_file, runs)
+            logger.info(f"📊 Métricas de Prometheus: {self.metrics_file}")
+        except OSError as e:
+            logger.warning(f"No se pudieron escribir las métricas de Prometheus: {str(e)}")
+
+    def link_from_library(self, job):
+        """Si la canción ya está en la biblioteca la enlaza en la playlist y marca el trabajo"""
+        if not self.library:
+            return False
+        key = TrackLibrary.key_for(job['track'])
+        stored_path = key and self.library.lookup(key)
+        if not stored_path:
+            return False
+        
+        job['file_path'] = self.library.link(key, stored_path, job['output_path'])
+        job['done'] = True
+        self.metrics.increment('library_hits')
+        logger.info(f"📚 Desde biblioteca: {job['label']}")
+        return True
+
+    def store_in_library(self, job):
+        """Mueve el archivo descargado a la biblioteca y deja un enlace en la playlist"""
+        if not self.library or not job['file_path']:
+            return
+        key = TrackLibrary.key_for(job['track'])
+        if key:
+            job['file_path'] = self.library.store(key, job['file_path'], job['output_path'])
+
+    def clean_filename(self, filename):
+        """
+        Limpia el nombre de archivo removiendo caracteres no válidos
+        y reemplazando espacios con guiones bajos
+        """
+        # Caracteres no permitidos en nombres de archivo
+        invalid_chars = '<>:"/\\|?*\'"'
+        
+        # Remover caracteres inválidos
+        for char in invalid_chars:
+            filename = filename.replace(char, '')
+        
+        # Reemplazar múltiples espacios con un solo guión bajo
+        filename = re.sub(r'\s+', '_', filename)
+        
+        # Remover guiones bajos al inicio y final
+        filename = filename.strip('_')
+        
+        # Limitar longitud del nombre (máximo 100 caracteres)
+        if len(filename) > 100:
+            filename = filename[:100]
+        
+        return filename
+
+    def get_playlist_tracks(self, playlist_id):
+        """Obtiene todas las canciones de una playlist"""
+        tracks = list(self.iter_playlist_tracks(playlist_id))
+        logger.info(f"Se encontraron {len(tracks)} canciones en la playlist")
+        return tracks
+
+    def iter_playlist_tracks(self, playlist_id, total=None):
+        """
+        Genera los TrackRecord de la playlist en orden mientras se descargan.
+        Tras conocer el total, el resto de páginas se piden en paralelo
+        """
+        try:
+            if total is None:
+                first_page = self.fetch_playlist_page(playlist_id, 0, with_total=True)
+                total = first_page['total']
+                yield from self.enrich_records(self.page_records(first_page))
+                start = SPOTIFY_PAGE_SIZE
+            else:
+                start = 0
+            
+            offsets = range(start, total, SPOTIFY_PAGE_SIZE)
+            with ThreadPoolExecutor(max_workers=SPOTIFY_PAGE_WORKERS) as executor:
+                pages = [executor.submit(self.fetch_page_records, playlist_id, offset) for offset in offsets]
+                for page in pages:
+                    yield from page.result()
+        except Exception as e:
+            logger.error(f"Error al obtener tracks: {str(e)}")
+            raise
+
+    def fetch_page_records(self, playlist_id, offset):
+        """Página de la playlist como TrackRecord ya completados con géneros"""
+        return self.enrich_records(self.page_records(self.fetch_playlist_page(playlist_id, offset)))
+
+    def enrich_records(self, records):
+        """
+        Completa géneros y fecha de lanzamiento de una página de tracks con
+        llamadas en lote a sp.albums y sp.artists (solo para los IDs que no
+        están en la caché de metadata). Retorna la misma lista
+        """
+        present = [record for record in records if record]
+        try:
+            albums = self.lookup_metadata('album', {r.album_id for r in present if r.album_id})
+            artists = self.lookup_metadata('artist', {i for r in present for i in r.artist_ids})
+        except Exception as e:
+            logger.warning(f"No se pudo obtener la metadata de álbumes/artistas: {str(e)}")
+            return records
+        
+        for record in present:
+            album = albums.get(record.album_id) or {}
+            # Géneros del álbum (casi siempre vacíos) o de sus artistas, empezando por el principal
+            genres = list(album.get('genres') or [])
+            for artist_id in record.artist_ids:
+                genres += [g for g in (artists.get(artist_id) or {}).get('genres', []) if g not in genres]
+            if genres:
+                record.genre = '; '.join(genres[:METADATA_MAX_GENRES])
+            if len(album.get('release_date') or '') > len(record.release_date or ''):
+                record.release_date = album['release_date']
+        return records
+
+    def lookup_metadata(self, kind, ids):
+        """Metadata {id: datos} de álbumes o artistas: caché primero y el resto en lotes"""
+        ids = sorted(ids)
+        found = self.metadata_cache.get_many(kind, ids)
+        missing = [item_id for item_id in ids if item_id not in found]
+        
+        batch_size = SPOTIFY_ALBUMS_BATCH if kind == 'album' else SPOTIFY_ARTISTS_BATCH
+        for start in range(0, len(missing), batch_size):
+            batch = missing[start:start + batch_size]
+            if kind == 'album':
+                response = self.spotify_call(self.sp.albums, batch)
+                fetched = {album['id']: {
+                    'genres': album.get('genres') or [],
+                    'release_date': album.get('release_date') or '',
+                    'release_date_precision': album.get('release_date_precision'),
+                    'label': album.get('label'),
+                } for album in response['albums'] if album}
+            else:
+                response = self.spotify_call(self.sp.artists, batch)
+                fetched = {artist['id']: {'genres': artist.get('genres') or []}
+                           for artist in response['artists'] if artist}
+            self.metrics.increment('spotify_requests', endpoint=kind + 's')
+            self.metadata_cache.put_many(kind, fetched)
+            found.update(fetched)
+        return found
+
+    def spotify_call(self, func, *args, **kwargs):
+        """Llama a la API de Spotify respetando Retry-After en HTTP 429"""
+        from spotipy import SpotifyException
+        
+        for attempt in range(SPOTIFY_MAX_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status != 429 or attempt == SPOTIFY_MAX_RETRIES:
+                    raise
+                headers = getattr(e, 'headers', None) or {}
+                retry_after = int(headers.get('Retry-After', 1))
+                logger.warning(f"Spotify HTTP 429, reintentando en {retry_after}s")
+                time.sleep(retry_after)
+
+    @staticmethod
+    def page_records(page):
+        """Convierte una página de la API en TrackRecord (None si el track no existe)"""
+        return [TrackRecord.from_spotify(item['track']) if item.get('track') else None
+                for item in page['items']]
+
+    def fetch_playlist_page(self, playlist_id, offset, with_total=False):
+        """Pide una página de la playlist respetando Retry-After en HTTP 429"""
+        fields = PLAYLIST_TRACK_FIELDS + (',total' if with_total else '')
+        self.metrics.increment('spotify_requests', endpoint='playlist_items')
+        return self.spotify_call(
+            self.sp.playlist_items,
+            playlist_id,
+            fields=fields,
+            limit=SPOTIFY_PAGE_SIZE,
+            offset=offset,
+            additional_types=('track',)
+        )
+
+    def search_youtube(self, track, job=None):
+        """
+        Busca el video en YouTube con autenticación si está disponible.
+        Si no hay URL, job['error_class'] recibe 'not_found' (sin resultados o
+        ninguno supera el umbral) o la clase del error de la búsqueda
+        """
+        track_name, artist_name, track_id = track.title, track.artist, track.track_id
+        
+        # Consultar primero la caché persistente
+        found, cached_url = self.search_cache.get(track_id, track_name, artist_name, track.duration_ms)
+        if found:
+            if cached_url:
+                logger.info(f"Video encontrado (caché): {cached_url}")
+            else:
+                logger.info(f"Sin video (caché negativa): {track_name} - {artist_name}")
+                if job is not None:
+                    job['error_class'] = 'not_found'
+            return cached_url
+        
+        search_query = f"{track_name} {artist_name} official audio"
+        
+        # Configuración base para yt-dlp
+        ydl_opts = {
+            'quiet': True,
+            'extract_flat': True,
+            'force_json': True,
+            'no_warnings': True,
+        }
+        
+        # Las búsquedas también esperan con el circuito abierto: detectan el
+        # bloqueo igual que las descargas
+        self.circuit_breaker.wait()
+        # Añadir las opciones de la identidad elegida (cookies y proxy)
+        identity = self.identities.acquire('search')
+        ydl_opts.update(identity.ydl_options())
+        error_class = None
+        
+        try:
+            identity.rate_limiter.acquire('search')
+            ydl = self.ydl_pool.get('search', ydl_opts)
+            result = ydl.extract_info(
+                f"ytsearch{SEARCH_CANDIDATES}:{search_query}",
+                download=False
+            )
+            self.report_identity(identity, 'search')
+            best, score = self.pick_candidate(track, [e for e in result['entries'] if e])
+            if best:
+                video_url = best['url']
+                logger.info(f"Video encontrado: {video_url} (puntuación {score:.2f})")
+                self.search_cache.put(track_id, track_name, artist_name, video_url, best.get('duration'))
+                return video_url
+            else:
+                logger.warning("No se encontraron videos para: %s", search_query)
+                self.search_cache.put(track_id, track_name, artist_name, None)
+                if job is not None:
+                    job['error_class'] = 'not_found'
+                return None
+        except Exception as e:
+            error_msg = str(e)
+            error_class = classify_error(error_msg)
+            self.report_identity(identity, 'search', error_msg)
+            if error_class in ('throttled', 'auth'):
+                logger.warning("Video restringido que requiere autenticación: %s", track_name)
+            elif "Private video" in error_msg:
+                logger.warning("Video privado: %s", track_name)
+            else:
+                logger.error("Error en búsqueda YouTube: %s - %s", search_query, error_msg)
+            if job is not None:
+                job['error_class'] = error_class
+            return None
+        finally:
+            self.identities.release(identity)
+            # Igual que en fetch_audio: con otra identidad disponible una
+            # detección de bot solo enfría la suya
+            if error_class == 'throttled' and self.identities.any_ready():
+                self.circuit_breaker.record('transient')
+            else:
+                self.circuit_breaker.record(error_class)
+
+    def score_candidate(self, track, entry):
+        """
+        Puntúa (0-1) un resultado de búsqueda frente al track de Spotify:
+        duración, canal oficial ("- Topic", VEVO, el propio artista) y título
+        """
+        weights = SEARCH_SCORE_WEIGHTS
+        
+        # Duración: 1 si coincide, 0 a partir de SEARCH_DURATION_TOLERANCE segundos
+        duration = entry.get('duration')
+        if duration and track.duration_ms:
+            diff = abs(duration - track.duration_ms / 1000)
+            duration_score = max(0.0, 1 - diff / SEARCH_DURATION_TOLERANCE)
+        else:
+            duration_score = 0.5
+        
+        # Canal: los canales "- Topic" publican el audio del álbum
+        channel = entry.get('channel') or entry.get('uploader') or ''
+        normalized_channel = SearchCache.normalize(channel)
+        normalized_artist = SearchCache.normalize(track.artist)
+        if channel.endswith(' - Topic'):
+            channel_score = 1.0
+        elif 'vevo' in normalized_channel or (normalized_artist and normalized_artist in normalized_channel):
+            channel_score = 0.7
+        else:
+            channel_score = 0.0
+        
+        # Título: similitud con "título artista" y penalización por versiones no deseadas
+        candidate_title = SearchCache.normalize(entry.get('title'))
+        expected_title = SearchCache.normalize(track.title)
+        title_score = max(
+            difflib.SequenceMatcher(None, expected_title, candidate_title).ratio(),
+            difflib.SequenceMatcher(None, f"{normalized_artist} {expected_title}", candidate_title).ratio(),
+        )
+        if expected_title and expected_title in candidate_title:
+            title_score = max(title_score, 0.9)
+        for term in SEARCH_UNWANTED_TERMS:
+            if re.search(rf'\b{term}\b', candidate_title) and not re.search(rf'\b{term}\b', expected_title):
+                title_score *= 0.3
+                break
+        
+        return (weights['duration'] * duration_score
+                + weights['channel'] * channel_score
+                + weights['title'] * title_score)
+
+    def pick_candidate(self, track, entries):
+        """Retorna (mejor_resultado, puntuación) o (None, puntuación) si ninguno supera el umbral"""
+        best, best_score = None, 0.0
+        for entry in entries:
+            if not entry.get('url'):
+                continue
+            score = self.score_candidate(track, entry)
+            if score > best_score:
+                best, best_score = entry, score
+        
+        if best and best_score < SEARCH_MIN_SCORE:
+            logger.warning("Candidato descartado (%.2f < %s): %s", best_score, SEARCH_MIN_SCORE, best.get('title'))
+            return None, best_score
+        return best, best_score
+
+    def download_audio_advanced(self, url, output_path, track):
+        """Descarga audio usando estrategias avanzadas para evitar el problema SABR"""
+        final_path = self.fetch_audio(url, output_path, track=track)
+        if not final_path:
+            logger.error("❌ Todas las estrategias fallaron para: %s", track.title)
+            return False
+
+        self.add_metadata(final_path, track)
+        return True
+
+    # Resultado de una estrategia que no aplica (p.ej. no hay formatos m4a)
+    STRATEGY_SKIPPED = 'skipped'
+
+    def build_download_options(self, transcode=True, identity=None):
+        """
+        Opciones de yt-dlp para cada familia de estrategias de descarga (con las
+        cookies y el proxy de identity). yt-dlp solo post-procesa la salida
+        'original': el MP3 lo codifica finalize_audio con los tags incluidos
+        """
+        if transcode and self.output_format == 'original':
+            # 'best' copia el stream de audio tal cual (m4a/opus) sin recodificar
+            postprocessors = [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': 'best',
+            }]
+        else:
+            postprocessors = []
+
+        # Estrategia 1: Usar yt-dlp con configuración específica para SABR
+        ydl_opts_sabr = {
+            'format': 'bestaudio/best',
+            'quiet': False,
+            'no_warnings': False,
+            'ignoreerrors': False,
+            'retries': 10,
+            'fragment_retries': 10,
+            'skip_unavailable_fragments': True,
+            'extractaudio': bool(postprocessors),
             'audioformat': 'mp3',
             'audioquality': '0',  # Mejor calidad
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
+            'postprocessors': postprocessors,
             # Configuraciones específicas para SABR
             'extractor_args': {
                 'youtube': {
@@ -440,207 +3154,672 @@ class SpotifyDownloader:
             }
         }
         
-        # Añadir autenticación si está disponible
-        auth_options = self.yt_auth.get_auth_options()
-        ydl_opts_sabr.update(auth_options)
-        
-        # Estrategia 2: Formatos alternativos específicos
-        format_strategies = [
-            'bestaudio[ext=m4a]/bestaudio/best',
-            'bestaudio/best',
-            'worstaudio/worst',
-            'm4a/bestaudio/best',
-            'mp3/best',
-            'best[height<=480]',  # Formatos de video con audio
-            'worst[height<=480]',
-        ]
+        # Estrategia 3: Descarga directa sin post-processing
+        ydl_opts_direct = {
+            'format': 'bestaudio/best',
+            'quiet': False,
+            'no_warnings': False,
+            'retries': 10,
+            'extractaudio': False,  # No extraer audio inmediatamente
+            'postprocessors': [],   # Sin post-processing
+        }
+        
+        # Estrategia 4: Extractor alternativo (cliente android)
+        ydl_opts_alt = {
+            'format': 'bestaudio/best',
+            'quiet': False,
+            'no_warnings': False,
+            'retries': 10,
+            'postprocessors': postprocessors,
+            'extractor_args': {'youtube': {'player_client': ['android']}},
+        }
+        
+        # Añadir autenticación si está disponible. Las descargas se escriben
+        # en .part y se retoman desde ahí si el proceso se interrumpió
+        auth_options = identity.ydl_options() if identity else self.yt_auth.get_auth_options()
+        for ydl_opts in (ydl_opts_sabr, ydl_opts_direct, ydl_opts_alt):
+            ydl_opts.update(auth_options)
+            ydl_opts.update({'continuedl': True, 'nopart': False})
+            ydl_opts['progress_hooks'] = [self.on_download_progress]
+            if not self.interactive:
+                # Modo batch: stdout queda reservado para el estado JSON
+                ydl_opts.update({'quiet': True, 'noprogress': True, 'logtostderr': True})
+        
+        return {'sabr': ydl_opts_sabr, 'direct': ydl_opts_direct, 'alt': ydl_opts_alt}
+
+    def report_identity(self, identity, kind, error_msg=None):
+        """Registra el resultado de una petición en el pool de identidades y en las métricas"""
+        self.identities.report(identity, kind, error_msg)
+        result = 'ok' if error_msg is None else classify_error(error_msg)
+        if result == 'throttled':
+            self.download_controller.congestion()
+        self.metrics.increment('identity_requests', identity=identity.name, kind=kind, result=result)
+
+    def on_download_progress(self, progress):
+        """
+        Hook de progreso de yt-dlp: alimenta el controlador de descargas y
+        cuenta los bytes y el throughput de cada descarga terminada
+        """
+        self.download_controller.on_progress(progress)
+        if progress.get('status') == 'finished':
+            size = progress.get('downloaded_bytes') or progress.get('total_bytes') or 0
+            self.metrics.increment('downloaded_bytes', size)
+            if size and progress.get('elapsed'):
+                self.metrics.observe('stream_bytes_per_second', size / progress['elapsed'])
+
+    def fetch_audio(self, url, output_path, transcode=True, track=None, job=None, controlled=False):
+        """
+        Ejecuta la cadena de estrategias de descarga y retorna la ruta del archivo.
+        Las estrategias se prueban en el orden aprendido por StrategyStats.
+        Con transcode=False no se convierte a MP3 (lo hace la etapa de FFmpeg del pipeline),
+        salvo que el formato se pueda codificar en streaming: entonces se retorna el MP3.
+        Con track, los MP3 codificados por FFmpeg salen ya etiquetados.
+        Con controlled, cada transferencia de bytes ocupa una plaza del DownloadController.
+        Si falla, job['error_class'] recibe la clase del error
+        """
+        # Con el circuito abierto (picos de detección de bot) se espera aquí
+        self.circuit_breaker.wait()
+        # Toda la descarga usa la misma identidad: las URLs de los formatos van ligadas a ella
+        identity = self.identities.acquire('media')
+        result, error_class = None, 'transient'
+        try:
+            result, error_class = self.run_strategies(url, output_path, transcode, track, identity, controlled)
+        finally:
+            self.identities.release(identity)
+            # Mientras quede otra identidad disponible, una detección de bot solo enfría la suya
+            if error_class == 'throttled' and self.identities.any_ready():
+                self.circuit_breaker.record('transient')
+            else:
+                self.circuit_breaker.record(error_class)
+        if not result and job is not None:
+            job['error_class'] = error_class
+        return result
+
+    def run_strategies(self, url, output_path, transcode, track, identity, controlled=False):
+        """
+        Cadena de estrategias de fetch_audio con la identidad dada.
+        Retorna (ruta, None) o (None, clase de error).
+        Un error permanente o de autenticación detiene la cadena
+        """
+        # Sin post-processing de yt-dlp el archivo necesita su extensión real.
+        # En MP3 yt-dlp no convierte: finalize_audio codifica ya con los tags
+        # (una sola escritura en vez de MP3 sin tags + reescritura de mutagen)
+        postprocess = transcode and self.output_format == 'original'
+        outtmpl = output_path if postprocess else output_path + '.%(ext)s'
+        options = self.build_download_options(transcode, identity)
+        
+        # Estado compartido: la información del video se extrae una sola vez.
+        # 'slot' envuelve solo las transferencias de bytes
+        state = {'info': None, 'extracted': False, 'last_error': None, 'track': track,
+                 'identity': identity, 'stream': self.stream_transcode and self.output_format == 'mp3',
+                 'slot': self.download_controller if controlled else contextlib.nullcontext()}
+        
+        attempts = {
+            'android+web:m4a': lambda: self.try_format_class(
+                url, output_path, outtmpl, transcode, options['sabr'], state, 'm4a'),
+            'android+web:audio': lambda: self.try_format_class(
+                url, output_path, outtmpl, transcode, options['sabr'], state, 'audio'),
+            'android+web:video': lambda: self.try_format_class(
+                url, output_path, outtmpl, transcode, options['sabr'], state, 'video'),
+            'direct': lambda: self.try_direct_download(
+                url, output_path, transcode, options['direct'], state),
+            'android:bestaudio': lambda: self.try_alt_extractor(
+                url, output_path, outtmpl, options['alt'], state, transcode and not postprocess),
+        }
         
         last_error = None
+        tried = 0
+        for key in self.strategy_stats.order(list(attempts)):
+            state['last_error'] = None
+            started = time.time()
+            result = attempts[key]()
+            if result == self.STRATEGY_SKIPPED:
+                continue
+            
+            elapsed = time.time() - started
+            tried += 1
+            self.strategy_stats.record(key, bool(result), elapsed)
+            self.metrics.observe('strategy_seconds', elapsed, strategy=key)
+            self.metrics.increment('strategy_attempts', strategy=key, result='ok' if result else 'error')
+            if result:
+                self.report_identity(identity, 'media')
+                self.metrics.observe('strategies_per_track', tried)
+                return result, None
+            if state['last_error']:
+                last_error = state['last_error']
+                self.report_identity(identity, 'media', last_error)
+                if classify_error(last_error) in FATAL_ERROR_CLASSES:
+                    logger.warning("⛔ Error %s: no se prueban más estrategias", classify_error(last_error))
+                    break
+        
+        self.metrics.observe('strategies_per_track', tried)
+        if last_error:
+            logger.error("Último error: %s", last_error)
+        return None, classify_error(last_error)
+
+    def try_format_class(self, url, output_path, outtmpl, transcode, ydl_opts, state, format_class):
+        """
+        Estrategia 2: extrae la información una sola vez y descarga los
+        formatos de la clase indicada, elegidos localmente
+        """
+        if not state['extracted']:
+            state['extracted'] = True
+            try:
+                state['identity'].rate_limiter.acquire('media')
+                state['info'] = self.extract_video_info(url, ydl_opts)
+            except Exception as e:
+                state['last_error'] = str(e)
+                logger.warning("❌ Extracción de información falló: %s", state['last_error'])
+                return None
+        
+        info = state['info']
+        if not info:
+            return self.STRATEGY_SKIPPED
+        
+        candidates = [fmt for fmt in self.rank_formats(info.get('formats') or [])
+                      if self.format_class(fmt) == format_class]
+        if not candidates:
+            return self.STRATEGY_SKIPPED
         
-        # Intentar con diferentes estrategias de formato
-        for format_strategy in format_strategies:
+        for fmt in candidates:
+            format_id = fmt['format_id']
+            if state['stream'] and self.format_protocol(fmt) in STREAM_PROTOCOLS:
+                final_path = self.stream_format(url, state, format_id, ydl_opts, output_path + '.mp3')
+                if final_path:
+                    return final_path
             try:
-                ydl_opts_sabr['format'] = format_strategy
-                logger.info(f"🔧 Intentando estrategia de formato: {format_strategy}")
-                
-                with YoutubeDL(ydl_opts_sabr) as ydl:
-                    ydl.download([url])
+                logger.info(f"🔧 Intentando formato: {format_id} ({fmt.get('ext')}, {fmt.get('abr') or '?'}k)")
+                state['identity'].rate_limiter.acquire('media')
+                with state['slot']:
+                    state['info'] = self.download_format(url, state['info'], format_id, ydl_opts, outtmpl)
                 
                 # Verificar si el archivo se descargó
                 downloaded_path = self.find_downloaded_file(output_path)
                 if downloaded_path:
-                    # Convertir a MP3 si es necesario
-                    final_path = self.ensure_mp3_format(downloaded_path, output_path + '.mp3')
+                    if not transcode:
+                        logger.info(f"✅ Descarga exitosa con formato: {format_id}")
+                        return downloaded_path
+                    # Convertir al formato de salida si es necesario
+                    final_path = self.finalize_audio(downloaded_path, output_path, state['track'])
                     if final_path and os.path.exists(final_path):
-                        self.add_metadata(final_path, metadata)
-                        logger.info(f"✅ Descarga exitosa con formato: {format_strategy}")
-                        return True
+                        logger.info(f"✅ Descarga exitosa con formato: {format_id}")
+                        return final_path
                         
             except Exception as e:
-                last_error = str(e)
-                logger.warning(f"❌ Estrategia {format_strategy} falló: {last_error}")
+                state['last_error'] = str(e)
+                logger.warning("❌ Formato %s falló: %s", format_id, state['last_error'])
+                if classify_error(state['last_error']) in FATAL_ERROR_CLASSES:
+                    break
                 continue
-        
-        # Estrategia 3: Usar descarga directa sin post-processing
+        return None
+
+    def try_direct_download(self, url, output_path, transcode, ydl_opts, state):
+        """Estrategia 3: descarga directa sin post-processing"""
         try:
             logger.info("🔄 Intentando descarga directa sin post-processing...")
-            ydl_opts_direct = {
-                'format': 'bestaudio/best',
-                'outtmpl': output_path + '.%(ext)s',
-                'quiet': False,
-                'no_warnings': False,
-                'retries': 10,
-                'extractaudio': False,  # No extraer audio inmediatamente
-                'postprocessors': [],   # Sin post-processing
-            }
-            ydl_opts_direct.update(auth_options)
-            
-            with YoutubeDL(ydl_opts_direct) as ydl:
+            state['identity'].rate_limiter.acquire('media')
+            ydl = self.ydl_pool.get('direct', ydl_opts, output_path + '.%(ext)s')
+            with state['slot']:
                 info = ydl.extract_info(url, download=True)
-                downloaded_file = ydl.prepare_filename(info)
+            downloaded_file = ydl.prepare_filename(info)
             
             if os.path.exists(downloaded_file):
-                # Convertir manualmente a MP3
-                mp3_path = output_path + '.mp3'
-                if self.convert_to_mp3(downloaded_file, mp3_path):
-                    os.remove(downloaded_file)  # Limpiar archivo original
-                    self.add_metadata(mp3_path, metadata)
+                if not transcode:
                     logger.info("✅ Descarga directa exitosa")
-                    return True
+                    return downloaded_file
+                # Convertir manualmente al formato de salida
+                final_path = self.finalize_audio(downloaded_file, output_path, state['track'])
+                if final_path:
+                    logger.info("✅ Descarga directa exitosa")
+                    return final_path
                     
         except Exception as e:
-            last_error = str(e)
-            logger.warning(f"❌ Descarga directa falló: {last_error}")
-        
-        # Estrategia 4: Usar yt-dlp con extractor alternativo
+            state['last_error'] = str(e)
+            logger.warning("❌ Descarga directa falló: %s", state['last_error'])
+        return None
+
+    def try_alt_extractor(self, url, output_path, outtmpl, ydl_opts, state, finalize=False):
+        """Estrategia 4: yt-dlp con extractor alternativo (cliente android)"""
         try:
             logger.info("🔄 Intentando con extractor alternativo...")
-            ydl_opts_alt = {
-                'format': 'bestaudio/best',
-                'outtmpl': output_path,
-                'quiet': False,
-                'no_warnings': False,
-                'retries': 10,
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                'extractor_args': {'youtube': {'player_client': ['android']}},
-            }
-            ydl_opts_alt.update(auth_options)
-            
-            with YoutubeDL(ydl_opts_alt) as ydl:
+            state['identity'].rate_limiter.acquire('media')
+            ydl = self.ydl_pool.get('alt', ydl_opts, outtmpl)
+            with state['slot']:
                 ydl.download([url])
             
             downloaded_path = self.find_downloaded_file(output_path)
+            if downloaded_path and finalize:
+                downloaded_path = self.finalize_audio(downloaded_path, output_path, state['track'])
             if downloaded_path:
-                self.add_metadata(downloaded_path, metadata)
                 logger.info("✅ Descarga con extractor alternativo exitosa")
-                return True
+                return downloaded_path
                 
         except Exception as e:
-            last_error = str(e)
-            logger.warning(f"❌ Extractor alternativo falló: {last_error}")
-        
-        logger.error(f"❌ Todas las estrategias fallaron para: {metadata['title']}")
-        if last_error:
-            logger.error(f"Último error: {last_error}")
+            state['last_error'] = str(e)
+            logger.warning("❌ Extractor alternativo falló: %s", state['last_error'])
+        return None
+
+    def extract_video_info(self, url, ydl_opts):
+        """Extrae la información del video (formatos incluidos) sin descargar"""
+        ydl = self.ydl_pool.get('sabr', ydl_opts)
+        return ydl.extract_info(url, download=False, process=False)
+
+    @staticmethod
+    def info_expired(info, margin=60):
+        """True si las URLs de los formatos ya expiraron (parámetro expire de YouTube)"""
+        for fmt in info.get('formats') or []:
+            match = re.search(r'[?&/]expire[=/](\d+)', fmt.get('url') or '')
+            if match:
+                return time.time() > int(match.group(1)) - margin
         return False
 
+    @staticmethod
+    def format_protocol(fmt):
+        """
+        Protocolo de un formato. Con process=False yt-dlp todavía no rellenó
+        'protocol' (lo hace process_video_result): se deduce igual que él
+        """
+        if fmt.get('protocol'):
+            return fmt['protocol']
+        from yt_dlp.utils import determine_protocol
+        return determine_protocol(fmt)
+
+    @staticmethod
+    def format_class(fmt):
+        """
+        Clasifica un formato: 'm4a' (audio m4a), 'audio' (resto de audio),
+        'video' (video con audio hasta 480p) o None si no es utilizable.
+        Se descartan los formatos sin URL directa (SABR), con DRM o sin audio
+        """
+        if (not fmt.get('format_id') or not fmt.get('url') or fmt.get('has_drm')
+                or fmt.get('acodec') == 'none' or fmt.get('protocol') == 'mhtml'):
+            return None
+        if fmt.get('vcodec') == 'none':
+            return 'm4a' if fmt.get('ext') == 'm4a' else 'audio'
+        if (fmt.get('height') or 0) <= 480:
+            return 'video'
+        return None
+
+    @classmethod
+    def rank_formats(cls, formats):
+        """
+        Ordena los formatos disponibles según nuestras preferencias:
+        audio m4a, resto de audio (mayor bitrate primero) y por último
+        formatos de video con audio hasta 480p
+        """
+        by_bitrate = lambda f: f.get('abr') or f.get('tbr') or 0
+        ranked = []
+        for format_class, sort_key in (('m4a', by_bitrate), ('audio', by_bitrate),
+                                       ('video', lambda f: f.get('height') or 0)):
+            ranked.extend(sorted((f for f in formats if cls.format_class(f) == format_class),
+                                 key=sort_key, reverse=True))
+        return ranked
+
+    def download_format(self, url, info, format_id, ydl_opts, outtmpl):
+        """
+        Descarga un formato concreto reutilizando la información ya extraída.
+        Solo se vuelve a extraer si las URLs expiraron (por tiempo o HTTP 403).
+        Retorna la información usada (posiblemente renovada)
+        """
+        if self.info_expired(info):
+            logger.info("🔄 URLs expiradas, extrayendo información de nuevo...")
+            info = self.extract_video_info(url, ydl_opts)
+        
+        ydl = self.ydl_pool.get('sabr', ydl_opts, outtmpl, format_spec=format_id)
+        try:
+            ydl.process_ie_result(copy.deepcopy(info), download=True)
+        except Exception as e:
+            if 'HTTP Error 403' not in str(e):
+                raise
+            logger.info("🔄 HTTP 403, extrayendo información de nuevo...")
+            info = self.extract_video_info(url, ydl_opts)
+            ydl.process_ie_result(copy.deepcopy(info), download=True)
+        return info
+
+    # Extensiones que puede tener un archivo descargado o convertido
+    DOWNLOAD_EXTENSIONS = ('.mp3', '.m4a', '.opus', '.ogg', '.flac', '.webm', '.mkv', '.mp4')
+
+    def stream_format(self, url, state, format_id, ydl_opts, output_path):
+        """
+        Descarga un formato con la red de yt-dlp (cookies, proxy, cabeceras)
+        y pasa los bytes directamente al stdin de FFmpeg: solo se escribe el
+        MP3 final y la codificación avanza a la vez que la transferencia.
+        A diferencia de las descargas a disco (.part) no se puede retomar: si
+        el run se interrumpe, el siguiente vuelve a pedir el formato completo.
+        Retorna la ruta del MP3 o None (se reintenta descargando a disco)
+        """
+        try:
+            logger.info(f"🌊 Descargando en streaming hacia FFmpeg: formato {format_id}")
+            if self.info_expired(state['info']):
+                state['info'] = self.extract_video_info(url, ydl_opts)
+            fmt = next(f for f in state['info']['formats'] if f.get('format_id') == format_id)
+            ydl = self.ydl_pool.get('sabr', ydl_opts)
+            
+            tags, cover_path = self.encode_tags(state['track'])
+            state['identity'].rate_limiter.acquire('media')
+            # El FFmpeg en streaming ocupa un proceso del presupuesto del planificador
+            with self.transcoder.slots, state['slot']:
+                started = time.time()
+                returncode, stderr = stream_ffmpeg_mp3(self.count_bytes(self.iter_format_bytes(ydl, fmt)),
+                                                       output_path, tags, cover_path)
+                self.metrics.observe('stream_seconds', time.time() - started)
+            if returncode != 0:
+                logger.warning("❌ Streaming del formato %s falló: %s", format_id, tail_text(stderr))
+                return None
+            logger.info(f"✅ Descarga en streaming exitosa con formato: {format_id}")
+            return output_path
+        
+        except Exception as e:
+            state['last_error'] = str(e)
+            logger.warning("❌ Streaming del formato %s falló: %s", format_id, state['last_error'])
+            return None
+
+    def count_bytes(self, chunks):
+        """Deja pasar los bloques descargados contándolos en las métricas y en el controlador de descargas"""
+        started = time.time()
+        total = 0
+        for chunk in chunks:
+            self.metrics.increment('downloaded_bytes', len(chunk))
+            self.download_controller.add_bytes(len(chunk))
+            total += len(chunk)
+            yield chunk
+        if total:
+            self.metrics.observe('stream_bytes_per_second', total / max(time.time() - started, 1e-6))
+
+    @staticmethod
+    def iter_format_bytes(ydl, fmt):
+        """Bytes del formato pedidos por rangos de STREAM_CHUNK_SIZE (generador)"""
+        from yt_dlp.networking import Request
+        
+        # Las mismas cabeceras que usaría el descargador de yt-dlp (User-Agent, Referer...)
+        headers = dict(ydl._calc_headers(fmt))
+        start = 0
+        total = fmt.get('filesize')
+        while total is None or start < total:
+            headers['Range'] = f"bytes={start}-{start + STREAM_CHUNK_SIZE - 1}"
+            response = ydl.urlopen(Request(fmt['url'], headers=headers))
+            if total is None:
+                # Content-Range: bytes 0-1023/4567
+                content_range = response.headers.get('Content-Range') or ''
+                total = int(content_range.rsplit('/', 1)[1]) if content_range[-1:].isdigit() else None
+            
+            received = 0
+            while True:
+                data = response.read(STREAM_READ_SIZE)
+                if not data:
+                    break
+                received += len(data)
+                yield data
+            response.close()
+            
+            start += received
+            if received < STREAM_CHUNK_SIZE or response.status != 206:
+                break
+
     def find_downloaded_file(self, base_path):
-        """Encuentra el archivo descargado con cualquier extensión"""
-        possible_extensions = ['.mp3', '.m4a', '.webm', '.opus', '.mkv', '.mp4']
-        for ext in possible_extensions:
+        """
+        Encuentra el archivo descargado con cualquier extensión. Se ignoran
+        los parciales: los .part de yt-dlp y los .tmp de FFmpeg no coinciden
+        con el nombre final, y un archivo vacío o con su .part al lado no cuenta
+        """
+        for ext in self.DOWNLOAD_EXTENSIONS:
             path = base_path + ext
-            if os.path.exists(path):
+            if (os.path.isfile(path) and os.path.getsize(path) > 0
+                    and not os.path.exists(path + '.part')):
                 return path
         return None
 
-    def ensure_mp3_format(self, input_path, output_path):
+    def discard_stale_outputs(self, base_path, keep_outputs=False):
+        """
+        Borra lo que un run interrumpido pudo dejar a medio escribir: los
+        temporales de FFmpeg (.tmp.<ext>) siempre y, salvo keep_outputs, los
+        archivos finales sin etapa registrada en el journal. Los .part se
+        conservan para que yt-dlp retome la descarga. La codificación en
+        streaming no se retoma: su MP3 temporal se borra y empieza de cero
+        """
+        for ext in self.DOWNLOAD_EXTENSIONS:
+            paths = [temp_output_path(base_path + ext)]
+            if not keep_outputs:
+                paths.append(base_path + ext)
+            for path in paths:
+                if os.path.lexists(path):
+                    os.remove(path)
+                    logger.info(f"🧹 Descartado archivo incompleto: {os.path.basename(path)}")
+
+    def run_transcode(self, func, input_path, *args, duration_ms=None):
+        """
+        Ejecuta una conversión en el planificador y espera su resultado.
+        La prioridad es la duración (estimada por tamaño si no se conoce)
+        """
+        if duration_ms:
+            priority = duration_ms / 1000
+        else:
+            priority = os.path.getsize(input_path) / TRANSCODE_BYTES_PER_SECOND
+        label = os.path.basename(input_path)
+        started = time.time()
+        result = self.transcoder.submit(func, input_path, *args, priority=priority, label=label).result()
+        # Incluye la espera en la cola del planificador
+        self.metrics.observe('ffmpeg_seconds', time.time() - started)
+        return result
+
+    def finalize_audio(self, input_path, output_path, track=None):
+        """
+        Lleva el archivo descargado al formato de salida configurado.
+        output_path es la ruta base sin extensión
+        """
+        if self.output_format == 'original':
+            return self.ensure_passthrough_format(input_path, output_path)
+        return self.ensure_mp3_format(input_path, output_path + '.mp3', track)
+
+    def ensure_passthrough_format(self, input_path, output_base):
+        """Copia el audio a su contenedor natural sin recodificar"""
+        try:
+            returncode, stderr, output_path = self.run_transcode(run_ffmpeg_passthrough, input_path, output_base)
+            if returncode != 0:
+                logger.error("❌ Error en copia de audio FFmpeg: %s", tail_text(stderr))
+                return None
+            
+            if output_path != input_path and os.path.exists(input_path):
+                os.remove(input_path)
+            return output_path
+            
+        except Exception as e:
+            logger.error("❌ Error al copiar el audio: %s", e)
+            return None
+
+    def ensure_mp3_format(self, input_path, output_path, track=None):
         """Asegura que el archivo esté en formato MP3"""
         if input_path.endswith('.mp3'):
             return input_path
         
-        if self.convert_to_mp3(input_path, output_path):
+        if self.convert_to_mp3(input_path, output_path, track):
             if input_path != output_path and os.path.exists(input_path):
                 os.remove(input_path)
             return output_path
         return None
 
-    def convert_to_mp3(self, input_path, output_path):
-        """Convierte un archivo de audio a MP3 usando FFmpeg"""
+    def convert_to_mp3(self, input_path, output_path, track=None):
+        """Convierte un archivo de audio a MP3 usando FFmpeg (etiquetado si se indica el track)"""
         try:
-            cmd = [
-                'ffmpeg', '-i', input_path,
-                '-codec:a', 'libmp3lame',
-                '-qscale:a', '2',
-                '-y',  # Sobrescribir si existe
-                output_path
-            ]
-            
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
-            if result.returncode == 0:
+            tags, cover_path = self.encode_tags(track)
+            returncode, stderr = self.run_transcode(run_ffmpeg_mp3, input_path, output_path, tags, cover_path)
+            if returncode == 0:
                 logger.info(f"✅ Conversión exitosa: {input_path} -> {output_path}")
                 return True
             else:
-                logger.error(f"❌ Error en conversión FFmpeg: {result.stderr}")
+                logger.error("❌ Error en conversión FFmpeg: %s", tail_text(stderr))
                 return False
                 
         except Exception as e:
-            logger.error(f"❌ Error al convertir a MP3: {str(e)}")
+            logger.error("❌ Error al convertir a MP3: %s", e)
             return False
 
-    def download_audio(self, url, output_path, metadata):
+    def download_audio(self, url, output_path, track):
         """Wrapper para la descarga de audio con manejo de errores mejorado"""
         try:
-            return self.download_audio_advanced(url, output_path, metadata)
+            return self.download_audio_advanced(url, output_path, track)
         except Exception as e:
-            logger.error(f"❌ Error crítico en download_audio: {str(e)}")
+            logger.error("❌ Error crítico en download_audio: %s", e)
             return False
 
-    def add_metadata(self, file_path, metadata):
-        """Añade metadata ID3 al archivo MP3"""
+    def encode_tags(self, track):
+        """Tags y ruta de la carátula para escribirlos al codificar; (None, None) sin track"""
+        if not track:
+            return None, None
+        metadata = track.tag_fields()
+        cover_path = None
+        if metadata.get('cover_url'):
+            started = time.time()
+            try:
+                cover_path = self.cover_cache.get_path(metadata['cover_url'])
+            except Exception as e:
+                logger.warning("No se pudo obtener la carátula: %s", e)
+            self.metrics.observe('cover_seconds', time.time() - started)
+        return metadata, cover_path
+
+    @staticmethod
+    def tag_padding(info):
+        """
+        Padding para mutagen: si los tags caben en el espacio libre se
+        reescribe solo la cabecera; si no, se reserva TAG_PADDING de nuevo
+        """
+        return info.padding if info.padding >= 0 else TAG_PADDING
+
+    def add_metadata(self, file_path, track):
+        """
+        Añade metadata del TrackRecord usando el formato de tags del contenedor.
+        Si el archivo ya tiene esos tags (escritos al codificar) no se toca
+        """
         try:
             # Asegurarse de que el archivo existe
             if not os.path.exists(file_path):
-                logger.error(f"Archivo no encontrado para metadata: {file_path}")
+                logger.error("Archivo no encontrado para metadata: %s", file_path)
                 return
             
-            try:
-                audio = MP3(file_path, ID3=ID3)
-            except:
-                audio = MP3(file_path)
-                audio.add_tags()
-            
-            # Añadir tags básicos
-            audio['TIT2'] = TIT2(encoding=3, text=metadata['title'])
-            audio['TPE1'] = TPE1(encoding=3, text=metadata['artist'])
-            audio['TALB'] = TALB(encoding=3, text=metadata['album'])
-            audio['TCON'] = TCON(encoding=3, text=metadata['genre'])
-            audio['TRCK'] = TRCK(encoding=3, text=str(metadata['track_number']))
-            audio['TDRC'] = TDRC(encoding=3, text=metadata['release_date'])
-            
-            # Añadir carátula si está disponible
+            metadata = track.tag_fields()
+            
+            # Obtener carátula si está disponible
+            cover_data = None
             if metadata.get('cover_url'):
+                started = time.time()
                 try:
-                    response = requests.get(metadata['cover_url'], timeout=10)
-                    if response.status_code == 200:
-                        audio['APIC'] = APIC(
-                            encoding=3,
-                            mime='image/jpeg',
-                            type=3,
-                            desc='Cover',
-                            data=response.content
-                        )
+                    cover_data = self.cover_cache.get(metadata['cover_url'])
                 except Exception as e:
-                    logger.warning(f"No se pudo añadir carátula: {str(e)}")
+                    logger.warning("No se pudo añadir carátula: %s", e)
+                self.metrics.observe('cover_seconds', time.time() - started)
+            
+            extension = os.path.splitext(file_path)[1].lower()
+            if extension in ('.m4a', '.mp4'):
+                written = self.tag_mp4(file_path, metadata, cover_data)
+            elif extension in ('.opus', '.ogg', '.flac'):
+                written = self.tag_vorbis(file_path, metadata, cover_data)
+            else:
+                written = self.tag_mp3(file_path, metadata, cover_data)
             
-            audio.save()
-            logger.info(f"Metadata añadida a: {file_path}")
+            if written:
+                logger.info(f"Metadata añadida a: {file_path}")
+            else:
+                logger.info(f"Metadata ya presente en: {file_path}")
             
         except Exception as e:
-            logger.error(f"Error al añadir metadata: {str(e)}")
+            logger.error("Error al añadir metadata: %s", e)
+
+    def tag_mp3(self, file_path, metadata, cover_data):
+        """Escribe tags ID3 en un MP3. Retorna False si ya los tenía"""
+        from mutagen.mp3 import MP3
+        from mutagen.id3 import ID3, TIT2, TPE1, TALB, TCON, TRCK, TDRC, APIC
+        
+        try:
+            audio = MP3(file_path, ID3=ID3)
+        except:
+            audio = MP3(file_path)
+            audio.add_tags()
+        if audio.tags is None:
+            audio.add_tags()
+        
+        frames = {
+            'TIT2': TIT2(encoding=3, text=metadata['title']),
+            'TPE1': TPE1(encoding=3, text=metadata['artist']),
+            'TALB': TALB(encoding=3, text=metadata['album']),
+            'TCON': TCON(encoding=3, text=metadata['genre']),
+            'TRCK': TRCK(encoding=3, text=str(metadata['track_number'])),
+            'TDRC': TDRC(encoding=3, text=metadata['release_date']),
+        }
+        
+        # Tags ya escritos durante la codificación: no hace falta guardar
+        unchanged = all(str(audio.tags.get(key) or '') == str(frame) for key, frame in frames.items())
+        if unchanged and cover_data:
+            unchanged = any(picture.data == cover_data for picture in audio.tags.getall('APIC'))
+        if unchanged:
+            return False
+        
+        # Añadir tags básicos
+        for key, frame in frames.items():
+            audio[key] = frame
+        
+        if cover_data:
+            audio['APIC'] = APIC(
+                encoding=3,
+                mime='image/jpeg',
+                type=3,
+                desc='Cover',
+                data=cover_data
+            )
+        
+        audio.save(padding=self.tag_padding)
+        return True
+
+    def tag_mp4(self, file_path, metadata, cover_data):
+        """Escribe átomos iTunes en un M4A. Retorna True al guardar"""
+        from mutagen.mp4 import MP4, MP4Cover
+        
+        audio = MP4(file_path)
+        if audio.tags is None:
+            audio.add_tags()
+        
+        audio['\xa9nam'] = [metadata['title']]
+        audio['\xa9ART'] = [metadata['artist']]
+        audio['\xa9alb'] = [metadata['album']]
+        audio['\xa9gen'] = [metadata['genre']]
+        audio['trkn'] = [(int(metadata['track_number'] or 0), 0)]
+        audio['\xa9day'] = [metadata['release_date']]
+        
+        if cover_data:
+            audio['covr'] = [MP4Cover(cover_data, imageformat=MP4Cover.FORMAT_JPEG)]
+        
+        audio.save(padding=self.tag_padding)
+        return True
+
+    def tag_vorbis(self, file_path, metadata, cover_data):
+        """Escribe comentarios Vorbis en un Opus/Ogg/FLAC. Retorna True al guardar"""
+        from mutagen.oggopus import OggOpus
+        from mutagen.oggvorbis import OggVorbis
+        from mutagen.flac import FLAC, Picture
+        
+        extension = os.path.splitext(file_path)[1].lower()
+        audio = {'.opus': OggOpus, '.ogg': OggVorbis, '.flac': FLAC}[extension](file_path)
+        
+        audio['title'] = metadata['title']
+        audio['artist'] = metadata['artist']
+        audio['album'] = metadata['album']
+        audio['genre'] = metadata['genre']
+        audio['tracknumber'] = str(metadata['track_number'])
+        audio['date'] = metadata['release_date']
+        
+        if cover_data:
+            picture = Picture()
+            picture.type = 3
+            picture.mime = 'image/jpeg'
+            picture.desc = 'Cover'
+            picture.data = cover_data
+            if extension == '.flac':
+                audio.clear_pictures()
+                audio.add_picture(picture)
+            else:
+                audio['metadata_block_picture'] = [base64.b64encode(picture.write()).decode('ascii')]
+        
+        audio.save(padding=self.tag_padding)
+        return True
 
     def create_playlist_file(self, playlist_info, output_dir):
         """Crea archivo .pla con la información de la playlist"""
@@ -665,20 +3844,307 @@ class SpotifyDownloader:
             logger.error(f"Error al crear archivo .pla: {str(e)}")
             return None
 
-    def download_playlist(self, playlist_url, output_dir='downloads'):
-        """Descarga toda una playlist de Spotify"""
+    def build_track_jobs(self, tracks, output_dir, total=None):
+        """Convierte los TrackRecord de la playlist en trabajos de descarga (generador)"""
+        if total is None:
+            total = len(tracks)
+        for i, track in enumerate(tracks):
+            if not track:
+                continue
+            
+            # Limpiar nombre del archivo
+            clean_filename = self.clean_filename(f"{track.title}_{track.artist}")
+            yield {
+                'index': i,
+                'total': total,
+                'track': track,
+                'label': track.label,
+                'clean_filename': clean_filename,
+                'output_path': os.path.join(output_dir, clean_filename),
+                'youtube_url': None,
+                'file_path': None,
+                'stage': None,
+                'journal': None,
+                'error_class': None,
+                'done': False,
+            }
+
+    def download_sequential(self, jobs):
+        """Procesa los trabajos uno por uno (modo clásico)"""
+        downloaded_count = 0
+        failed_tracks = []
+        
+        for job in jobs:
+            set_log_context(job['track'].track_id, 'search')
+            logger.info(f"Procesando [{job['index']+1}/{job['total']}]: {job['label']}")
+            
+            if job['done']:
+                logger.info(f"⏩ Completado en una ejecución anterior: {job['label']}")
+                downloaded_count += 1
+                continue
+            
+            # Reutilizar la descarga de otra playlist si existe
+            if self.link_from_library(job):
+                downloaded_count += 1
+                continue
+            
+            # Buscar en YouTube (salvo que el journal ya tenga la URL)
+            if not job['youtube_url']:
+                started = time.time()
+                job['youtube_url'] = self.search_youtube(job['track'], job)
+                self.metrics.observe('stage_seconds', time.time() - started, stage='search')
+                if not job['youtube_url']:
+                    logger.warning("No se encontró video para: %s [%s]", job['label'], job['error_class'])
+                    failed_tracks.append(self.failure_entry(job))
+                    continue
+                self.mark_stage(job, 'searched')
+            
+            # Descargar audio
+            if self.download_job(job):
+                job['done'] = True
+                downloaded_count += 1
+                logger.info(f"✅ Descargado: {os.path.basename(job['file_path'] or job['clean_filename'])}")
+            else:
+                failed_tracks.append(self.failure_entry(job))
+        
+        set_log_context()
+        return downloaded_count, failed_tracks
+
+    def download_job(self, job):
+        """
+        Descarga, convierte y etiqueta un trabajo del modo secuencial,
+        registrando cada etapa en el journal y retomando desde la última
+        """
+        try:
+            set_log_context(job['track'].track_id, 'download')
+            started = time.time()
+            if job['stage'] == 'downloaded':
+                # Descarga sin convertir de un run anterior (modo concurrente)
+                job['file_path'] = self.finalize_audio(job['file_path'], job['output_path'], job['track'])
+            elif job['stage'] != 'converted':
+                job['file_path'] = self.fetch_audio(job['youtube_url'], job['output_path'], track=job['track'], job=job)
+            self.metrics.observe('stage_seconds', time.time() - started, stage='download')
+            
+            if not job['file_path']:
+                logger.error("❌ Todas las estrategias fallaron para: %s", job['track'].title)
+                return False
+            self.mark_stage(job, 'converted')
+            
+            set_log_context(job['track'].track_id, 'tag')
+            started = time.time()
+            self.add_metadata(job['file_path'], job['track'])
+            self.store_in_library(job)
+            self.metrics.observe('stage_seconds', time.time() - started, stage='tag')
+            self.mark_stage(job, 'tagged')
+            return True
+        except Exception as e:
+            logger.error("❌ Error crítico en download_job: %s", e)
+            return False
+
+    @staticmethod
+    def failure_entry(job):
+        """Canción fallida para el resumen: etiqueta y clase de error"""
+        return {'track': job['label'], 'error_class': job['error_class'] or 'transient'}
+
+    @staticmethod
+    def mark_stage(job, stage):
+        """Actualiza la etapa del trabajo y la registra en el journal"""
+        job['stage'] = stage
+        if job['journal']:
+            job['journal'].record(job, stage)
+
+    def resume_from_journal(self, jobs, journal):
+        """
+        Aplica a cada trabajo la última etapa registrada en el journal (generador).
+        Una etapa solo se retoma si su archivo sigue en disco
+        """
+        resumed = 0
+        for job in jobs:
+            job['journal'] = journal
+            entry = journal.get(job)
+            stage = entry['stage'] if entry else None
+            if stage in ('downloaded', 'converted', 'tagged') and not (entry['file'] and os.path.exists(entry['file'])):
+                stage = 'searched' if entry['youtube_url'] else None
+            
+            if stage:
+                resumed += 1
+                job['stage'] = stage
+                job['youtube_url'] = entry['youtube_url']
+                if stage != 'searched':
+                    job['file_path'] = entry['file']
+                job['done'] = stage == 'tagged'
+            if journal.interrupted and not job['done']:
+                self.discard_stale_outputs(job['output_path'], keep_outputs=stage not in (None, 'searched'))
+            yield job
+        
+        if resumed:
+            logger.info(f"Journal: {resumed} canciones retomadas de una ejecución interrumpida")
+
+    def filter_incremental(self, jobs, manifest, prune=False):
+        """
+        Descarta los trabajos ya presentes en el manifiesto (re-etiquetando
+        los que cambiaron de metadata) y opcionalmente poda los eliminados.
+        Es un generador: la poda se hace al terminar de recorrer la playlist
+        """
+        current_ids = set()
+        pending = 0
+        skipped = 0
+        for job in jobs:
+            track = job['track']
+            if track.track_id:
+                current_ids.add(track.track_id)
+            
+            entry = manifest.get(track.track_id)
+            if not entry:
+                pending += 1
+                yield job
+                continue
+            
+            skipped += 1
+            if entry['tag_hash'] != manifest.tag_hash(track):
+                self.add_metadata(entry['file'], track)
+                manifest.record(track, entry['file'], entry['youtube_url'])
+        
+        removed = manifest.removed_tracks(current_ids)
+        if removed:
+            if prune:
+                manifest.prune(removed)
+            else:
+                logger.info(f"{len(removed)} canciones ya no están en la playlist (usa prune para eliminarlas)")
+        
+        logger.info(f"Sincronización incremental: {pending} nuevas, {skipped} ya descargadas")
+
+    def retag_playlist(self, playlist_url, output_dir='downloads', force=False):
+        """
+        Re-etiqueta los archivos ya descargados de una playlist (según su
+        manifiesto) sin descargar nada. Solo se escriben los tracks cuya
+        metadata cambió (todos con force=True); gracias al padding reservado
+        se reescribe la cabecera, no el audio. Retorna cuántos se actualizaron
+        """
+        playlist_info = self.sp.playlist(playlist_url, fields=PLAYLIST_FIELDS)
+        playlist_id = playlist_info['id']
+        manifest = SyncManifest(output_dir, playlist_id)
+        if not manifest.tracks:
+            logger.warning(f"Sin manifiesto de sincronización en {output_dir}: nada que re-etiquetar")
+            return 0
+        
+        retagged = 0
+        for track in self.iter_playlist_tracks(playlist_id, playlist_info['tracks']['total']):
+            entry = track and manifest.get(track.track_id)
+            if not entry:
+                continue
+            if force or entry['tag_hash'] != manifest.tag_hash(track):
+                self.add_metadata(entry['file'], track)
+                manifest.record(track, entry['file'], entry['youtube_url'])
+                retagged += 1
+        
+        manifest.save()
+        logger.info(f"🏷️ Re-etiquetado de {playlist_info['name']}: {retagged} archivos actualizados")
+        return retagged
+
+    @staticmethod
+    def collect_jobs(jobs, collected):
+        """Deja pasar los trabajos guardando una referencia a cada uno"""
+        for job in jobs:
+            collected.append(job)
+            yield job
+
+    def cache_counters(self):
+        """Contadores acumulados de las cachés (para calcular los de una ejecución)"""
+        search = self.search_cache.stats()
+        return {
+            ('search', 'hit'): search['hits'],
+            ('search', 'negative_hit'): search['negative_hits'],
+            ('search', 'miss'): search['misses'],
+            ('cover', 'hit'): self.cover_cache.hits,
+            ('cover', 'miss'): self.cover_cache.misses,
+            ('metadata', 'hit'): self.metadata_cache.hits,
+            ('metadata', 'miss'): self.metadata_cache.misses,
+        }
+
+    def write_run_report(self, output_dir, playlist_info, cache_baseline, downloaded_count, failed_tracks, mode):
+        """
+        Completa las métricas de la ejecución y escribe el reporte JSON. Las
+        métricas quedan para el archivo de Prometheus que se escribe en close()
+        """
+        metrics = self.metrics
+        self.playlist_metrics[playlist_info['id']] = metrics
+        lookups = {}
+        for (cache, result), value in self.cache_counters().items():
+            delta = value - cache_baseline.get((cache, result), 0)
+            metrics.increment('cache_lookups', delta, cache=cache, result=result)
+            hits, total = lookups.get(cache, (0, 0))
+            lookups[cache] = (hits + (delta if result != 'miss' else 0), total + delta)
+        for cache, (hits, total) in lookups.items():
+            metrics.set_gauge('cache_hit_ratio', round(hits / total, 4) if total else 0.0, cache=cache)
+        
+        metrics.increment('tracks', downloaded_count, result='ok')
+        metrics.increment('tracks', len(failed_tracks), result='failed')
+        for failed in failed_tracks:
+            metrics.increment('failed_tracks', error_class=failed['error_class'])
+        metrics.set_gauge('circuit_breaker_trips', self.circuit_breaker.trips)
+        controller = self.download_controller.stats()
+        metrics.set_gauge('download_concurrency', controller['limit'])
+        metrics.set_gauge('download_throughput_bytes_per_second', controller['throughput_bytes_per_second'])
+        for direction in ('increases', 'decreases'):
+            metrics.set_gauge('download_concurrency_changes', controller[direction], direction=direction)
+        identities = self.identities.stats()
+        for name, stats in identities.items():
+            metrics.set_gauge('identity_available', int(stats['state'] == 'ok'), identity=name)
+            metrics.set_gauge('identity_cooldowns', stats['cooldowns'], identity=name)
+        metrics.set_gauge('run_elapsed_seconds', round(time.time() - metrics.started, 3))
+        metrics.set_gauge('run_timestamp_seconds', round(time.time()))
+        
+        report_path = os.path.join(output_dir, RUN_REPORT_FILE.format(playlist_id=playlist_info['id']))
+        try:
+            metrics.write_report(report_path, playlist_id=playlist_info['id'],
+                                 playlist_name=playlist_info['name'], mode=mode,
+                                 downloaded=downloaded_count, failed=failed_tracks, identities=identities,
+                                 download_controller=controller)
+            logger.info(f"📊 Reporte de la ejecución: {report_path}")
+        except Exception as e:
+            logger.warning(f"No se pudo escribir el reporte de métricas: {str(e)}")
+
+    def download_playlist(self, playlist_url, output_dir='downloads', pipelined=False, workers=None,
+                          incremental=False, prune=False):
+        """
+        Descarga toda una playlist de Spotify.
+        Con pipelined=True usa el pipeline concurrente; workers permite
+        ajustar el número de workers por etapa (ver PIPELINE_WORKERS).
+        Con incremental=True solo procesa los tracks que no están en el
+        manifiesto; prune=True elimina los que se quitaron de la playlist
+        """
+        journal = None
         try:
             # Crear directorio de salida
             os.makedirs(output_dir, exist_ok=True)
             
-            # Configurar autenticación de YouTube
-            if not self.setup_youtube_auth():
-                print("⚠️ Continuando sin autenticación de YouTube...")
-            
             # Obtener información de la playlist
-            playlist_info = self.sp.playlist(playlist_url)
+            playlist_info = self.sp.playlist(playlist_url, fields=PLAYLIST_FIELDS)
             playlist_id = playlist_info['id']
             playlist_name = playlist_info['name']
+            snapshot_id = playlist_info.get('snapshot_id')
+            
+            manifest = SyncManifest(output_dir, playlist_id) if incremental else None
+            if manifest and manifest.is_unchanged(snapshot_id):
+                logger.info(f"Playlist sin cambios desde la última sincronización: {playlist_name}")
+                # También hay reporte y métricas: la playlist consta como revisada en este run
+                self.metrics = RunMetrics()
+                self.metrics.set_gauge('playlist_unchanged', 1)
+                self.write_run_report(output_dir, playlist_info, self.cache_counters(), 0, [], mode='unchanged')
+                return 0, []
+            
+            # Métricas propias de esta playlist (los contadores de caché son del proceso)
+            self.metrics = RunMetrics()
+            cache_baseline = self.cache_counters()
+            
+            journal = DownloadJournal(output_dir, playlist_id)
+            if journal.interrupted:
+                logger.info("Se encontró el journal de una ejecución interrumpida, retomando...")
+            
+            # Configurar autenticación de YouTube
+            if not self.setup_youtube_auth():
+                print("⚠️ Continuando sin autenticación de YouTube...")
             
             logger.info(f"Iniciando descarga de playlist: {playlist_name}")
             if self.yt_auth.authenticated:
@@ -689,68 +4155,69 @@ class SpotifyDownloader:
             # Crear archivo .pla
             self.create_playlist_file(playlist_info, output_dir)
             
-            # Obtener tracks
-            tracks = self.get_playlist_tracks(playlist_id)
+            # Obtener tracks en streaming: el procesamiento empieza antes de
+            # que termine la paginación
+            total = playlist_info['tracks']['total']
+            logger.info(f"Se encontraron {total} canciones en la playlist")
+            tracks = self.iter_playlist_tracks(playlist_id, total)
+            jobs = self.build_track_jobs(tracks, output_dir, total)
+            if manifest:
+                jobs = self.filter_incremental(jobs, manifest, prune)
+            jobs = self.resume_from_journal(jobs, journal)
+            processed_jobs = []
+            jobs = self.collect_jobs(jobs, processed_jobs)
             
-            downloaded_count = 0
-            failed_tracks = []
+            if pipelined:
+                logger.info("Modo concurrente: ACTIVADO")
+                pipeline = PlaylistPipeline(self, workers=workers)
+                downloaded_count, failed_tracks = pipeline.run(jobs)
+            else:
+                downloaded_count, failed_tracks = self.download_sequential(jobs)
             
-            for i, item in enumerate(tracks):
-                if not item['track']:
-                    continue
-                    
-                track = item['track']
-                track_name = track['name']
-                artist_name = track['artists'][0]['name']
-                album_name = track['album']['name']
-                
-                logger.info(f"Procesando [{i+1}/{len(tracks)}]: {track_name} - {artist_name}")
-                
-                # Metadata para el archivo
-                metadata = {
-                    'title': track_name,
-                    'artist': artist_name,
-                    'album': album_name,
-                    'genre': ', '.join([g for g in track.get('genres', [])]),
-                    'track_number': track.get('track_number', 1),
-                    'release_date': track['album'].get('release_date', ''),
-                    'cover_url': track['album']['images'][0]['url'] if track['album']['images'] else None
-                }
-                
-                # Buscar en YouTube
-                youtube_url = self.search_youtube(track_name, artist_name)
-                if not youtube_url:
-                    logger.warning(f"No se encontró video para: {track_name} - {artist_name}")
-                    failed_tracks.append(f"{track_name} - {artist_name}")
-                    continue
-                
-                # Limpiar nombre del archivo
-                clean_filename = self.clean_filename(f"{track_name}_{artist_name}")
-                output_path = os.path.join(output_dir, clean_filename)
-                
-                # Descargar audio
-                if self.download_audio(youtube_url, output_path, metadata):
-                    downloaded_count += 1
-                    logger.info(f"✅ Descargado: {clean_filename}.mp3")
-                else:
-                    failed_tracks.append(f"{track_name} - {artist_name}")
-                
-                # Pequeña pausa para evitar rate limiting
-                time.sleep(2)  # Aumentar pausa para evitar bloqueos
+            if manifest:
+                for job in processed_jobs:
+                    if job['done'] and job['file_path'] and job['track'].track_id:
+                        manifest.record(job['track'], job['file_path'], job['youtube_url'])
+                # Solo se da por sincronizado el snapshot si no hubo fallos
+                manifest.snapshot_id = snapshot_id if not failed_tracks else None
+                manifest.save()
+            
+            # Con fallos se conserva el journal para retomarlos en el próximo run
+            journal.close(completed=not failed_tracks)
+            
+            self.write_run_report(output_dir, playlist_info, cache_baseline, downloaded_count, failed_tracks,
+                                  mode='pipelined' if pipelined else 'sequential')
             
             # Resumen final
             logger.info(f"🎉 Descarga completada. Exitosas: {downloaded_count}, Fallidas: {len(failed_tracks)}")
+            logger.info(f"Instancias YoutubeDL: {self.ydl_pool.created} creadas, {self.ydl_pool.reused} reutilizadas")
+            cache_stats = self.search_cache.stats()
+            logger.info(f"Caché de búsquedas: {cache_stats['hits']} aciertos, "
+                        f"{cache_stats['negative_hits']} negativos, {cache_stats['misses']} fallos")
+            logger.info(f"Caché de carátulas: {self.cover_cache.hits} aciertos, {self.cover_cache.misses} descargas")
+            transcode_stats = self.transcoder.stats()
+            if transcode_stats['jobs']:
+                logger.info(f"Conversiones: {transcode_stats['jobs']}, "
+                            f"media {transcode_stats['mean_encode_seconds']:.1f}s, "
+                            f"espera media {transcode_stats['mean_wait_seconds']:.1f}s")
             
             if failed_tracks:
-                logger.warning("Canciones que fallaron:")
-                for track in failed_tracks:
-                    logger.warning(f"  - {track}")
+                # Un solo registro: RepeatFilter recortaría la lista línea a línea
+                logger.warning("Canciones que fallaron:\n" + "\n".join(
+                    f"  - {failed['track']} [{failed['error_class']}]" for failed in failed_tracks))
             
             return downloaded_count, failed_tracks
             
         except Exception as e:
             logger.error(f"Error fatal en download_playlist: {str(e)}")
             raise
+        finally:
+            if journal:
+                journal.close()
+            if self.keep_alive:
+                self.strategy_stats.save()
+            else:
+                self.close()
 
 def main():
     """Función principal"""
@@ -765,8 +4232,11 @@ def main():
         print("• Estar logueado en YouTube en tu navegador")
         print("\n" + "="*50)
         
+        # Formato de salida
+        output_format = input("Formato de salida (mp3/original, Enter para 'mp3'): ").strip().lower() or 'mp3'
+        
         # Inicializar downloader
-        downloader = SpotifyDownloader()
+        downloader = SpotifyDownloader(output_format=output_format)
         
         # URL de la playlist de Spotify
         playlist_url = input("\nIngresa la URL de la playlist de Spotify: ").strip()
@@ -776,8 +4246,15 @@ def main():
         if not output_dir:
             output_dir = 'downloads'
         
+        # Modo de descarga
+        pipelined = input("¿Usar modo concurrente? (s/n, Enter para 'n'): ").strip().lower() == 's'
+        incremental = input("¿Sincronización incremental? (s/n, Enter para 'n'): ").strip().lower() == 's'
+        prune = incremental and input("¿Eliminar canciones quitadas de la playlist? (s/n): ").strip().lower() == 's'
+        
         # Descargar playlist
-        success, failures = downloader.download_playlist(playlist_url, output_dir)
+        success, failures = downloader.download_playlist(
+            playlist_url, output_dir, pipelined=pipelined, incremental=incremental, prune=prune
+        )
         
         print(f"\n🎉 Descarga completada!")
         print(f"✅ Canciones descargadas: {success}")
@@ -785,8 +4262,8 @@ def main():
         
         if failures:
             print("\nCanciones que fallaron:")
-            for track in failures:
-                print(f"  - {track}")
+            for failed in failures:
+                print(f"  - {failed['track']} [{failed['error_class']}]")
                 
     except KeyboardInterrupt:
         logger.info("Descarga interrumpida por el usuario")
@@ -796,5 +4273,224 @@ def main():
         print(f"Error crítico: {str(e)}")
         sys.exit(1)
 
+# Configuración del modo batch: valores por defecto < archivo --config <
+# variables de entorno < opciones de línea de comandos
+BATCH_DEFAULTS = {
+    'spotify_client_id': None,
+    'spotify_client_secret': None,
+    'spotify_redirect_uri': None,
+    'spotify_username': None,
+    'cookies_file': YT_COOKIES_FILE,
+    'library_dir': LIBRARY_DIR,
+    'output_dir': 'downloads',
+    'output_format': OUTPUT_FORMAT,
+    'pipelined': False,
+    'workers': None,
+    'incremental': False,
+    'prune': False,
+    'retag': False,
+    'metrics_file': METRICS_PROMETHEUS_FILE,
+    'identities': YT_IDENTITIES,
+    'identity_health_url': IDENTITY_HEALTH_URL,
+    'bandwidth_limit': BANDWIDTH_LIMIT,
+    'bandwidth_limit_hours': BANDWIDTH_LIMIT_HOURS,
+}
+BATCH_ENV_VARS = {
+    'spotify_client_id': 'SPOTIFY_CLIENT_ID',
+    'spotify_client_secret': 'SPOTIFY_CLIENT_SECRET',
+    'spotify_redirect_uri': 'SPOTIFY_REDIRECT_URI',
+    'spotify_username': 'SPOTIFY_USERNAME',
+    'cookies_file': 'SPOTIFY_DL_COOKIES_FILE',
+    'library_dir': 'SPOTIFY_DL_LIBRARY_DIR',
+    'output_dir': 'SPOTIFY_DL_OUTPUT_DIR',
+    'output_format': 'SPOTIFY_DL_OUTPUT_FORMAT',
+    'pipelined': 'SPOTIFY_DL_PIPELINED',
+    'incremental': 'SPOTIFY_DL_INCREMENTAL',
+    'prune': 'SPOTIFY_DL_PRUNE',
+    'retag': 'SPOTIFY_DL_RETAG',
+    'metrics_file': 'SPOTIFY_DL_METRICS_FILE',
+    'identities': 'SPOTIFY_DL_IDENTITIES',
+    'identity_health_url': 'SPOTIFY_DL_IDENTITY_HEALTH_URL',
+    'bandwidth_limit': 'SPOTIFY_DL_BANDWIDTH_LIMIT',
+    'bandwidth_limit_hours': 'SPOTIFY_DL_BANDWIDTH_LIMIT_HOURS',
+}
+
+# Códigos de salida del modo batch
+EXIT_OK = 0        # Todas las playlists sin fallos
+EXIT_PARTIAL = 1   # Algunas canciones fallaron
+EXIT_ERROR = 2     # Alguna playlist no se pudo procesar
+
+def parse_batch_args(argv):
+    """Opciones de línea de comandos del modo batch"""
+    parser = argparse.ArgumentParser(
+        description="Descarga varias playlists de Spotify sin interacción"
+    )
+    parser.add_argument('playlists', nargs='*', help="URLs de playlists de Spotify")
+    parser.add_argument('--jobs', help="Archivo de trabajos: JSON [{url, output_dir}] o una URL por línea")
+    parser.add_argument('--config', help="Archivo de configuración JSON")
+    parser.add_argument('--output-dir', dest='output_dir')
+    parser.add_argument('--output-format', dest='output_format', choices=['mp3', 'original'])
+    parser.add_argument('--library-dir', dest='library_dir', help="Biblioteca compartida entre playlists")
+    parser.add_argument('--pipelined', action='store_const', const=True)
+    parser.add_argument('--incremental', action='store_const', const=True)
+    parser.add_argument('--prune', action='store_const', const=True)
+    parser.add_argument('--retag', action='store_const', const=True,
+                        help="Solo re-etiqueta los archivos ya descargados (requiere el manifiesto)")
+    parser.add_argument('--metrics-file', dest='metrics_file',
+                        help="Archivo de métricas en formato de texto de Prometheus")
+    parser.add_argument('--identities',
+                        help="Archivo JSON con las identidades de YouTube [{name, cookies_file, proxy}]")
+    parser.add_argument('--bandwidth-limit', dest='bandwidth_limit',
+                        help="Ancho de banda máximo de las descargas en bytes/s (admite K/M, p.ej. 2M)")
+    parser.add_argument('--bandwidth-limit-hours', dest='bandwidth_limit_hours',
+                        help="Horas locales en las que aplica el límite, p.ej. 9-18")
+    parser.add_argument('--status-file', help="Escribe también el estado JSON en este archivo")
+    return parser.parse_args(argv)
+
+def parse_bandwidth(value):
+    """Convierte '500K', '2M' o un número a bytes/s (None si no hay límite)"""
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    text = value.strip().upper().removesuffix('/S').removesuffix('B')
+    multiplier = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}.get(text[-1:], 1)
+    return float(text.rstrip('KMG')) * multiplier
+
+def load_batch_config(args):
+    """Combina valores por defecto, archivo de configuración, entorno y línea de comandos"""
+    config = dict(BATCH_DEFAULTS)
+    
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    
+    for key, env_var in BATCH_ENV_VARS.items():
+        value = os.environ.get(env_var)
+        if value is None:
+            continue
+        if isinstance(BATCH_DEFAULTS[key], bool):
+            value = value.strip().lower() in ('1', 'true', 'yes', 's', 'si', 'sí')
+        config[key] = value
+    
+    for key in ('output_dir', 'output_format', 'library_dir', 'pipelined', 'incremental', 'prune', 'retag',
+                'metrics_file', 'identities', 'bandwidth_limit', 'bandwidth_limit_hours'):
+        value = getattr(args, key)
+        if value is not None:
+            config[key] = value
+    
+    # Las identidades pueden venir en línea o como ruta a un archivo JSON
+    if isinstance(config['identities'], str):
+        with open(config['identities'], 'r', encoding='utf-8') as f:
+            config['identities'] = json.load(f)
+    config['bandwidth_limit'] = parse_bandwidth(config['bandwidth_limit'])
+    if isinstance(config['bandwidth_limit_hours'], str):
+        start, end = config['bandwidth_limit_hours'].split('-')
+        config['bandwidth_limit_hours'] = (int(start), int(end))
+    return config
+
+def load_batch_jobs(args, config):
+    """Lista de trabajos [{url, output_dir}] desde la línea de comandos y/o --jobs"""
+    jobs = [{'url': url, 'output_dir': config['output_dir']} for url in args.playlists]
+    
+    if args.jobs:
+        with open(args.jobs, 'r', encoding='utf-8') as f:
+            content = f.read()
+        if content.lstrip().startswith('['):
+            for entry in json.loads(content):
+                if isinstance(entry, str):
+                    entry = {'url': entry}
+                jobs.append({'url': entry['url'], 'output_dir': entry.get('output_dir', config['output_dir'])})
+        else:
+            for line in content.splitlines():
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                parts = line.split(None, 1)
+                jobs.append({'url': parts[0], 'output_dir': parts[1] if len(parts) > 1 else config['output_dir']})
+    return jobs
+
+def batch_main(argv=None):
+    """
+    Punto de entrada sin interacción: procesa todas las playlists en un solo
+    proceso (cachés, autenticación y pools compartidos) y escribe el estado
+    en JSON por stdout. Retorna el código de salida
+    """
+    # stdout queda reservado para el estado en JSON
+    redirect_console_logging(sys.stderr)
+    
+    args = parse_batch_args(sys.argv[1:] if argv is None else argv)
+    started = time.time()
+    results = []
+    status = {'status': 'error', 'exit_code': EXIT_ERROR, 'playlists': results}
+    
+    try:
+        config = load_batch_config(args)
+        jobs = load_batch_jobs(args, config)
+        if not jobs:
+            raise ValueError("No se indicó ninguna playlist")
+        
+        downloader = SpotifyDownloader(
+            output_format=config['output_format'],
+            interactive=False,
+            keep_alive=True,
+            client_id=config['spotify_client_id'],
+            client_secret=config['spotify_client_secret'],
+            redirect_uri=config['spotify_redirect_uri'],
+            username=config['spotify_username'],
+            cookies_file=config['cookies_file'],
+            library_dir=config['library_dir'],
+            metrics_file=config['metrics_file'],
+            identities=config['identities'],
+            identity_health_url=config['identity_health_url'],
+            bandwidth_limit=config['bandwidth_limit'],
+            bandwidth_limit_hours=config['bandwidth_limit_hours'],
+        )
+        try:
+            for job in jobs:
+                result = {'url': job['url'], 'output_dir': job['output_dir']}
+                try:
+                    if config['retag']:
+                        retagged = downloader.retag_playlist(job['url'], job['output_dir'])
+                        result.update(status='ok', retagged=retagged)
+                    else:
+                        downloaded, failed = downloader.download_playlist(
+                            job['url'], job['output_dir'],
+                            pipelined=config['pipelined'], workers=config['workers'],
+                            incremental=config['incremental'], prune=config['prune']
+                        )
+                        result.update(status='partial' if failed else 'ok', downloaded=downloaded, failed=failed)
+                except Exception as e:
+                    result.update(status='error', error=str(e))
+                results.append(result)
+        finally:
+            downloader.close()
+        
+        if any(r['status'] == 'error' for r in results):
+            status.update(status='error', exit_code=EXIT_ERROR)
+        elif any(r['status'] == 'partial' for r in results):
+            status.update(status='partial', exit_code=EXIT_PARTIAL)
+        else:
+            status.update(status='ok', exit_code=EXIT_OK)
+            
+    except KeyboardInterrupt:
+        logger.info("Batch interrumpido por el usuario")
+        status['error'] = 'interrupted'
+    except Exception as e:
+        logger.critical(f"Error crítico en batch: {str(e)}")
+        status['error'] = str(e)
+    
+    status['elapsed_seconds'] = round(time.time() - started, 1)
+    output = json.dumps(status, ensure_ascii=False, indent=2)
+    print(output)
+    if args.status_file:
+        with open(args.status_file, 'w', encoding='utf-8') as f:
+            f.write(output)
+    return status['exit_code']
+
 if __name__ == "__main__":
+    setup_logging()
+    # Con argumentos se ejecuta en modo batch (sin preguntas)
+    if len(sys.argv) > 1:
+        sys.exit(batch_main())
     main()
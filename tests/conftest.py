@@ -0,0 +1,111 @@
+import contextlib
+import os
+import sys
+import types
+import urllib.parse
+
+import pytest
+
+# main.py es un script en la raíz del repositorio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def yt_dlp_modules(monkeypatch):
+    """yt_dlp real si está instalado; si no, lo mínimo que usa main (Request, determine_protocol)"""
+    try:
+        import yt_dlp.networking  # noqa: F401
+        import yt_dlp.utils  # noqa: F401
+        return
+    except ImportError:
+        pass
+    
+    class Request:
+        def __init__(self, url, headers=None):
+            self.url = url
+            self.headers = dict(headers or {})
+    
+    def determine_protocol(info_dict):
+        return urllib.parse.urlparse(info_dict['url']).scheme
+    
+    package = types.ModuleType('yt_dlp')
+    package.networking = types.ModuleType('yt_dlp.networking')
+    package.networking.Request = Request
+    package.utils = types.ModuleType('yt_dlp.utils')
+    package.utils.determine_protocol = determine_protocol
+    monkeypatch.setitem(sys.modules, 'yt_dlp', package)
+    monkeypatch.setitem(sys.modules, 'yt_dlp.networking', package.networking)
+    monkeypatch.setitem(sys.modules, 'yt_dlp.utils', package.utils)
+
+
+class FakeYDLPool:
+    """YoutubeDLPool de prueba: siempre la misma instancia, registrando perfiles y opciones"""
+    
+    def __init__(self, ydl):
+        self.ydl = ydl
+        self.calls = []
+    
+    def get(self, profile, opts, outtmpl=None, format_spec=None):
+        self.calls.append((profile, opts))
+        if outtmpl is not None:
+            self.ydl.params['outtmpl'] = {'default': outtmpl}
+        if format_spec is not None:
+            self.ydl.params['format'] = format_spec
+        return self.ydl
+    
+    def release_thread(self):
+        pass
+
+
+class BaseFakeYDL:
+    """YoutubeDL de prueba; cada test sobreescribe lo que necesita"""
+    
+    def __init__(self):
+        self.params = {}
+
+
+@pytest.fixture
+def make_downloader(tmp_path):
+    """
+    SpotifyDownloader sin autenticación (sin Spotify ni YouTube reales), con
+    una sola identidad sana y el YoutubeDL indicado
+    """
+    import main
+    
+    def make(ydl=None, **attrs):
+        downloader = object.__new__(main.SpotifyDownloader)
+        downloader.output_format = 'mp3'
+        downloader.interactive = True
+        downloader.keep_alive = True
+        downloader.stream_transcode = False
+        downloader.yt_auth = None
+        downloader.library = None
+        downloader.ydl_pool = FakeYDLPool(ydl or BaseFakeYDL())
+        downloader.metrics = main.RunMetrics()
+        downloader.metrics_file = None
+        downloader.playlist_metrics = {}
+        downloader.transcoder = main.TranscodeScheduler(processes=1)
+        downloader.download_controller = main.DownloadController()
+        downloader.circuit_breaker = main.CircuitBreaker()
+        downloader.strategy_stats = main.StrategyStats(path=str(tmp_path / 'strategy_stats.json'))
+        identity = main.YouTubeIdentity('test')
+        identity.healthy = True
+        downloader.identities = main.IdentityPool([identity], downloader.ydl_pool)
+        for name, value in attrs.items():
+            setattr(downloader, name, value)
+        return downloader
+    
+    return make
+
+
+@pytest.fixture
+def download_state():
+    """Estado compartido de run_strategies para llamar a una estrategia suelta"""
+    import main
+    
+    def make(track=None, stream=False):
+        return {'info': None, 'extracted': False, 'last_error': None, 'track': track,
+                'identity': main.YouTubeIdentity('test'), 'stream': stream,
+                'slot': contextlib.nullcontext()}
+    
+    return make
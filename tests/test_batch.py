@@ -0,0 +1,59 @@
+import json
+import sys
+
+import main
+
+
+class ScreenYDL:
+    """Imita la salida de pantalla de yt-dlp según quiet/noprogress/logtostderr"""
+
+    def __init__(self, params):
+        self.params = params
+
+    def download(self, urls):
+        screen = sys.stderr if self.params.get('logtostderr') else sys.stdout
+        if not self.params.get('quiet'):
+            print(f"[youtube] Extracting URL: {urls[0]}", file=screen)
+        if not self.params.get('noprogress'):
+            print("[download]  50.0% of 3.00MiB", file=screen)
+
+
+class BatchDownloader(main.SpotifyDownloader):
+    def __init__(self, output_format='mp3', interactive=True, **kwargs):
+        self.output_format = output_format
+        self.interactive = interactive
+        self.yt_auth = type('Auth', (), {'get_auth_options': lambda self: {}})()
+
+    def download_playlist(self, playlist_url, output_dir, **kwargs):
+        for opts in self.build_download_options().values():
+            ScreenYDL(opts).download(['https://www.youtube.com/watch?v=x'])
+        return 1, 0
+
+    def close(self):
+        pass
+
+
+def test_batch_stdout_is_only_json(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(main, 'SpotifyDownloader', BatchDownloader)
+
+    exit_code = main.batch_main([
+        'https://open.spotify.com/playlist/x',
+        '--output-dir', str(tmp_path),
+        '--metrics-file', str(tmp_path / 'metrics.prom'),
+    ])
+
+    captured = capsys.readouterr()
+    status = json.loads(captured.out)
+    assert exit_code == main.EXIT_OK
+    assert status['playlists'][0]['downloaded'] == 1
+    assert '[download]' not in captured.out
+
+
+def test_interactive_keeps_yt_dlp_output(make_downloader):
+    downloader = make_downloader()
+    downloader.yt_auth = type('Auth', (), {'get_auth_options': lambda self: {}})()
+
+    opts = downloader.build_download_options()['sabr']
+
+    assert opts['quiet'] is False
+    assert 'logtostderr' not in opts
@@ -0,0 +1,35 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize('message, expected', [
+    # Mensajes reales de yt-dlp
+    ("ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm you’re not a bot. Use --cookies-from-browser "
+     "or --cookies for the authentication.", 'throttled'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm you're not a bot", 'throttled'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. This content isn’t available, try again later. "
+     "The current session has been rate-limited by YouTube for up to an hour.", 'throttled'),
+    ("ERROR: unable to download video data: HTTP Error 429: Too Many Requests", 'throttled'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Sign in to confirm your age. This video may be inappropriate "
+     "for some users.", 'auth'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Join this channel to get access to members-only content "
+     "like this video, and other exclusive perks.", 'auth'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Private video. Sign in if you've been granted access to this video",
+     'permanent'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. This video has been removed by the uploader",
+     'permanent'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Video unavailable. The uploader has not made this video "
+     "available in your country", 'permanent'),
+    ("ERROR: [youtube] dQw4w9WgXcQ: Video unavailable", 'permanent'),
+    ("ERROR: unable to download video data: HTTP Error 403: Forbidden", 'transient'),
+    ("ERROR: [download] Got error: The read operation timed out", 'transient'),
+    (None, 'transient'),
+])
+def test_classify_error(message, expected):
+    assert main.classify_error(message) == expected
+
+
+def test_rate_limiter_treats_session_rate_limit_as_throttle():
+    message = "Video unavailable. This content isn’t available, try again later."
+    assert main.AdaptiveRateLimiter.is_throttle_error(message)
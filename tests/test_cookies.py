@@ -0,0 +1,34 @@
+import json
+import sys
+import types
+
+import main
+
+
+class FakeCookie:
+    def __init__(self, name, value):
+        self.domain = '.youtube.com'
+        self.path = '/'
+        self.secure = True
+        self.expires = 4102444800
+        self.name = name
+        self.value = value
+
+
+def test_browser_cookies_check_is_cached_for_permanent_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    browser_cookie3 = types.ModuleType('browser_cookie3')
+    for browser in ('chrome', 'firefox', 'edge', 'opera', 'brave', 'safari'):
+        setattr(browser_cookie3, browser, lambda domain_name: [FakeCookie('SID', 'abc')])
+    monkeypatch.setitem(sys.modules, 'browser_cookie3', browser_cookie3)
+    
+    auth = main.YouTubeAuthenticator(interactive=False, cookies_file=str(tmp_path / 'youtube_cookies.txt'))
+    verified = []
+    monkeypatch.setattr(auth, 'verify_cookies', lambda path, use_cache=True: verified.append(use_cache) or True)
+    
+    assert auth.extract_cookies_from_browser()
+    
+    assert verified == [False]
+    with open(main.YT_COOKIES_CHECK_FILE, encoding='utf-8') as f:
+        assert list(json.load(f)) == [str(tmp_path / 'youtube_cookies.txt')]
+    assert auth.cached_cookie_check(auth.cookies_file)
@@ -0,0 +1,83 @@
+import main
+from conftest import BaseFakeYDL
+
+
+def make_controller(**kwargs):
+    options = dict(initial=2, minimum=1, maximum=8, interval=1, hold_windows=2,
+                   autotune=True, bandwidth_limit=None)
+    options.update(kwargs)
+    return main.DownloadController(**options)
+
+
+def close_window(controller, start, byte_count, active=None):
+    """Cierra una ventana de 1 s con byte_count bytes y todas las plazas ocupadas"""
+    controller.active = controller.limit if active is None else active
+    controller.window_started = controller.accounted = start
+    controller.window_bytes = byte_count
+    with controller.condition:
+        controller.maybe_tune(start + 1)
+    controller.active = 0
+    return controller.limit
+
+
+def test_aimd_increases_while_throughput_grows():
+    controller = make_controller()
+    assert close_window(controller, 0, 1000) == 3
+    assert close_window(controller, 1, 1500) == 4
+    assert controller.counts['increases'] == 2
+
+
+def test_aimd_steps_back_when_last_slot_adds_nothing():
+    controller = make_controller()
+    close_window(controller, 0, 1000)
+    assert close_window(controller, 1, 1020) == 2
+    # Se espera hold_windows ventanas antes de volver a probar
+    assert close_window(controller, 2, 1020) == 2
+    assert close_window(controller, 3, 1020) == 2
+    assert close_window(controller, 4, 1020) == 3
+
+
+def test_aimd_halves_on_congestion():
+    controller = make_controller(initial=6)
+    controller.congestion()
+    assert close_window(controller, 0, 1000) == 3
+    assert controller.counts['decreases'] == 1
+
+
+def test_unsaturated_window_does_not_increase():
+    controller = make_controller(initial=4)
+    assert close_window(controller, 0, 1000, active=1) == 4
+
+
+class TransferYDL(BaseFakeYDL):
+    """Comprueba las plazas ocupadas en cada fase de la descarga"""
+
+    def __init__(self, controller, output_path):
+        super().__init__()
+        self.controller = controller
+        self.output_path = output_path
+        self.active = {}
+
+    def extract_info(self, url, download=False, process=True):
+        self.active['extract'] = self.controller.active
+        return {'formats': [{'format_id': '140', 'ext': 'm4a', 'acodec': 'mp4a', 'vcodec': 'none',
+                             'url': 'https://example.invalid/a', 'protocol': 'https'}]}
+
+    def process_ie_result(self, info, download=True):
+        self.active['download'] = self.controller.active
+        with open(self.output_path + '.m4a', 'wb') as f:
+            f.write(b'audio')
+
+
+def test_slot_is_held_only_during_the_transfer(make_downloader, tmp_path):
+    output_path = str(tmp_path / 'song')
+    controller = make_controller()
+    ydl = TransferYDL(controller, output_path)
+    downloader = make_downloader(ydl, download_controller=controller)
+    downloader.build_download_options = lambda transcode, identity: {'sabr': {}, 'direct': {}, 'alt': {}}
+
+    path = downloader.fetch_audio('https://youtu.be/x', output_path, transcode=False, controlled=True)
+
+    assert path == output_path + '.m4a'
+    assert ydl.active == {'extract': 0, 'download': 1}
+    assert controller.active == 0
@@ -0,0 +1,207 @@
+import http.cookiejar
+import http.server
+import threading
+import time
+import urllib.request
+
+import pytest
+
+import main
+
+BOT_PAGE = (b'<html>{"playabilityStatus":{"status":"LOGIN_REQUIRED",'
+            b'"reason":"Sign in to confirm you\xe2\x80\x99re not a bot"}}</html>')
+# Página sana cuyo texto libre contiene marcadores de limitación
+OK_PAGE = (b'<html><title>Too Many Requests (try again later) - live</title>'
+           b'{"playabilityStatus":{"status":"OK"}}</html>')
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    """
+    YouTube de prueba: bloquea la sesión SID=blocked, manda SID=sorry a /sorry
+    y cuenta las peticiones (también como proxy)
+    """
+    
+    def do_GET(self):
+        server = self.server
+        cookie = self.headers.get('Cookie') or ''
+        server.requests.append((self.path, cookie))
+        if 'SID=sorry' in cookie and '/sorry' not in self.path:
+            self.send_response(302)
+            self.send_header('Location', '/sorry/index')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        body = BOT_PAGE if 'SID=blocked' in cookie else OK_PAGE
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stand_in():
+    """Servidor local que hace de YouTube y de proxy"""
+    servers = []
+    
+    def start():
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+    
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class UrllibYDL:
+    """Red de yt-dlp mínima: respeta 'cookiefile' y 'proxy' como YoutubeDL"""
+    
+    def __init__(self, opts):
+        handlers = []
+        if opts.get('cookiefile'):
+            jar = http.cookiejar.MozillaCookieJar(opts['cookiefile'])
+            jar.load(ignore_discard=True, ignore_expires=True)
+            handlers.append(urllib.request.HTTPCookieProcessor(jar))
+        proxy = opts.get('proxy')
+        handlers.append(urllib.request.ProxyHandler({'http': proxy} if proxy else {}))
+        self.opener = urllib.request.build_opener(*handlers)
+    
+    def urlopen(self, request):
+        return self.opener.open(urllib.request.Request(request.url, headers=dict(request.headers)), timeout=5)
+
+
+class UrllibYDLPool:
+    def get(self, profile, opts, outtmpl=None):
+        return UrllibYDL(opts)
+
+
+def cookie_file(tmp_path, name, sid):
+    path = tmp_path / f"{name}.txt"
+    path.write_text("# Netscape HTTP Cookie File\n"
+                    f"127.0.0.1\tFALSE\t/\tFALSE\t2147483647\tSID\t{sid}\n")
+    return str(path)
+
+
+def make_pool(tmp_path, server, entries, yt_auth=None, **kwargs):
+    return main.IdentityPool.from_config(entries, yt_auth, UrllibYDLPool(),
+                                         health_url=f"http://127.0.0.1:{server.server_port}/watch?v=probe",
+                                         **kwargs)
+
+
+def use(pool, kind='search'):
+    identity = pool.acquire(kind)
+    identity.rate_limiter.acquire(kind)
+    pool.release(identity)
+    return identity.name
+
+
+def test_probe_marks_blocked_and_missing_identities(yt_dlp_modules, stand_in, tmp_path):
+    server = stand_in()
+    pool = make_pool(tmp_path, server, [
+        {'name': 'good', 'cookies_file': cookie_file(tmp_path, 'good', 'good')},
+        {'name': 'blocked', 'cookies_file': cookie_file(tmp_path, 'blocked', 'blocked')},
+        {'name': 'sorry', 'cookies_file': cookie_file(tmp_path, 'sorry', 'sorry')},
+        {'name': 'missing', 'cookies_file': str(tmp_path / 'missing.txt')},
+    ])
+    
+    assert use(pool) == 'good'
+    states = {name: stats['state'] for name, stats in pool.stats().items()}
+    assert states == {'good': 'ok', 'blocked': 'unhealthy', 'sorry': 'unhealthy', 'missing': 'unhealthy'}
+    assert pool.stats()['blocked']['health_failures'] == 1
+    # La identidad sin archivo de cookies no llega a hacer la petición
+    assert sorted(cookie for path, cookie in server.requests if '/sorry' not in path) == [
+        'SID=blocked', 'SID=good', 'SID=sorry']
+
+
+def test_blocked_reason_ignores_free_page_text():
+    assert main.IdentityPool.blocked_reason('https://www.youtube.com/watch?v=x', OK_PAGE.decode()) is None
+    assert main.IdentityPool.blocked_reason('https://www.youtube.com/watch?v=x', 'not a bot') is None
+    assert main.IdentityPool.blocked_reason('https://consent.youtube.com/m?continue=x', '')
+
+
+def test_requests_rotate_across_healthy_identities(yt_dlp_modules, stand_in, tmp_path):
+    server = stand_in()
+    proxy = stand_in()
+    pool = make_pool(tmp_path, server, [
+        {'name': 'a', 'cookies_file': cookie_file(tmp_path, 'a', 'a')},
+        {'name': 'b', 'proxy': f"http://127.0.0.1:{proxy.server_port}"},
+    ])
+    
+    names = [use(pool) for _ in range(4)]
+    
+    assert sorted(names) == ['a', 'a', 'b', 'b']
+    # El probe de 'b' salió por su proxy
+    assert len(server.requests) == 1 and len(proxy.requests) == 1
+    assert proxy.requests[0][0].startswith('http://127.0.0.1:')
+
+
+def test_bot_detection_cools_identity_until_it_passes_probe_again(yt_dlp_modules, stand_in, tmp_path):
+    server = stand_in()
+    pool = make_pool(tmp_path, server, [
+        {'name': 'a', 'cookies_file': cookie_file(tmp_path, 'a', 'a')},
+        {'name': 'b', 'cookies_file': cookie_file(tmp_path, 'b', 'b')},
+    ], cooldown=0.3)
+    for identity in pool.identities:
+        identity.rate_limiter.buckets['search']['rate'] = 1000.0
+    use(pool)
+    a = next(identity for identity in pool.identities if identity.name == 'a')
+    
+    pool.report(a, 'search', "ERROR: [youtube] x: Sign in to confirm you’re not a bot")
+    
+    assert pool.stats()['a']['state'] == 'cooling'
+    assert pool.any_ready()
+    a.rate_limiter.buckets['search']['blocked_until'] = 0.0  # Solo interesa el enfriamiento de la identidad
+    assert {use(pool) for _ in range(3)} == {'b'}
+    
+    probes = len(server.requests)
+    time.sleep(0.35)
+    assert 'a' in {use(pool) for _ in range(4)}
+    assert len(server.requests) == probes + 1
+    assert pool.stats()['a']['cooldowns'] == 1
+
+
+def test_default_identity_is_probed(yt_dlp_modules, stand_in, tmp_path):
+    server = stand_in()
+    blocked = cookie_file(tmp_path, 'default', 'blocked')
+    
+    class Auth:
+        cookies_file = blocked
+        
+        def get_auth_options(self):
+            return {'cookiefile': blocked}
+        
+        def cached_cookie_check(self, cookie_file):
+            return False
+    
+    pool = make_pool(tmp_path, server, [], yt_auth=Auth())
+    pool.acquire('search')
+    
+    assert pool.stats()['default']['state'] == 'unhealthy'
+    assert server.requests[0][1] == 'SID=blocked'
+
+
+def test_default_identity_reuses_cached_cookie_check(yt_dlp_modules, stand_in, tmp_path, monkeypatch):
+    server = stand_in()
+    monkeypatch.setattr(main, 'YT_COOKIES_CHECK_FILE', str(tmp_path / 'cookie_check.json'))
+    auth = main.YouTubeAuthenticator(interactive=False, cookies_file=cookie_file(tmp_path, 'default', 'good'))
+    auth.authenticated = True
+    auth.store_cookie_check(auth.cookies_file)
+    
+    pool = make_pool(tmp_path, server, [], yt_auth=auth, cooldown=0.1)
+    identity = pool.acquire('search')
+    pool.release(identity)
+    
+    assert pool.stats()['default']['state'] == 'ok'
+    assert server.requests == []
+    # Tras una detección de bot el probe sí se hace: las cookies pueden ser válidas y estar bloqueadas
+    pool.report(identity, 'search', "Sign in to confirm you're not a bot")
+    time.sleep(0.15)
+    identity.rate_limiter.buckets['search']['blocked_until'] = 0.0
+    pool.release(pool.acquire('search'))
+    assert len(server.requests) == 1
@@ -0,0 +1,74 @@
+import os
+from types import SimpleNamespace
+
+import main
+
+
+def make_jobs(downloader, output_dir):
+    tracks = [SimpleNamespace(title=title, artist='Artist', track_id=track_id, label=f"{title} - Artist")
+              for title, track_id in (('Uno', 'id1'), ('Dos', 'id2'))]
+    return list(downloader.build_track_jobs(tracks, str(output_dir)))
+
+
+def touch(path, data=b'x'):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_interrupted_run_resumes_each_track_from_its_stage(make_downloader, tmp_path):
+    downloader = make_downloader()
+    first, second = make_jobs(downloader, tmp_path)
+    journal = main.DownloadJournal(str(tmp_path), 'pl')
+    first['journal'] = second['journal'] = journal
+    first['youtube_url'] = second['youtube_url'] = 'https://youtu.be/x'
+    first['file_path'] = first['output_path'] + '.m4a'
+    touch(first['file_path'])
+    downloader.mark_stage(first, 'searched')
+    downloader.mark_stage(first, 'downloaded')
+    downloader.mark_stage(second, 'searched')
+    # Caída: el journal queda en disco y con archivos a medio escribir
+    journal.file.close()
+    touch(main.temp_output_path(first['output_path'] + '.mp3'))
+    touch(second['output_path'] + '.mp3')
+    touch(main.temp_output_path(second['output_path'] + '.mp3'))
+    touch(second['output_path'] + '.m4a.part')
+
+    journal = main.DownloadJournal(str(tmp_path), 'pl')
+    first, second = downloader.resume_from_journal(make_jobs(downloader, tmp_path), journal)
+
+    assert journal.interrupted
+    assert (first['stage'], first['file_path']) == ('downloaded', first['output_path'] + '.m4a')
+    assert os.path.exists(first['file_path'])
+    assert (second['stage'], second['youtube_url'], second['file_path']) == ('searched', 'https://youtu.be/x', None)
+    assert sorted(os.listdir(tmp_path)) == sorted([
+        os.path.basename(first['file_path']),
+        os.path.basename(second['output_path']) + '.m4a.part',
+        os.path.basename(journal.path),
+    ])
+    journal.close()
+
+
+def test_truncated_last_line_is_ignored(make_downloader, tmp_path):
+    downloader = make_downloader()
+    job = make_jobs(downloader, tmp_path)[0]
+    journal = main.DownloadJournal(str(tmp_path), 'pl')
+    job['journal'], job['youtube_url'] = journal, 'https://youtu.be/x'
+    downloader.mark_stage(job, 'searched')
+    journal.file.write('{"key": "id2", "sta')
+    journal.file.close()
+
+    journal = main.DownloadJournal(str(tmp_path), 'pl')
+
+    assert journal.get(job)['stage'] == 'searched'
+    assert list(journal.entries) == ['id1']
+    journal.close()
+
+
+def test_completed_run_removes_the_journal(tmp_path):
+    journal = main.DownloadJournal(str(tmp_path), 'pl')
+    journal.close(completed=True)
+
+    assert not os.path.exists(journal.path)
+    journal = main.DownloadJournal(str(tmp_path), 'pl')
+    assert not journal.interrupted
+    journal.close()
@@ -0,0 +1,36 @@
+import os
+
+import main
+
+
+def make_track(track_id, album):
+    return main.TrackRecord(track_id, 'Song', ['Artist'], album, isrc='USABC1234567')
+
+
+def test_same_recording_on_other_album_is_not_shared(tmp_path):
+    library = main.TrackLibrary(str(tmp_path / 'library'))
+    single = make_track('single-id', 'Single')
+    compilation = make_track('compilation-id', 'Greatest Hits')
+    
+    assert main.TrackLibrary.key_for(single) != main.TrackLibrary.key_for(compilation)
+    
+    downloaded = tmp_path / 'Song_Artist.mp3'
+    downloaded.write_bytes(b'single audio')
+    library.store(main.TrackLibrary.key_for(single), str(downloaded), str(tmp_path / 'Song_Artist'))
+    
+    assert library.lookup(main.TrackLibrary.key_for(compilation)) is None
+
+
+def test_same_track_is_linked_across_playlists(tmp_path):
+    library = main.TrackLibrary(str(tmp_path / 'library'))
+    track = make_track('track-id', 'Album')
+    key = main.TrackLibrary.key_for(track)
+    for playlist in ('a', 'b'):
+        os.makedirs(tmp_path / playlist)
+    
+    downloaded = tmp_path / 'a' / 'Song_Artist.mp3'
+    downloaded.write_bytes(b'audio')
+    first = library.store(key, str(downloaded), str(tmp_path / 'a' / 'Song_Artist'))
+    second = library.link(key, library.lookup(key), str(tmp_path / 'b' / 'Song_Artist'))
+    
+    assert os.path.samefile(first, second)
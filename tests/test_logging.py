@@ -0,0 +1,51 @@
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+
+import main
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_import_does_not_configure_logging(tmp_path):
+    # Lo que hace un proceso del TranscodeScheduler con spawn/forkserver al reimportar el módulo
+    code = ("import logging, threading, main; "
+            "print(len(logging.getLogger().handlers), threading.active_count(), main.log_listener)")
+    result = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=ROOT), check=True)
+    
+    assert result.stdout.split() == ['0', '1', 'None']
+    assert not (tmp_path / 'spotify_downloader.log').exists()
+
+
+def make_record(msg, args=(), lineno=10, exc_info=None):
+    return logging.LogRecord('main', logging.WARNING, '/src/main.py', lineno, msg, args, exc_info)
+
+
+def test_repeat_filter_groups_the_same_call_across_tracks():
+    repeat_filter = main.RepeatFilter(limit=2)
+    passed = [repeat_filter.filter(make_record("❌ Formato %s falló: %s", ('140', f"error {n}")))
+              for n in range(4)]
+    
+    assert passed == [True, True, False, False]
+    # Otra llamada de log tiene su propio cupo
+    assert repeat_filter.filter(make_record("Otro aviso", lineno=20))
+
+
+def test_async_json_log_keeps_the_traceback():
+    log_queue = queue.Queue()
+    handler = main.TracebackQueueHandler(log_queue)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record("Falló %s", ('x',), exc_info=sys.exc_info())
+    
+    handler.handle(record)
+    data = json.loads(main.JsonLogFormatter().format(log_queue.get_nowait()))
+    
+    assert data['message'] == "Falló x"
+    assert data['exception'].endswith("ValueError: boom")
@@ -0,0 +1,49 @@
+import os
+from types import SimpleNamespace
+
+import main
+
+
+def test_prometheus_text_merges_playlists_under_one_type_line():
+    first, second = main.RunMetrics(), main.RunMetrics()
+    first.increment('tracks', 3, result='ok')
+    second.increment('tracks', 1, result='ok')
+    second.observe('stage_seconds', 2.0, stage='search')
+
+    text = main.RunMetrics.prometheus_text([({'playlist': 'a'}, first), ({'playlist': 'b'}, second)])
+
+    assert text.count('# TYPE spotify_dl_tracks_total counter') == 1
+    assert 'spotify_dl_tracks_total{playlist="a",result="ok"} 3' in text
+    assert 'spotify_dl_tracks_total{playlist="b",result="ok"} 1' in text
+    assert 'spotify_dl_stage_seconds_count{playlist="b",stage="search"} 1' in text
+
+
+class FakeSpotify:
+    def playlist(self, playlist_url, fields=None):
+        playlist_id = playlist_url.rsplit('/', 1)[1]
+        return {'id': playlist_id, 'name': playlist_id, 'snapshot_id': 'snap', 'tracks': {'total': 0}}
+
+
+def test_unchanged_playlists_still_get_report_and_metrics(make_downloader, tmp_path):
+    metrics_file = str(tmp_path / 'spotify_dl.prom')
+    downloader = make_downloader(
+        sp=FakeSpotify(), keep_alive=True, metrics_file=metrics_file,
+        search_cache=main.SearchCache(':memory:'),
+        cover_cache=SimpleNamespace(hits=0, misses=0), metadata_cache=SimpleNamespace(hits=0, misses=0),
+    )
+    for playlist_id in ('pl1', 'pl2'):
+        manifest = main.SyncManifest(str(tmp_path), playlist_id)
+        manifest.snapshot_id = 'snap'
+        manifest.save()
+
+        assert downloader.download_playlist(f"https://open.spotify.com/playlist/{playlist_id}",
+                                            str(tmp_path), incremental=True) == (0, [])
+        assert os.path.exists(tmp_path / main.RUN_REPORT_FILE.format(playlist_id=playlist_id))
+    # El archivo de Prometheus se escribe una sola vez, al cerrar el run
+    assert not os.path.exists(metrics_file)
+
+    downloader.write_prometheus()
+
+    text = open(metrics_file, encoding='utf-8').read()
+    assert 'spotify_dl_playlist_unchanged{playlist="pl1"} 1' in text
+    assert 'spotify_dl_playlist_unchanged{playlist="pl2"} 1' in text
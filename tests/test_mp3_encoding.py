@@ -0,0 +1,44 @@
+import main
+from conftest import BaseFakeYDL
+
+
+class FakeYDL(BaseFakeYDL):
+    """Descarga directa: escribe el m4a en la ruta de outtmpl"""
+    
+    def extract_info(self, url, download=False, process=True):
+        with open(self.prepare_filename({}), 'wb') as f:
+            f.write(b'm4a')
+        return {'id': 'abc', 'ext': 'm4a'}
+    
+    def prepare_filename(self, info):
+        return self.params['outtmpl']['default'].replace('%(ext)s', 'm4a')
+
+
+def test_mp3_mode_has_no_yt_dlp_mp3_postprocessor(make_downloader):
+    downloader = make_downloader(FakeYDL())
+    options = downloader.build_download_options(transcode=True, identity=main.YouTubeIdentity('test'))
+    assert all(opts['postprocessors'] == [] for opts in options.values())
+
+
+def test_mp3_is_encoded_once_with_tags(make_downloader, download_state, tmp_path, monkeypatch):
+    downloader = make_downloader(FakeYDL())
+    encoded = []
+    
+    def fake_run_transcode(func, input_path, output_path, tags, cover_path, duration_ms=None):
+        encoded.append((func, tags))
+        with open(output_path, 'wb') as f:
+            f.write(b'tagged mp3')
+        return 0, ''
+    
+    monkeypatch.setattr(downloader, 'run_transcode', fake_run_transcode)
+    track = main.TrackRecord('id1', 'Song', ['Artist'], 'Album')
+    output_path = str(tmp_path / 'Song_Artist')
+    options = downloader.build_download_options(transcode=True, identity=main.YouTubeIdentity('test'))
+    
+    result = downloader.try_direct_download('https://youtu.be/abc', output_path, True, options['direct'],
+                                            download_state(track=track))
+    
+    assert result == output_path + '.mp3'
+    assert [func for func, _ in encoded] == [main.run_ffmpeg_mp3]
+    assert encoded[0][1]['title'] == 'Song'
+    assert not (tmp_path / 'Song_Artist.m4a').exists()
@@ -0,0 +1,78 @@
+import pytest
+
+import main
+
+
+class Clock:
+    """Reloj falso: sleep avanza el tiempo sin esperar"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept += seconds
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(main.time, 'time', clock.time)
+    monkeypatch.setattr(main.time, 'sleep', clock.sleep)
+    return clock
+
+
+def make_limiter():
+    return main.AdaptiveRateLimiter(limits={'media': (2.0, 1)}, min_factor=0.125, recovery=0.25,
+                                    min_backoff=5, max_backoff=30)
+
+
+def test_acquire_waits_for_the_next_token(clock):
+    limiter = make_limiter()
+    limiter.acquire('media')
+    limiter.acquire('media')
+
+    assert clock.slept == pytest.approx(0.5)
+
+
+def test_throttle_backs_off_exponentially_up_to_the_cap(clock):
+    limiter = make_limiter()
+    backoffs = []
+    for _ in range(5):
+        limiter.report('media', "HTTP Error 429: Too Many Requests")
+        backoffs.append(limiter.buckets['media']['backoff'])
+
+    assert backoffs == [5, 10, 20, 30, 30]
+    assert limiter.buckets['media']['factor'] == 0.125
+    assert limiter.available('media') == 0.0
+    # La siguiente petición espera el fin de la pausa; después, la velocidad reducida
+    limiter.acquire('media')
+    assert clock.slept == pytest.approx(30)
+    limiter.acquire('media')
+    assert clock.slept == pytest.approx(30 + 1 / (2.0 * 0.125))
+
+
+def test_success_recovers_speed_and_halves_backoff(clock):
+    limiter = make_limiter()
+    limiter.report('media', "Sign in to confirm you're not a bot")
+    limiter.report('media', "Sign in to confirm you're not a bot")
+
+    limiter.report('media')
+
+    bucket = limiter.buckets['media']
+    assert (bucket['factor'], bucket['backoff']) == (0.5, 5)
+    for _ in range(4):
+        limiter.report('media')
+    assert (bucket['factor'], bucket['backoff']) == (1.0, 0.0)
+
+
+def test_other_errors_do_not_throttle(clock):
+    limiter = make_limiter()
+    limiter.report('media', "Video unavailable. This video is private")
+
+    assert limiter.buckets['media']['throttled'] == 0
+    assert limiter.available('media') == 1
@@ -0,0 +1,48 @@
+from types import SimpleNamespace
+
+import main
+from conftest import BaseFakeYDL
+
+
+class SearchYDL(BaseFakeYDL):
+    def __init__(self, error=None, entries=()):
+        super().__init__()
+        self.error = error
+        self.entries = list(entries)
+
+    def extract_info(self, query, download=False):
+        if self.error:
+            raise Exception(self.error)
+        return {'entries': self.entries}
+
+
+def make_track():
+    return SimpleNamespace(title='Song', artist='Artist', track_id='id1', duration_ms=200000)
+
+
+def search(make_downloader, ydl):
+    downloader = make_downloader(ydl, search_cache=main.SearchCache(':memory:'))
+    job = {'error_class': None}
+    return downloader, downloader.search_youtube(make_track(), job), job
+
+
+def test_empty_result_is_not_found(make_downloader):
+    downloader, url, job = search(make_downloader, SearchYDL())
+    assert url is None
+    assert job['error_class'] == 'not_found'
+    assert downloader.circuit_breaker.failures == []
+
+
+def test_throttled_search_keeps_its_class_and_counts_in_breaker(make_downloader):
+    downloader, url, job = search(make_downloader, SearchYDL("Sign in to confirm you're not a bot"))
+    assert url is None
+    assert job['error_class'] == 'throttled'
+    # La única identidad quedó en cool-down: la detección cuenta para el circuito
+    assert len(downloader.circuit_breaker.failures) == 1
+    # Un error de búsqueda no se guarda como caché negativa
+    assert downloader.search_cache.get('id1', 'Song', 'Artist', 200000) == (False, None)
+
+
+def test_transient_search_error_is_not_not_found(make_downloader):
+    downloader, url, job = search(make_downloader, SearchYDL("Connection reset by peer"))
+    assert job['error_class'] == 'transient'
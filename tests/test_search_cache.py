@@ -0,0 +1,39 @@
+import main
+
+
+def make_cache():
+    return main.SearchCache(':memory:')
+
+
+def test_normalize_keeps_non_latin_scripts():
+    assert main.SearchCache.normalize('群青') == '群青'
+    assert main.SearchCache.normalize('Кино — Группа крови') == 'кино группа крови'
+    assert main.SearchCache.normalize('방탄소년단') == '방탄소년단'
+    assert main.SearchCache.normalize('Canción (Remix)') == 'cancion remix'
+
+
+def test_normalize_keeps_kana_voicing_marks():
+    assert main.SearchCache.normalize('が') != main.SearchCache.normalize('か')
+
+
+def test_non_latin_titles_do_not_share_fallback_key():
+    cache = make_cache()
+    cache.put('id1', '夜に駆ける', 'YOASOBI', 'https://youtu.be/a', duration=261)
+    assert cache.get('id2', '群青', 'YOASOBI', 249000) == (False, None)
+
+
+def test_empty_normalized_title_has_no_fallback_key():
+    cache = make_cache()
+    assert cache.keys_for('id1', '!!!', '…') == ['id:id1']
+    cache.put(None, '!!!', '…', None)
+    assert cache.get('id2', '???', '…') == (False, None)
+
+
+def test_fallback_hit_requires_matching_duration():
+    cache = make_cache()
+    cache.put('id1', 'Song', 'Artist', 'https://youtu.be/a', duration=200)
+    assert cache.get('id2', 'Song', 'Artist', 201000) == (True, 'https://youtu.be/a')
+    assert cache.get('id3', 'Song', 'Artist', 400000) == (False, None)
+    assert cache.get('id3', 'Song', 'Artist') == (False, None)
+    # El ID exacto no depende de la duración
+    assert cache.get('id1', 'Song', 'Artist') == (True, 'https://youtu.be/a')
@@ -0,0 +1,53 @@
+import main
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_stats(tmp_path, monkeypatch, half_life=100):
+    clock = Clock()
+    monkeypatch.setattr(main.time, 'time', clock)
+    return main.StrategyStats(path=str(tmp_path / 'stats.json'), half_life=half_life, prior_latency=10), clock
+
+
+def test_new_strategies_keep_the_original_order(tmp_path, monkeypatch):
+    stats, _ = make_stats(tmp_path, monkeypatch)
+    assert stats.order(['a', 'b', 'c']) == ['a', 'b', 'c']
+
+
+def test_fast_successful_strategy_moves_first(tmp_path, monkeypatch):
+    stats, _ = make_stats(tmp_path, monkeypatch)
+    for _ in range(5):
+        stats.record('a', False, 20)
+        stats.record('c', True, 2)
+
+    assert stats.order(['a', 'b', 'c']) == ['c', 'b', 'a']
+
+
+def test_old_outcomes_decay(tmp_path, monkeypatch):
+    stats, clock = make_stats(tmp_path, monkeypatch)
+    for _ in range(5):
+        stats.record('a', False, 20)
+    assert stats.order(['a', 'b']) == ['b', 'a']
+
+    # Tras muchas vidas medias los fallos antiguos casi no pesan
+    clock.now += 20 * 100
+    stats.record('a', True, 2)
+
+    assert stats.stats['a']['failure'] < 0.001
+    assert stats.order(['a', 'b']) == ['a', 'b']
+
+
+def test_stats_survive_a_restart(tmp_path, monkeypatch):
+    stats, _ = make_stats(tmp_path, monkeypatch)
+    stats.record('c', True, 2)
+    stats.save()
+
+    reloaded, _ = make_stats(tmp_path, monkeypatch)
+
+    assert reloaded.order(['a', 'c']) == ['c', 'a']
@@ -0,0 +1,84 @@
+import io
+
+import main
+from conftest import BaseFakeYDL
+
+
+AUDIO = b'x' * 5000
+
+# Formato tal como lo deja extract_info(process=False): sin 'protocol' ni cabeceras calculadas
+RAW_FORMAT = {
+    'format_id': '140',
+    'url': 'https://rr1.googlevideo.example/videoplayback?itag=140',
+    'ext': 'm4a',
+    'acodec': 'mp4a.40.2',
+    'vcodec': 'none',
+    'abr': 129.5,
+    'filesize': len(AUDIO),
+}
+
+
+class FakeResponse:
+    def __init__(self, data, start):
+        self.stream = io.BytesIO(data)
+        self.status = 206
+        self.headers = {'Content-Range': f"bytes {start}-{start + len(data) - 1}/{len(AUDIO)}"}
+    
+    def read(self, size):
+        return self.stream.read(size)
+    
+    def close(self):
+        pass
+
+
+class FakeYDL(BaseFakeYDL):
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+    
+    def extract_info(self, url, download=False, process=True):
+        assert process is False
+        return {'id': 'abc', 'formats': [dict(RAW_FORMAT)]}
+    
+    def _calc_headers(self, info_dict):
+        return {'User-Agent': 'yt-dlp-test', 'Accept-Language': 'en-us'}
+    
+    def urlopen(self, request):
+        self.requests.append(request)
+        start, end = map(int, request.headers['Range'][len('bytes='):].split('-'))
+        return FakeResponse(AUDIO[start:end + 1], start)
+    
+    def process_ie_result(self, *args, **kwargs):
+        raise AssertionError("No se debe descargar a disco si el streaming funciona")
+
+
+def test_raw_https_format_is_streamed_into_ffmpeg(yt_dlp_modules, make_downloader, download_state,
+                                                  monkeypatch, tmp_path):
+    monkeypatch.setattr(main, 'STREAM_CHUNK_SIZE', 2048)
+    received = []
+    
+    def fake_stream_ffmpeg_mp3(chunks, output_path, tags=None, cover_path=None, timeout=300):
+        received.append(b''.join(chunks))
+        with open(output_path, 'wb') as f:
+            f.write(b'mp3')
+        return 0, ''
+    
+    monkeypatch.setattr(main, 'stream_ffmpeg_mp3', fake_stream_ffmpeg_mp3)
+    
+    ydl = FakeYDL()
+    downloader = make_downloader(ydl)
+    output_path = str(tmp_path / 'track')
+    state = download_state(stream=True)
+    
+    result = downloader.try_format_class('https://youtu.be/abc', output_path, output_path, False,
+                                         {}, state, 'm4a')
+    
+    assert result == output_path + '.mp3'
+    assert received == [AUDIO]
+    assert [r.headers['Range'] for r in ydl.requests] == ['bytes=0-2047', 'bytes=2048-4095', 'bytes=4096-6143']
+    assert all(r.headers['User-Agent'] == 'yt-dlp-test' for r in ydl.requests)
+
+
+def test_format_protocol_is_derived_when_missing(yt_dlp_modules):
+    assert main.SpotifyDownloader.format_protocol(RAW_FORMAT) == 'https'
+    assert main.SpotifyDownloader.format_protocol(dict(RAW_FORMAT, protocol='m3u8_native')) == 'm3u8_native'
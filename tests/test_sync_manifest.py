@@ -0,0 +1,58 @@
+import os
+
+import main
+
+
+def make_track(track_id, title, album='Album'):
+    return main.TrackRecord(track_id, title, ['Artist'], album)
+
+
+def make_job(downloader, track, output_dir):
+    return next(downloader.build_track_jobs([track], str(output_dir)))
+
+
+def saved_manifest(tmp_path, tracks):
+    manifest = main.SyncManifest(str(tmp_path), 'pl')
+    for track in tracks:
+        path = tmp_path / f"{track.track_id}.mp3"
+        path.write_bytes(b'audio')
+        manifest.record(track, str(path), f"https://youtu.be/{track.track_id}")
+    manifest.snapshot_id = 'snap1'
+    manifest.save()
+    return main.SyncManifest(str(tmp_path), 'pl')
+
+
+def test_snapshot_is_unchanged_only_with_files_on_disk(tmp_path):
+    manifest = saved_manifest(tmp_path, [make_track('id1', 'Uno')])
+
+    assert manifest.is_unchanged('snap1')
+    assert not manifest.is_unchanged('snap2')
+    assert not manifest.is_unchanged(None)
+    os.remove(tmp_path / 'id1.mp3')
+    assert not manifest.is_unchanged('snap1')
+
+
+def test_incremental_skips_known_tracks_and_retags_changed_ones(make_downloader, tmp_path):
+    manifest = saved_manifest(tmp_path, [make_track('id1', 'Uno'), make_track('id2', 'Dos')])
+    downloader = make_downloader()
+    retagged = []
+    downloader.add_metadata = lambda path, track: retagged.append((path, track.album))
+    tracks = [make_track('id1', 'Uno'), make_track('id2', 'Dos', album='Deluxe'), make_track('id3', 'Tres')]
+
+    pending = list(downloader.filter_incremental(
+        (make_job(downloader, track, tmp_path) for track in tracks), manifest))
+
+    assert [job['track'].track_id for job in pending] == ['id3']
+    assert retagged == [(str(tmp_path / 'id2.mp3'), 'Deluxe')]
+    assert manifest.tracks['id2']['tag_hash'] == main.SyncManifest.tag_hash(tracks[1])
+
+
+def test_prune_removes_tracks_no_longer_in_the_playlist(make_downloader, tmp_path):
+    manifest = saved_manifest(tmp_path, [make_track('id1', 'Uno'), make_track('id2', 'Dos')])
+    downloader = make_downloader()
+
+    list(downloader.filter_incremental([make_job(downloader, make_track('id1', 'Uno'), tmp_path)],
+                                       manifest, prune=True))
+
+    assert list(manifest.tracks) == ['id1']
+    assert not os.path.exists(tmp_path / 'id2.mp3')
@@ -0,0 +1,26 @@
+import os
+import time
+
+import main
+
+
+def test_streaming_and_pool_share_the_process_budget():
+    scheduler = main.TranscodeScheduler(processes=1)
+    try:
+        # Un FFmpeg en streaming ocupa el único proceso
+        with scheduler.slots:
+            future = scheduler.submit(os.getpid, label='job')
+            time.sleep(0.3)
+            assert not future.done()
+        assert future.result(timeout=30)
+    finally:
+        scheduler.close()
+
+
+def test_pipeline_transcode_workers_set_the_process_count(make_downloader):
+    downloader = make_downloader()
+
+    pipeline = main.PlaylistPipeline(downloader, workers={'transcode': 3})
+
+    assert downloader.transcoder.processes == 3
+    assert pipeline.workers['transcode'] == 6
@@ -0,0 +1,43 @@
+import sys
+import types
+
+import pytest
+
+import main
+
+
+class FakeYoutubeDL:
+    def __init__(self, params):
+        self.params = params
+        self.format_selector = self.build_format_selector(params.get('format'))
+    
+    @staticmethod
+    def build_format_selector(format_spec):
+        return ('selector', format_spec)
+
+
+@pytest.fixture
+def fake_youtube_dl(monkeypatch):
+    module = types.ModuleType('yt_dlp')
+    module.YoutubeDL = FakeYoutubeDL
+    monkeypatch.setitem(sys.modules, 'yt_dlp', module)
+
+
+def test_formats_reuse_the_profile_instance(fake_youtube_dl):
+    pool = main.YoutubeDLPool()
+    opts = {'quiet': True, 'format': 'bestaudio/best'}
+    
+    first = pool.get('sabr', opts, '/tmp/a.%(ext)s', format_spec='140')
+    second = pool.get('sabr', opts, '/tmp/b.%(ext)s', format_spec='251')
+    
+    assert first is second
+    assert pool.created == 1 and pool.reused == 1
+    assert second.params['format'] == '251'
+    assert second.format_selector == ('selector', '251')
+    assert second.params['outtmpl'] == {'default': '/tmp/b.%(ext)s'}
+
+
+def test_different_options_get_different_instances(fake_youtube_dl):
+    pool = main.YoutubeDLPool()
+    assert pool.get('sabr', {'proxy': 'a'}) is not pool.get('sabr', {'proxy': 'b'})
+    assert pool.get('search', {}) is not pool.get('sabr', {})